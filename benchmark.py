@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import gc
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+
+from multiprocessing import Process, Pipe
+
+import numpy as np
+import scipy
+
+from input_graph.load import load_bipartite
+from input_graph.generate import generate_ratings, write_ratings
+from pmhgraph.fold import prepare
+from measures.similarity import Similarity
+from lp.collaborative_filtering import *
+from lp.evaluation import *
+from main import coarse_graph, fold_sets, fold_graph
+
+# Bundled datasets of the benchmark.
+DATASETS = ['data/ratings_6.csv', 'data/ratings_13.csv', 'data/ratings_100000.csv']
+# Coarsening methods (0 - greed, 1 - random greed, 2 - parallel greed) and its codes.
+METHODS = {0: 'greedy', 1: 'randgreedy', 2: 'parallelgreedy'}
+# Sizes L of the precision and comparisons of the AUC, the ones of the paper.
+CUTOFFS = range(100, 10000, 200)
+
+
+# Resident memory of the process in MB, the current one and the peak since the last reset_peak.
+def memory():
+    try:
+        with open('/proc/self/status') as f:
+            status = dict(line.split(':', 1) for line in f if ':' in line)
+        return int(status['VmRSS'].split()[0]) / 1024.0, int(status['VmHWM'].split()[0]) / 1024.0
+    except (IOError, KeyError):
+        # Without /proc the peak is the one of the whole process (in KB on Linux).
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+        return peak, peak
+
+
+# Resets the peak resident memory of the process, when the system allows it.
+def reset_peak():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except IOError:
+        pass
+
+
+# Runs a stage in a child process, so the peak memory of the stage is measured alone. The function of
+# the stage returns a dict with the number of items it processed and its unit (and any other field).
+# Returns the record of the stage with its wall time, peak memory and throughput.
+def run_stage(record, function, *args):
+    receiver, sender = Pipe(False)
+
+    def target():
+        try:
+            gc.collect()
+            reset_peak()
+            start_memory = memory()[0]
+            start_time = time.time()
+            result = function(*args)
+            result['wall_time'] = time.time() - start_time
+            result['peak_memory_mb'] = memory()[1]
+            result['memory_increase_mb'] = max(result['peak_memory_mb'] - start_memory, 0.0)
+        except Exception as error:
+            result = {'error': repr(error)}
+        sender.send(result)
+
+    process = Process(target=target)
+    process.start()
+    result = receiver.recv()
+    process.join()
+    record = dict(record)
+    record.update(result)
+    if 'error' not in record:
+        record['throughput'] = record['items'] / record['wall_time'] if record['wall_time'] > 0 else None
+        print "%-24s %-28s %10.4f s %10.1f MB %14.1f %s/s" % (record['dataset'], record['stage'] + ' ' + ' '.join(map(str, record['parameters'].values())), record['wall_time'], record['peak_memory_mb'], record['throughput'] or 0.0, record['unit'])
+    else:
+        print "%-24s %-28s failed: %s" % (record['dataset'], record['stage'] + ' ' + ' '.join(map(str, record['parameters'].values())), record['error'])
+    return record
+
+
+def stage_load(path):
+    graph = load_bipartite(path)
+    return {'items': graph.ecount(), 'unit': 'edges'}
+
+
+# Coarsens the graph level by level. The time of every level is kept.
+def stage_coarsening(graph, method, max_levels, seed):
+    coarse = graph
+    levels = []
+    for level in range(1, max_levels + 1):
+        start_time = time.time()
+        coarse = coarse_graph(coarse, 'common_neighbors', level, method, [0.5] * graph['layers'], range(graph['layers']), seed=seed, in_process=method != 2)
+        levels.append({'level': level, 'vertices': coarse.vcount(), 'edges': coarse.ecount(), 'wall_time': time.time() - start_time})
+    return {'items': graph.vcount(), 'unit': 'vertices', 'levels': levels}
+
+
+# Calculates an index between every pair of users, by blocks of users.
+def stage_similarity(graph, index, block_size=1024):
+    similarity = Similarity(graph, graph['adjlist'])
+    users = np.flatnonzero(np.asarray(graph.vs['type']) == 0)
+    for start in xrange(0, len(users), block_size):
+        similarity.matrix(index, 0, users[start:start + block_size])
+    return {'items': len(users) ** 2, 'unit': 'pairs'}
+
+
+def stage_weighted_sum(graph):
+    ranking = collaborative_filtering_weighted_sum(Similarity(graph, graph['adjlist']), 'common_neighbors')
+    return {'items': len(ranking), 'unit': 'pairs'}
+
+
+def stage_projection(coarse, graph, scores):
+    rows, cols, values = ranking_arrays(coarse.projection(graph, scores))
+    return {'items': len(values), 'unit': 'pairs'}
+
+
+def stage_precision(scores, mask):
+    precision_at(scores, mask, CUTOFFS)
+    return {'items': len(scores), 'unit': 'pairs'}
+
+
+def stage_auc(scores, mask, seed):
+    sampled_auc_at(scores, mask, CUTOFFS, seed)
+    return {'items': max(CUTOFFS), 'unit': 'comparisons'}
+
+
+def stage_exact_auc(scores, mask):
+    exact_auc(scores, mask)
+    return {'items': len(scores), 'unit': 'pairs'}
+
+
+# Runs every stage on a rates file. Returns the records of the stages.
+def benchmark(path, name, options):
+    records = []
+    record = {'dataset': name}
+    records.append(run_stage(dict(record, stage='load', parameters={}), stage_load, path))
+    graph = prepare(load_bipartite(path))
+    record.update({'vertices': graph.vcount(), 'edges': graph.ecount()})
+    for method in options.methods:
+        records.append(run_stage(dict(record, stage='coarsening', parameters={'method': METHODS[method], 'levels': options.max_levels}), stage_coarsening, graph, method, options.max_levels, options.seed))
+    levels = []
+    coarse = coarse_graph(graph, 'common_neighbors', options.max_levels, 0, [0.5] * graph['layers'], range(graph['layers']), in_process=True, levels=levels)
+    # The within indices take the supervertices of the greedy coarsening as the communities.
+    graph.vs['membership'] = coarse.super_vertices(graph.vcount()).tolist()
+    for index in options.indices:
+        records.append(run_stage(dict(record, stage='similarity', parameters={'index': index}), stage_similarity, graph, index))
+    records.append(run_stage(dict(record, stage='weighted_sum', parameters={}), stage_weighted_sum, graph))
+    # The projection of each level of the greedy coarsening.
+    for coarse in levels:
+        scores = collaborative_filtering_matrix(Similarity(coarse, coarse['adjlist']), 'common_neighbors')[2]
+        records.append(run_stage(dict(record, stage='projection', parameters={'level': coarse['level']}), stage_projection, coarse, graph, scores))
+    # The metrics evaluate the ranking of the first fold.
+    probe_set = fold_sets(graph, min(10, graph.ecount()))[0]
+    fold = fold_graph(graph, probe_set)
+    rows, cols, scores = ranking_arrays(weighted_sum_blocks(Similarity(fold, fold['adjlist']), 'common_neighbors'))
+    mask = probe_mask(rows, cols, probe_set, fold.vcount())
+    records.append(run_stage(dict(record, stage='precision', parameters={}), stage_precision, scores, mask))
+    records.append(run_stage(dict(record, stage='auc', parameters={}), stage_auc, scores, mask, options.seed))
+    records.append(run_stage(dict(record, stage='exact_auc', parameters={}), stage_exact_auc, scores, mask))
+    return records
+
+
+# Commit of the working tree, when it is a git repository.
+def commit():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=devnull, cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    # Parse options command line
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--datasets', action='store', dest='datasets', nargs='*', help='[Rates files (default: the bundled datasets)]', type=str, default=DATASETS)
+    parser.add_argument('-sy', '--synthetic', action='append', dest='synthetic', nargs=3, type=int, metavar=('USERS', 'ITEMS', 'RATES'), help='[Synthetic power law rates of USERS x ITEMS with RATES rates, may be repeated]', default=[])
+    parser.add_argument('-m', '--ml', action='store', dest='max_levels', type=int, default=3, help='[Levels of the coarsening (default: 3)]')
+    parser.add_argument('-c', '--contract', action='store', dest='methods', type=int, nargs='+', choices=sorted(METHODS), default=sorted(METHODS), help='[Coarsening methods (default: 0 1 2)]')
+    parser.add_argument('-s', '--similarity', action='store', dest='indices', nargs='+', choices=Similarity.INDICES, default=list(Similarity.INDICES), help='[Similarity indices (default: all)]')
+    parser.add_argument('-sd', '--seed', action='store', dest='seed', type=int, default=0, help='[Seed of the synthetic rates, the random greed matching and the AUC (default: 0)]')
+    parser.add_argument('-o', '--output', action='store', dest='output', help='[Output JSON file (default: output/benchmark_<date>.json)]', type=str, default=None)
+    options = parser.parse_args()
+
+    if options.output is None:
+        if not os.path.exists('output'): os.makedirs('output')
+        options.output = time.strftime('output/benchmark_%Y%m%d-%H%M%S.json')
+
+    report = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': commit(), 'host': platform.node(),
+              'platform': platform.platform(), 'python': platform.python_version(), 'numpy': np.__version__,
+              'scipy': scipy.__version__, 'cpus': multiprocessing.cpu_count(), 'results': []}
+    for path in options.datasets:
+        report['results'] += benchmark(path, os.path.basename(path), options)
+    # The synthetic rates files are removed after its benchmark.
+    directory = tempfile.mkdtemp()
+    try:
+        for users, items, rates in options.synthetic:
+            path = os.path.join(directory, 'synthetic_%dx%dx%d.csv' % (users, items, rates))
+            write_ratings(path, *generate_ratings(users, items, float(rates) / (users * items), seed=options.seed))
+            report['results'] += benchmark(path, os.path.basename(path), options)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    with open(options.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2, sort_keys=True)
+    print "Results written to %s" % options.output
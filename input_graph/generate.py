@@ -0,0 +1,133 @@
+import argparse
+import numpy as np
+import pandas
+
+
+# Rates of the generated graphs and its probabilities, the distribution of the MovieLens-100k rates.
+RATES = (1.0, 2.0, 3.0, 4.0, 5.0)
+PROBABILITIES = (0.061, 0.114, 0.271, 0.342, 0.212)
+
+
+# Draws size ranks of n vertices whose degrees follow a power law of the exponent: the probability of
+# the rank r is about (r + 1) ** (-1 / (exponent - 1)). The ranks are drawn by the inverse of the
+# cumulative distribution of the continuous power law, so no search over the n vertices is needed.
+def power_law_ranks(n, exponent, size, generator):
+	if exponent <= 1:
+		raise ValueError('The exponent of the power law must be greater than 1.')
+	alpha = 1.0 / (exponent - 1.0)
+	uniform = generator.random_sample(size)
+	if alpha == 1.0:
+		values = (n + 1.0) ** uniform
+	else:
+		values = (1.0 + uniform * ((n + 1.0) ** (1.0 - alpha) - 1.0)) ** (1.0 / (1.0 - alpha))
+	return np.clip(values.astype(np.int64) - 1, 0, n - 1)
+
+
+# Draws size distinct (user, item) pairs, the users and the items by its power law ranks. The repeated
+# pairs are dropped and drawn again until there are size pairs, the exceeding ones are dropped at random.
+# Returns the ranks of the users and the items of the pairs, sorted by user and item.
+def power_law_pairs(users, items, size, user_exponent, item_exponent, generator, max_rounds=100):
+	keys = np.empty(0, dtype=np.int64)
+	# Fraction of the drawn pairs of the last round that were new.
+	accepted = 1.0
+	for _ in xrange(max_rounds):
+		missing = size - len(keys)
+		if missing <= 0:
+			break
+		# The pairs are over drawn by the fraction of repeated pairs of the last round.
+		draws = int(missing / max(accepted, 0.1) * 1.1) + 1
+		rows = power_law_ranks(users, user_exponent, draws, generator)
+		cols = power_law_ranks(items, item_exponent, draws, generator)
+		merged = np.unique(np.concatenate((keys, rows * items + cols)))
+		accepted = (len(merged) - len(keys)) / float(draws)
+		keys = merged
+	if len(keys) < size:
+		raise ValueError('The density is too high for the power law exponents.')
+	if len(keys) > size:
+		keep = np.ones(len(keys), dtype=bool)
+		keep[generator.permutation(len(keys))[size:]] = False
+		keys = keys[keep]
+	return keys // items, keys % items
+
+
+# Generates the rates of a power law bipartite graph of users x items, with a fraction density of the
+# pairs rated. The popular users and items get random IDs and the rates are drawn from rates by its
+# probabilities. Returns the user IDs, the item IDs and the rates, sorted by user and item like the
+# MovieLens files.
+def generate_ratings(users, items, density, user_exponent=2.5, item_exponent=2.1, rates=RATES, probabilities=PROBABILITIES, seed=None):
+	if not 0 < density <= 1:
+		raise ValueError('The density must be in (0, 1].')
+	generator = np.random.RandomState(seed)
+	size = max(int(round(density * users * items)), 1)
+	rows, cols = power_law_pairs(users, items, size, user_exponent, item_exponent, generator)
+	user_ids = generator.permutation(users)[rows]
+	item_ids = generator.permutation(items)[cols]
+	order = np.argsort(user_ids.astype(np.int64) * items + item_ids)
+	weights = np.asarray(rates, dtype=np.float64)[generator.choice(len(rates), size, p=np.asarray(probabilities) / np.sum(probabilities))]
+	return user_ids[order], item_ids[order], weights
+
+
+# Writes the rates in a rates file with the layout of the MovieLens files.
+def write_ratings(file, user_ids, item_ids, rates):
+	frame = pandas.DataFrame({'userId': user_ids, 'movieId': item_ids, 'rating': rates, 'timestamp': 0})
+	frame.to_csv(file, columns=['userId', 'movieId', 'rating', 'timestamp'], index=False, float_format='%.1f')
+
+
+# Dense IDs of the original IDs, in the order of their first appearance like DenseIds. Returns the dense
+# IDs and the original IDs ordered by the dense IDs.
+def dense_ids(ids):
+	ids = np.asarray(ids, dtype=np.int64)
+	if len(ids) == 0:
+		return ids, ids
+	starts = np.concatenate(([True], ids[1:] != ids[:-1]))
+	if (ids[1:] >= ids[:-1]).all():
+		# Sorted IDs appear in increasing order, one run after the other.
+		return np.cumsum(starts) - 1, ids[starts]
+	if ids.min() >= 0 and ids.max() < 4 * len(ids):
+		# Small non negative IDs are indexed by arrays, so the IDs are never sorted.
+		first = np.full(ids.max() + 1, len(ids), dtype=np.int64)
+		np.minimum.at(first, ids, np.arange(len(ids)))
+		originals = np.flatnonzero(first < len(ids))
+		originals = originals[np.argsort(first[originals])]
+		rank = np.empty(len(first), dtype=np.int64)
+		rank[originals] = np.arange(len(originals))
+		return rank[ids], originals
+	unique, first, inverse = np.unique(ids, return_index=True, return_inverse=True)
+	order = np.argsort(first)
+	rank = np.empty(len(unique), dtype=np.int64)
+	rank[order] = np.arange(len(unique))
+	return rank[inverse], unique[order]
+
+
+# Converts the rates to the arrays of a loaded rates file: the sizes of the groups, the edges, its
+# weights and the original IDs, the same arrays read by stream_bipartite from its rates file.
+def ratings_arrays(user_ids, item_ids, rates):
+	from_vertices, group1_ids = dense_ids(user_ids)
+	to_vertices, group2_ids = dense_ids(item_ids)
+	vertices = [len(group1_ids), len(group2_ids)]
+	edges = np.column_stack((from_vertices.astype(np.int32), to_vertices.astype(np.int32) + vertices[0]))
+	return vertices, edges, np.asarray(rates, dtype=np.float64), [group1_ids, group2_ids]
+
+
+# Generates a power law bipartite graph (see generate_ratings). Returns the arrays of a loaded rates
+# file, which build_bipartite turns in the graph.
+def generate_bipartite(users, items, density, user_exponent=2.5, item_exponent=2.1, rates=RATES, probabilities=PROBABILITIES, seed=None):
+	return ratings_arrays(*generate_ratings(users, items, density, user_exponent, item_exponent, rates, probabilities, seed))
+
+
+if __name__ == "__main__":
+	# Parse options command line
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-u', '--users', action='store', dest='users', help='[Number of users]', type=int, required=True)
+	parser.add_argument('-i', '--items', action='store', dest='items', help='[Number of items]', type=int, required=True)
+	parser.add_argument('-de', '--density', action='store', dest='density', help='[Fraction of the user x item pairs rated]', type=float, required=True)
+	parser.add_argument('-ue', '--userexponent', action='store', dest='user_exponent', help='[Power law exponent of the user degrees (default: 2.5)]', type=float, default=2.5)
+	parser.add_argument('-ie', '--itemexponent', action='store', dest='item_exponent', help='[Power law exponent of the item degrees (default: 2.1)]', type=float, default=2.1)
+	parser.add_argument('-ra', '--rates', action='store', dest='rates', help='[Rates (default: 1 2 3 4 5)]', type=float, nargs='+', default=list(RATES))
+	parser.add_argument('-p', '--probabilities', action='store', dest='probabilities', help='[Probabilities of the rates (default: the MovieLens-100k ones)]', type=float, nargs='+', default=list(PROBABILITIES))
+	parser.add_argument('-sd', '--seed', action='store', dest='seed', help='[Seed of the generator (default: None)]', type=int, default=None)
+	parser.add_argument('-o', '--output', action='store', dest='output', help='[Output rates file]', type=str, required=True)
+	options = parser.parse_args()
+	if len(options.rates) != len(options.probabilities):
+		parser.error("Sizes of input arguments -ra and -p do not match.")
+	write_ratings(options.output, *generate_ratings(options.users, options.items, options.density, options.user_exponent, options.item_exponent, options.rates, options.probabilities, options.seed))
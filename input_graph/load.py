@@ -4,13 +4,38 @@ from itertools import combinations, izip
 from multiprocessing import Manager, Process
 from random import choice, randint, sample, shuffle
 from pmhgraph.pmh import PMHGraph
+from pmhgraph.hierarchy import Hierarchy
 import numpy as np
 import csv
+import hashlib
+import pandas
+import os
+import shutil
+import tempfile
 from igraph import Graph
 
 
-# Loads the MovieLens rates file and convert as a bipartite graph file.
-def load_bipartite(file):
+# Loads the MovieLens rates file and convert as a bipartite graph file. If a cache directory is given,
+# the parsed arrays are stored in it and reused while the rates file does not change. If a chunk size
+# is given, the file is streamed in chunks of rows (see stream_bipartite).
+def load_bipartite(file, cache=None, chunk_size=None):
+	mode = 'csv' if chunk_size is None else 'stream'
+	arrays = None
+	if cache is not None:
+		arrays = load_cache(file, cache, mode)
+	if arrays is None:
+		if chunk_size is None:
+			arrays = read_bipartite(file)
+		else:
+			arrays = stream_bipartite(file, chunk_size)
+		if cache is not None:
+			save_cache(file, cache, arrays, mode)
+	return build_bipartite(*arrays)
+
+
+# Reads the MovieLens rates file. Returns the sizes of the groups, the edges, its weights and the
+# original IDs of the group 1 and group 2 vertices.
+def read_bipartite(file):
 	f = open(file, 'rt')
 	# Stores the edges between group 1 and 2.
 	dict_edges = {}
@@ -55,25 +80,166 @@ def load_bipartite(file):
 			dict_edges[(from_vertex, to_vertex)] = weight
 
 		edges, weights = izip(*dict_edges.items())
-		# Creates the graph.
-		graph = PMHGraph((group1_length + group2_length), list(edges))
-		# Add the edges weights to the es attr.
-		graph.es['weight'] = weights
-		# Add the edges weights to the es attr.
-		graph.vs['weight'] = 1
-		types = []
-		for i in range(len(vertices)):
-			types += [i] * vertices[i]
-		graph.vs['type'] = types
-		graph['adjlist'] = map(set, graph.get_adjlist())
-		graph['layers'] = len(vertices)
-		graph['vertices'] = vertices
-		graph['level'] = 0
-		graph['predecessors'] = {}
-		for i in range(graph.vcount()):
-			graph['predecessors'][i] = [i]
-		# Not allow direct graphs
-		if graph.is_directed(): graph.to_undirected(combine_edges=None)
 	finally:
 	    f.close()
+	# The original IDs ordered by the new IDs.
+	ids = [sorted(group_ids, key=group_ids.get) for group_ids in (group1_ids, group2_ids)]
+	return vertices, np.array(edges, dtype=np.int32), np.array(weights, dtype=np.float64), ids
+
+
+# Assigns dense IDs to the original IDs of a group, in the order of their first appearance.
+class DenseIds(object):
+
+	def __init__(self):
+		# The known original IDs, sorted, and the dense ID of each one.
+		self.keys = np.empty(0, dtype=np.int64)
+		self.values = np.empty(0, dtype=np.int64)
+
+	def __len__(self):
+		return len(self.keys)
+
+	def __call__(self, ids):
+		""" Returns the dense IDs of ids, assigning new IDs to the unknown ones """
+		unique, first = np.unique(ids, return_index=True)
+		position = np.searchsorted(self.keys, unique)
+		known = np.zeros(len(unique), dtype=bool)
+		inside = position < len(self.keys)
+		known[inside] = self.keys[position[inside]] == unique[inside]
+		if not known.all():
+			new, first = unique[~known], first[~known]
+			values = np.empty(len(new), dtype=np.int64)
+			values[np.argsort(first, kind='mergesort')] = len(self.keys) + np.arange(len(new))
+			keys = np.concatenate((self.keys, new))
+			order = np.argsort(keys, kind='mergesort')
+			self.keys = keys[order]
+			self.values = np.concatenate((self.values, values))[order]
+		return self.values[np.searchsorted(self.keys, ids)]
+
+	def originals(self):
+		""" The original IDs ordered by the dense IDs """
+		originals = np.empty(len(self.keys), dtype=np.int64)
+		originals[self.values] = self.keys
+		return originals
+
+
+# Typed array that grows by doubling its capacity.
+class GrowableArray(object):
+
+	def __init__(self, dtype, capacity=1024):
+		self.data = np.empty(capacity, dtype=dtype)
+		self.size = 0
+
+	def extend(self, values):
+		""" Appends the values in the end of the array """
+		if self.size + len(values) > len(self.data):
+			data = np.empty(max(2 * len(self.data), self.size + len(values)), dtype=self.data.dtype)
+			data[:self.size] = self.data[:self.size]
+			self.data = data
+		self.data[self.size:self.size + len(values)] = values
+		self.size += len(values)
+
+	def array(self):
+		""" The values of the array, without the spare capacity """
+		return self.data[:self.size]
+
+
+# Reads the MovieLens rates file in a single pass, parsing chunks of chunk_size rows at a time, so the
+# peak memory is bounded by the chunk size plus the edge arrays. Returns the same arrays of
+# read_bipartite, but the edges are kept in the order of the file instead of the dict order.
+def stream_bipartite(file, chunk_size=1000000):
+	group1_ids = DenseIds()
+	group2_ids = DenseIds()
+	from_vertices = GrowableArray(np.int32)
+	to_vertices = GrowableArray(np.int32)
+	weights = GrowableArray(np.float64)
+	# Hides the header from the reader.
+	reader = pandas.read_csv(file, header=None, skiprows=1, usecols=[0, 1, 2], chunksize=chunk_size, dtype={0: np.int64, 1: np.int64, 2: np.float64})
+	for chunk in reader:
+		from_vertices.extend(group1_ids(chunk[0].values))
+		to_vertices.extend(group2_ids(chunk[1].values))
+		weights.extend(chunk[2].values)
+	group1_length = len(group1_ids)
+	vertices = [group1_length, len(group2_ids)]
+	from_vertices, to_vertices, weights = from_vertices.array(), to_vertices.array(), weights.array()
+	# A repeated edge keeps the position of its first row and the weight of its last row.
+	keys = from_vertices.astype(np.int64) * max(vertices[1], 1) + to_vertices
+	order = np.argsort(keys, kind='mergesort')
+	keys = keys[order]
+	first = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1]))[:len(keys)])
+	last = np.concatenate((first[1:], [len(keys)])) - 1
+	rows, latest = order[first], order[last]
+	position = np.argsort(rows, kind='mergesort')
+	rows, latest = rows[position], latest[position]
+	edges = np.column_stack((from_vertices[rows], to_vertices[rows] + group1_length))
+	return vertices, edges, weights[latest], [group1_ids.originals(), group2_ids.originals()]
+
+
+# Creates the bipartite graph given the sizes of the groups, the edges, its weights and the original IDs.
+def build_bipartite(vertices, edges, weights, ids):
+	# Creates the graph.
+	graph = PMHGraph(sum(vertices), np.asarray(edges).tolist())
+	# Add the edges weights to the es attr.
+	graph.es['weight'] = np.asarray(weights).tolist()
+	graph.invalidate()
+	# Add the edges weights to the es attr.
+	graph.vs['weight'] = 1
+	types = []
+	for i in range(len(vertices)):
+		types += [i] * vertices[i]
+	graph.vs['type'] = types
+	graph['adjlist'] = map(set, graph.get_adjlist())
+	graph['layers'] = len(vertices)
+	graph['vertices'] = vertices
+	graph['ids'] = [list(group_ids) for group_ids in ids]
+	graph['level'] = 0
+	graph['hierarchy'] = Hierarchy(graph.vcount())
+	# Not allow direct graphs
+	if graph.is_directed(): graph.to_undirected(combine_edges=None)
 	return graph
+
+
+# Directory of the cache of a rates file, keyed by the path, the reading mode, the size and the
+# modification time, so the file is never read to find its cache.
+def cache_path(file, cache, mode):
+	stat = os.stat(file)
+	return os.path.join(cache, '%s%d-%d' % (cache_prefix(file, mode), stat.st_size, int(stat.st_mtime * 1000000)))
+
+
+# Prefix shared by all the cache entries of a rates file read by mode.
+def cache_prefix(file, mode):
+	path = os.path.abspath(file)
+	return '%s-%s-%s-' % (os.path.basename(path), mode, hashlib.sha1(path.encode('utf-8')).hexdigest()[:8])
+
+
+# Loads the memory mapped arrays of a rates file from the cache. Returns None if they are not cached.
+def load_cache(file, cache, mode='csv'):
+	path = cache_path(file, cache, mode)
+	if not os.path.isdir(path):
+		return None
+	vertices = np.load(os.path.join(path, 'vertices.npy')).tolist()
+	edges = np.load(os.path.join(path, 'edges.npy'), mmap_mode='r')
+	weights = np.load(os.path.join(path, 'weights.npy'), mmap_mode='r')
+	ids = [np.load(os.path.join(path, 'ids%d.npy' % layer), mmap_mode='r') for layer in range(len(vertices))]
+	return vertices, edges, weights, ids
+
+
+# Stores the arrays of a rates file in the cache, replacing the outdated entries of the same file.
+def save_cache(file, cache, arrays, mode='csv'):
+	vertices, edges, weights, ids = arrays
+	path = cache_path(file, cache, mode)
+	if not os.path.isdir(cache):
+		os.makedirs(cache)
+	temporary = tempfile.mkdtemp(dir=cache)
+	np.save(os.path.join(temporary, 'vertices.npy'), np.asarray(vertices, dtype=np.int64))
+	np.save(os.path.join(temporary, 'edges.npy'), np.asarray(edges, dtype=np.int32))
+	np.save(os.path.join(temporary, 'weights.npy'), np.asarray(weights, dtype=np.float64))
+	for layer, group_ids in enumerate(ids):
+		np.save(os.path.join(temporary, 'ids%d.npy' % layer), np.asarray(group_ids, dtype=np.int64))
+	for entry in os.listdir(cache):
+		if entry.startswith(cache_prefix(file, mode)):
+			shutil.rmtree(os.path.join(cache, entry), ignore_errors=True)
+	try:
+		os.rename(temporary, path)
+	except OSError:
+		# Another process stored the same entry first.
+		shutil.rmtree(temporary, ignore_errors=True)
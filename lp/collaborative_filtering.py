@@ -2,61 +2,172 @@
 # -*- coding: utf-8 -*-
 import igraph
 
+from itertools import izip
+
 from measures.similarity import *
 import numpy as np
+import scipy.sparse as sp
+
+
+# Builds the user x item matrices of the bipartite graph. Returns the ids of the type 1 (users) and
+# type 2 (items) vertices, the weighted CSR matrix R and the binary CSR matrix B.
+def bipartite_matrices(graph):
+    types = np.asarray(graph.vs["type"])
+    users = np.flatnonzero(types == 0)
+    items = np.flatnonzero(types != 0)
+    # The weights of the graph are cached by its indexes.
+    R = graph.weight_matrix()[users][:, items].tocsr()
+    B = R.copy()
+    B.data[:] = 1.0
+    return users, items, R, B
+
+
+# Builds the rows of the user x user similarity matrix for the users in block, computed in one batch
+# by the similarity object.
+def similarity_rows(similarity, index, users, block):
+    S = similarity.matrix(index, 0, users[block])
+    S = S.toarray() if sp.issparse(S) else np.array(S, dtype=np.float64)
+    # A user is not its own neighbor.
+    S[np.arange(len(block)), block] = 0.0
+    return S
+
+
+# Generator over blocks of users of the weighted sum scores. For each block yields the positions of
+# the users, the dense matrix of scores (S.R) / (S.B) and the mask of the already observed pairs.
+def weighted_sum_blocks(similarity, index, block_size=1024):
+    users, items, R, B = bipartite_matrices(similarity.graph)
+    RT = R.T.tocsr()
+    BT = B.T.tocsr()
+    for start in xrange(0, len(users), block_size):
+        block = np.arange(start, min(start + block_size, len(users)))
+        S = similarity_rows(similarity, index, users, block)
+        numerator = RT.dot(S.T).T
+        denominator = BT.dot(S.T).T
+        scores = np.zeros(numerator.shape, dtype=np.float64)
+        np.divide(numerator, denominator, out=scores, where=(denominator != 0))
+        observed = B[block].toarray() != 0
+        yield users, items, block, scores, observed
+
+
+# Selects the k greatest scores of every row of the block, ignoring the observed pairs. Returns the
+# rows, columns and values of the selected candidates.
+def top_k_per_row(scores, observed, k):
+    scores = np.where(observed, -np.inf, scores)
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    cols = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    rows = np.repeat(np.arange(scores.shape[0]), k)
+    cols = cols.ravel()
+    values = scores[rows, cols]
+    # Rows with less than k candidates are padded by observed pairs.
+    keep = values != -np.inf
+    return rows[keep], cols[keep], values[keep]
+
+
+# Merges the candidates of a block into the global top k selection. The selection is a tuple of
+# arrays (rows, cols, values) that never holds more than k candidates.
+def merge_top_k(selection, rows, cols, values, k):
+    rows = np.concatenate((selection[0], rows))
+    cols = np.concatenate((selection[1], cols))
+    values = np.concatenate((selection[2], values))
+    if len(values) > k:
+        keep = np.argpartition(-values, k - 1)[:k]
+        rows, cols, values = rows[keep], cols[keep], values[keep]
+    return rows, cols, values
+
+
+# Selects the candidates from the blocks of scores of a generator like weighted_sum_blocks. Every
+# unobserved pair is a candidate, unless k is given and only the k best candidates of each user (per_user)
+# or of the whole graph are kept. Returns the arrays of the users, the items (as 32 bits vertices, since
+# the ranking of every pair is the largest array of an evaluation) and the scores.
+def ranking_arrays(blocks, k=None, per_user=True):
+    selected = []
+    selection = (np.empty(0, dtype=np.int32),) * 2 + (np.empty(0),)
+    for users, items, block, scores, observed in blocks:
+        if k is None:
+            rows, cols = np.nonzero(~observed)
+            values = scores[rows, cols]
+        else:
+            rows, cols, values = top_k_per_row(scores, observed, k)
+        rows = users[block].astype(np.int32)[rows]
+        cols = items.astype(np.int32)[cols]
+        if k is None or per_user:
+            selected.append((rows, cols, values))
+        else:
+            selection = merge_top_k(selection, rows, cols, values, k)
+    if k is not None and not per_user:
+        selected.append(selection)
+    if len(selected) == 0:
+        return selection
+    return tuple(np.concatenate(arrays) for arrays in zip(*selected))
+
+
+# Passes through the blocks of scores of a generator like weighted_sum_blocks, storing in values the
+# score of each (user, item) pair of pairs when the block of its user is passed.
+def collect_pair_scores(blocks, pairs, values):
+    pairs = map(tuple, pairs)
+    pairs_array = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    for users, items, block, scores, observed in blocks:
+        if len(pairs) > 0:
+            n = max(users.max() if len(users) > 0 else 0, items.max() if len(items) > 0 else 0, pairs_array.max()) + 1
+            row = np.full(n, -1, dtype=np.int64)
+            row[users[block]] = np.arange(len(block))
+            col = np.full(n, -1, dtype=np.int64)
+            col[items] = np.arange(len(items))
+            # Orients every pair from the user to the item.
+            swap = col[pairs_array[:, 0]] >= 0
+            user = row[np.where(swap, pairs_array[:, 1], pairs_array[:, 0])]
+            item = col[np.where(swap, pairs_array[:, 0], pairs_array[:, 1])]
+            selected = np.flatnonzero((user >= 0) & (item >= 0))
+            values.update(izip([pairs[i] for i in selected.tolist()], scores[user[selected], item[selected]].tolist()))
+        yield users, items, block, scores, observed
+
+
+# Builds the ranking dict {(user, item): score} from the blocks of scores, as ranking_arrays.
+def ranking_from_blocks(blocks, k=None, per_user=True):
+    rows, cols, values = ranking_arrays(blocks, k, per_user)
+    return dict(izip(izip(rows.tolist(), cols.tolist()), values.tolist()))
 
 
 # Method for collaborative filtering. Passes the similarity object, a string that represents the index's
 # name. A ranking is built for the all the candidates.
 # The aggregate function is the second one in the Adomavicious paper.
-def collaborative_filtering_weighted_sum(similarity, index):
-    index = getattr(similarity, index)
-    graph = similarity.graph
-    vertices_type_1 = []
-    vertices_type_2 = []
-    # Separates the vertices by the type.
-    for i in graph.vs:
-        if(i["type"] == 0):
-            vertices_type_1.append(i.index)
-        else:
-            vertices_type_2.append(i.index)
-    # Calculates the similarities between all the type 1 vertices and puts in a dictionary structure for fast access.
-    similarities = {}
-    for i in range(len(vertices_type_1)):
-        j = i
-        while(j < len(vertices_type_1)):
-            if(i != j):
-                similarity = index(i, j)
-                similarities[(i, j)] = similarity
-                similarities[(j, i)] = similarity
-            j += 1
-    # Put the weights in a dictionary structure for fast access.
-    edges = {}
-    for edge in graph.es:
-        edges[(edge.source, edge.target)] = edge["weight"]
-    # Calculates the candidates for all the type 1 vertices.
-    candidates = {}
-    for i in vertices_type_1:
-        candidates[i] = []
-        # Calculates the score for every item and put in the ranking.
-        for j in vertices_type_2:
-            if(not ((i,j) in edges or (j,i) in edges)):
-                candidates[i].append(j)
-    ranking = {}
-    # Calculates the ranking for collaborative filtering.
-    for i in vertices_type_1:
-        for j in candidates[i]:
-            sum = 0
-            similarities_sum = 0
-            for k in graph['adjlist'][j]:
-                sum += (similarities[(i, k)] * (edges[(k, j)]))
-                similarities_sum = similarities_sum + similarities[(i, k)]
-            candidate = (i, j)
-            # Calculates the kappa value for this candidate.
-            kappa = 0
-            if(similarities_sum != 0):
-                kappa = (1 / similarities_sum)
-            value = kappa * sum
-            # Add the value and the candidate to the ranking.
-            ranking[candidate] = value
-    return ranking
+# If k is given only the k best candidates of each user (per_user) or of the whole graph are kept.
+def collaborative_filtering_weighted_sum(similarity, index, block_size=1024, k=None, per_user=True):
+    return ranking_from_blocks(weighted_sum_blocks(similarity, index, block_size), k, per_user)
+
+
+# Calculates the dense user x item matrix of the weighted sum scores, observed pairs included. Returns
+# the ids of the users, the ids of the items and the matrix.
+def collaborative_filtering_matrix(similarity, index, block_size=1024):
+    users, items, R, B = bipartite_matrices(similarity.graph)
+    matrix = np.zeros(R.shape, dtype=np.float64)
+    for _, _, block, scores, _ in weighted_sum_blocks(similarity, index, block_size):
+        matrix[block] = scores
+    return users, items, matrix
+
+
+# Calculates the weighted sum score of a list of (user, item) pairs without building the whole ranking.
+def collaborative_filtering_pair_scores(similarity, index, pairs):
+    users, items, R, B = bipartite_matrices(similarity.graph)
+    if len(pairs) == 0:
+        return {}
+    position = np.empty(similarity.graph.vcount(), dtype=np.int64)
+    position[users] = np.arange(len(users))
+    position[items] = np.arange(len(items))
+    pairs_array = np.asarray(pairs, dtype=np.int64)
+    # Orients every pair from the user to the item.
+    types = np.asarray(similarity.graph.vs["type"])
+    swap = types[pairs_array[:, 0]] != 0
+    user = position[np.where(swap, pairs_array[:, 1], pairs_array[:, 0])]
+    item = position[np.where(swap, pairs_array[:, 0], pairs_array[:, 1])]
+    block, inverse = np.unique(user, return_inverse=True)
+    S = similarity_rows(similarity, index, users, block)[inverse]
+    RT = R.T.tocsr()[item]
+    BT = B.T.tocsr()[item]
+    numerator = np.asarray(RT.multiply(S).sum(axis=1)).ravel()
+    denominator = np.asarray(BT.multiply(S).sum(axis=1)).ravel()
+    scores = np.zeros(len(pairs), dtype=np.float64)
+    np.divide(numerator, denominator, out=scores, where=(denominator != 0))
+    return dict(izip([tuple(pair) for pair in pairs], scores.tolist()))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+from scipy.stats import rankdata
+
+
+# Mask of the (rows, cols) pairs that are in the probe set, for a graph of n vertices. The pairs of the
+# probe set are oriented like the rows and the columns. The pairs are searched in the sorted keys of the
+# probes chunk_size pairs at a time, so no array of the size of the ranking is built but the mask.
+def probe_mask(rows, cols, probe_set, n, chunk_size=1 << 20):
+    probes = np.asarray(probe_set, dtype=np.int64).reshape(-1, 2)
+    probe_keys = np.unique(probes[:, 0] * n + probes[:, 1])
+    mask = np.zeros(len(rows), dtype=bool)
+    if len(probe_keys) == 0:
+        return mask
+    for start in xrange(0, len(rows), chunk_size):
+        keys = np.asarray(rows[start:start + chunk_size], dtype=np.int64) * n + cols[start:start + chunk_size]
+        positions = np.minimum(np.searchsorted(probe_keys, keys), len(probe_keys) - 1)
+        mask[start:start + chunk_size] = probe_keys[positions] == keys
+    return mask
+
+
+# Calculates the precision of a link predictor for every size L of the cutoffs. Needs the scores of the
+# ranking and the mask of its pairs that are in the probe set. The max(L) greatest scores are selected
+# and sorted once and the hits of every cutoff are read from its cumulative sum. A cutoff greater than
+# the ranking counts the missing predictions as misses. The cutoffs must be positive.
+def precision_at(scores, mask, cutoffs):
+    scores = np.asarray(scores, dtype=np.float64)
+    mask = np.asarray(mask, dtype=bool)
+    cutoffs = np.asarray(cutoffs, dtype=np.int64)
+    if (cutoffs <= 0).any():
+        raise ValueError('The sizes L of the precision must be positive.')
+    top = min(int(cutoffs.max()), len(scores)) if len(cutoffs) > 0 else 0
+    if top == 0:
+        return np.zeros(len(cutoffs))
+    best = np.argpartition(-scores, top - 1)[:top]
+    best = best[np.argsort(-scores[best], kind='mergesort')]
+    hits = np.concatenate(([0], np.cumsum(mask[best])))
+    return hits[np.minimum(cutoffs, top)] / cutoffs.astype(np.float64)
+
+
+# Calculates the AUC of a link predictor by comparisons between random probe and non probe scores. The
+# scores are drawn with replacement by a generator seeded by seed, so no list is shuffled.
+def sampled_auc(scores, mask, comparisons=1000, seed=None):
+    scores = np.asarray(scores, dtype=np.float64)
+    mask = np.asarray(mask, dtype=bool)
+    probes, others = scores[mask], scores[~mask]
+    if len(probes) == 0 or len(others) == 0 or comparisons == 0:
+        return 0.0
+    generator = np.random.RandomState(seed)
+    probe_values = probes[generator.randint(len(probes), size=comparisons)]
+    other_values = others[generator.randint(len(others), size=comparisons)]
+    return ((probe_values > other_values).sum() + 0.5 * (probe_values == other_values).sum()) / float(comparisons)
+
+
+# Calculates the exact AUC of a link predictor, the probability that a probe is scored over a non probe
+# (ties count a half), by the Mann-Whitney rank statistic of the probe scores.
+def exact_auc(scores, mask):
+    scores = np.asarray(scores, dtype=np.float64)
+    mask = np.asarray(mask, dtype=bool)
+    n_probes = mask.sum()
+    n_others = len(mask) - n_probes
+    if n_probes == 0 or n_others == 0:
+        return 0.0
+    ranks = rankdata(scores)
+    return (ranks[mask].sum() - n_probes * (n_probes + 1) / 2.0) / (float(n_probes) * n_others)
+
+
+# Calculates the AUC for every number of comparisons of the cutoffs from one shared pool of max(cutoffs)
+# comparisons, drawn as in sampled_auc. The AUC of a cutoff c is the mean of the first c comparisons.
+def sampled_auc_at(scores, mask, cutoffs, seed=None):
+    scores = np.asarray(scores, dtype=np.float64)
+    mask = np.asarray(mask, dtype=bool)
+    cutoffs = np.asarray(cutoffs, dtype=np.int64)
+    probes, others = scores[mask], scores[~mask]
+    if len(probes) == 0 or len(others) == 0 or len(cutoffs) == 0 or cutoffs.max() == 0:
+        return np.zeros(len(cutoffs))
+    comparisons = int(cutoffs.max())
+    generator = np.random.RandomState(seed)
+    probe_values = probes[generator.randint(len(probes), size=comparisons)]
+    other_values = others[generator.randint(len(others), size=comparisons)]
+    wins = np.concatenate(([0.0], np.cumsum((probe_values > other_values) + 0.5 * (probe_values == other_values))))
+    return wins[cutoffs] / np.maximum(cutoffs, 1)
+
+
+# Evaluates a ranking for all the cutoffs at once. The precisions are read from one cumulative hits
+# array and the AUCs from one shared pool of comparisons, or by the exact AUC when exact is set. Returns
+# the lists of the precision and the AUC values, in the order of the cutoffs.
+def evaluate_cutoffs(scores, mask, precisions, aucs, exact=False, seed=None, auc_scores=None, auc_mask=None):
+    precision_values = precision_at(scores, mask, precisions).tolist()
+    # The AUC may compare another pool of scores, like the probes against sampled candidates.
+    if auc_scores is None:
+        auc_scores, auc_mask = scores, mask
+    if exact:
+        auc_values = [exact_auc(auc_scores, auc_mask)] * len(aucs)
+    else:
+        auc_values = sampled_auc_at(auc_scores, auc_mask, aucs, seed).tolist()
+    return precision_values, auc_values
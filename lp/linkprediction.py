@@ -3,94 +3,96 @@
 import igraph
 
 from measures.similarity import *
-from measures.statistic import *
+from lp.collaborative_filtering import merge_top_k
 import numpy as np
 
+
+# Calculates the index for the (rows, cols) candidate pairs in one batch. The pairs of vertices of
+# different types have no common neighbors, so they are scored by the index between the row and the
+# neighbors of the col. Indices without a batch version are calculated pair by pair.
+def score_candidates(similarity, index, rows, cols):
+    if index in Similarity.INDICES:
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        types = np.asarray(similarity.graph.vs["type"])
+        cross = types[rows] != types[cols]
+        values = np.empty(len(rows), dtype=np.float64)
+        values[cross] = similarity.score_cross_pairs(index, rows[cross], cols[cross])
+        values[~cross] = similarity.score_pairs(index, rows[~cross], cols[~cross])
+        return values
+    index = getattr(similarity, index)
+    return np.array([index(i, j) for i, j in zip(np.asarray(rows).tolist(), np.asarray(cols).tolist())], dtype=np.float64)
+
+
+# Candidates of a node for link prediction: the vertices of the other types that are not its neighbors.
+def node_candidates(similarity, node):
+    types = np.asarray(similarity.graph.vs["type"])
+    adjacency = similarity.adjacency()
+    candidates = np.ones(len(types), dtype=bool)
+    candidates[types == types[node]] = False
+    candidates[adjacency.indices[adjacency.indptr[node]:adjacency.indptr[node + 1]]] = False
+    return np.flatnonzero(candidates)
+
+
+# Sorts the candidates by the decreasing values (ties by the increasing candidates) and keeps the k
+# first ones.
+def sort_top_k(values, candidates, k=None):
+    if k is not None and k < len(values):
+        keep = np.argpartition(-values, k - 1)[:k] if k > 0 else np.empty(0, dtype=np.int64)
+        values, candidates = values[keep], candidates[keep]
+    order = np.lexsort((candidates, -values))
+    return values[order], candidates[order]
+
+
 # Method for link prediction. Passes the similarity object, a string that represents the index's
-# name and the node that will receive the prediction. The most likely vertex has it's ID returned.
+# name and the node that will receive the prediction. The most likely vertex has it's ID returned, or
+# -1 if no candidate has a positive value.
 def predict_most_likely(similarity, index, node):
-    graph = similarity.graph
-    types = graph.vs["type"]
-    index = getattr(similarity, index)
-    nodes = range(graph.vcount())
-    nodes.remove(node)
-    # Get the candidates for link prediction.
-    candidates = [x for x in nodes if x not in graph.neighbors(node)]
-    greatest_value = 0
-    most_likely = -1
-    # Verifies for every candidate vertex which one that has the greates value for the index.
-    for vertex in candidates:
-        value = index(node, vertex)
-        if(value > greatest_value):
-            greatest_value = value
-            most_likely = vertex
-    print "Vertex:",most_likely, "Value:", greatest_value
-    return most_likely
+    ranking = predict_ranking_for_node(similarity, index, node, k=1)
+    if not ranking or ranking[0][0] <= 0:
+        return -1
+    return ranking[0][1]
+
 
 # Method for link prediction. Passes the similarity object, a string that represents the index's
-# name and the node that will receive the prediction. A ranking is built for the candidate vertices
-# for a node.
-def predict_ranking_for_node(similarity, index, node):
-    graph = similarity.graph
-    types = graph.vs["type"]
-    index = getattr(similarity, index)
-    nodes = range(graph.vcount())
-    nodes.remove(node)
-    # Get the candidates for link prediction.
-    candidates = [x for x in nodes if x not in graph.neighbors(node)]
-    # Ranking of predictions.
-    ranking = []
-    # Verifies for every candidate vertex which one that has the greates value for the index.
-    for vertex in candidates:
-        if(types[vertex] != types[node]):
-            value = index(node, vertex)
-            if(not ranking):
-                ranking.append((value, vertex))
-            else:
-                added = False
-                i = 0
-                while(not added):
-                    if (i >= len(ranking) or ranking[i][1] < value):
-                        ranking.insert(i, (value, vertex))
-                        added = True
-                    else:
-                        i = i + 1
-    return ranking
+# name and the node that will receive the prediction. A ranking of (value, vertex) is built for the
+# candidate vertices of the node, from the greatest value. If k is given only the k best are kept.
+def predict_ranking_for_node(similarity, index, node, k=None):
+    candidates = node_candidates(similarity, node)
+    values = score_candidates(similarity, index, np.repeat(node, len(candidates)), candidates)
+    values, candidates = sort_top_k(values, candidates, k)
+    return zip(values.tolist(), candidates.tolist())
+
 
 # Method for link prediction. Passes the similarity object, a string that represents the index's
-# name and the node that will receive the prediction. A ranking is built for the candidate edges.
-def predict_ranking(similarity, index):
-    graph = similarity.graph
-    index = getattr(similarity, index)
-    types = similarity.graph.vs["type"]
-    # Create the list of candidates edges.
-    candidates = []
-    # Ranking of predictions.
-    ranking = []
-    for i in range(graph.vcount()):
-        j = i
-        while j < graph.vcount():
-            if(j != i and (not ((i,j) in graph.get_edgelist())) and (not ((j,i) in graph.get_edgelist()))):
-                candidates.append((i, j))
-            j += 1
-    # Builds the list os candidate edges.
-    for candidate in candidates:
-        from_vertex = candidate[0]
-        to_vertex = candidate[1]
-        # Tests if the vertices are from different groups.
-        if(types[from_vertex] != types[to_vertex]):
-            # Calculates the score for the candidate edge.
-            value = index(from_vertex, to_vertex)
-            if(not ranking):
-                ranking.append((value, candidate))
-            else:
-                added = False
-                i = 0
-                while(not added):
-                    if (i >= len(ranking) or ranking[i][0] < value):
-                        added = True
-                        # Inserts the value in the rigth position.
-                        ranking.insert(i, (value, candidate))
-                    else:
-                        i = i + 1
-    return ranking
+# name. A ranking of (value, (i, j)) is built for the candidate edges, the pairs i < j of vertices of
+# different types that are not linked, from the greatest value. If k is given only the k best are
+# kept. The candidates are scored by blocks of block_size vertices (by default, as many as fit in
+# BLOCK_PAIRS pairs of the graph).
+def predict_ranking(similarity, index, k=None, block_size=None):
+    if k == 0:
+        return []
+    types = np.asarray(similarity.graph.vs["type"])
+    adjacency = similarity.adjacency()
+    n = len(types)
+    if block_size is None:
+        block_size = max(1, BLOCK_PAIRS // max(n, 1))
+    selected = []
+    selection = (np.empty(0, dtype=np.int64),) * 2 + (np.empty(0),)
+    for start in xrange(0, n, block_size):
+        block = np.arange(start, min(start + block_size, n))
+        candidates = (types[block][:, None] != types[None, :]) & (block[:, None] < np.arange(n)[None, :])
+        linked = adjacency[block].tocoo()
+        candidates[linked.row, linked.col] = False
+        rows, cols = np.nonzero(candidates)
+        rows = block[rows]
+        values = score_candidates(similarity, index, rows, cols)
+        if k is None:
+            selected.append((rows, cols, values))
+        else:
+            selection = merge_top_k(selection, rows, cols, values, k)
+    if k is not None:
+        selected.append(selection)
+    rows, cols, values = (np.concatenate(arrays) for arrays in zip(*selected)) if selected else selection
+    order = np.lexsort((cols, rows, -values))
+    return zip(values[order].tolist(), zip(rows[order].tolist(), cols[order].tolist()))
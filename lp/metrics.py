@@ -1,11 +1,5 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import igraph
-
-from optparse import OptionParser
-from pandas import DataFrame
-
-from pmhgraph.pmh import PMHGraph
 from measures.similarity import *
 import numpy as np
 import random
@@ -39,3 +33,17 @@ def AUC(probe_set, ranking, comparisons = 1000):
         elif(probe_value == ranking_value):
             n_lines += 1
     return ((n_line + 0.5 * n_lines) / comparisons)
+
+
+# Draws size random candidate edges between the type 1 and type 2 vertices. Candidates in the excluded
+# set (e.g. the edges of the graph and the probe set) are never drawn. The draws are reproducible when
+# a seed is given.
+def sample_candidates(vertices_type_1, vertices_type_2, excluded, size, seed=None):
+    size = min(size, len(vertices_type_1) * len(vertices_type_2) - len(excluded))
+    generator = random.Random(seed)
+    samples = set()
+    while len(samples) < size:
+        candidate = (generator.choice(vertices_type_1), generator.choice(vertices_type_2))
+        if not candidate in excluded:
+            samples.add(candidate)
+    return list(samples)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+
+from lp.collaborative_filtering import *
+import numpy as np
+
+
+# Normalizes the dense users x items matrix of the weighted sum scores of a (coarsened) graph by the
+# number of pairs between the original members of the supervertices. The super edges keep its own
+# weight, like the projection of the graph.
+def normalized_scores(graph, users, items, scores):
+    size = graph['hierarchy'].sizes().astype(np.float64)
+    weight = graph.weight_matrix()[users][:, items].tocoo()
+    normalized = np.array(scores, dtype=np.float64)
+    normalized[weight.row, weight.col] = weight.data
+    normalized /= np.outer(size[users], size[items])
+    return normalized
+
+
+# Generator over blocks of users of a graph (fine) of the scores uncoarsened from the normalized scores
+# of the next coarser graph (coarse). A pair has the score of its supervertices, except the edges of fine,
+# which keep its weight, and the refine best candidates of each user, which are ranked again by the index
+# on fine. Yields the blocks like weighted_sum_blocks.
+def uncoarsening_blocks(fine, coarse, coarse_scores, index, refine, block_size=1024):
+    users, items, R, B = bipartite_matrices(fine)
+    size = fine['hierarchy'].sizes().astype(np.float64)
+    similarity = Similarity(fine, fine['adjlist'])
+    # Position of the supervertex of each user and item of fine in the scores of coarse.
+    types = np.asarray(coarse.vs["type"])
+    position = np.empty(len(types), dtype=np.int64)
+    position[types == 0] = np.arange((types == 0).sum())
+    position[types != 0] = np.arange((types != 0).sum())
+    successor = coarse['hierarchy'].maps[-1]
+    super_users = position[successor[users]]
+    super_items = position[successor[items]]
+    blocks = [np.arange(start, min(start + block_size, len(users))) for start in xrange(0, len(users), block_size)]
+
+    def projected(block):
+        scores = coarse_scores[np.ix_(super_users[block], super_items)]
+        rates = R[block].tocoo()
+        scores[rates.row, rates.col] = rates.data / (size[users[block[rates.row]]] * size[items[rates.col]])
+        return scores, B[block].toarray() != 0
+
+    if refine > 0:
+        # The best candidates of all the users are ranked again by the exact index on fine, across the
+        # users. The projected scores of these candidates are given back in the order of the index, so the
+        # greatest score goes to the greatest index and the refined scores stay comparable to the others.
+        candidates, values, exact = [], [], []
+        for block in blocks:
+            rows, cols, block_values = top_k_per_row(*projected(block), k=refine)
+            candidates.append((rows, cols))
+            values.append(block_values)
+            exact.append(similarity.score_cross_pairs(index, users[block[rows]], items[cols]))
+        values, exact = np.concatenate(values), np.concatenate(exact)
+        refined = np.empty(len(values))
+        refined[np.argsort(-exact, kind='mergesort')] = np.sort(values)[::-1]
+        bounds = np.cumsum([0] + [len(rows) for rows, _ in candidates])
+    for i, block in enumerate(blocks):
+        scores, observed = projected(block)
+        if refine > 0:
+            rows, cols = candidates[i]
+            scores[rows, cols] = refined[bounds[i]:bounds[i + 1]]
+        yield users, items, block, scores, observed
+
+
+# Multilevel uncoarsening (V-cycle) of the weighted sum predictions. Needs the graph of every level, from
+# the original graph (graphs[0]) to the coarsest one, where the scores of all the pairs are computed.
+# The scores are uncoarsened one level at a time and the refine best candidates of each user are
+# ranked again at each level. Yields the blocks of the original graph like weighted_sum_blocks. If times is
+# a list, the (level, seconds) spent by each level is appended to it.
+def multilevel_blocks(graphs, index, refine=10, block_size=1024, times=None):
+    times = [] if times is None else times
+    start_time = time.time()
+    coarse = graphs[-1]
+    if len(graphs) == 1:
+        blocks = weighted_sum_blocks(Similarity(coarse, coarse['adjlist']), index, block_size)
+    else:
+        users, items, scores = collaborative_filtering_matrix(Similarity(coarse, coarse['adjlist']), index, block_size)
+        scores = normalized_scores(coarse, users, items, scores)
+        times.append((coarse['level'], time.time() - start_time))
+        for level in range(len(graphs) - 2, 0, -1):
+            start_time = time.time()
+            fine = graphs[level]
+            types = np.asarray(fine.vs["type"])
+            matrix = np.empty(((types == 0).sum(), (types != 0).sum()))
+            for _, _, block, block_scores, _ in uncoarsening_blocks(fine, graphs[level + 1], scores, index, refine, block_size):
+                matrix[block] = block_scores
+            scores = matrix
+            times.append((fine['level'], time.time() - start_time))
+        start_time = time.time()
+        blocks = uncoarsening_blocks(graphs[0], graphs[1], scores, index, refine, block_size)
+    # The time of the original level does not count the time spent by the consumer of the blocks.
+    elapsed = time.time() - start_time
+    start_time = time.time()
+    for block in blocks:
+        elapsed += time.time() - start_time
+        yield block
+        start_time = time.time()
+    times.append((graphs[0]['level'], elapsed + time.time() - start_time))
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import cPickle
+from collections import OrderedDict
+
+from lp.collaborative_filtering import *
+import numpy as np
+import scipy.sparse as sp
+
+
+# Model of the weighted sum collaborative filtering for online queries. It is built from a graph,
+# coarsened or not, and answers the best items of a user of the original graph (fine, the graph itself
+# when it is not coarsened). The similarity rows between the (super) users and the rates matrices are
+# computed once, so a query only multiplies the rows of its users. The results of the most recent
+# queries are kept in a LRU cache of cache_size entries.
+class Recommender(object):
+
+    def __init__(self, graph, index='common_neighbors', fine=None, cache_size=1024, block_size=1024):
+        # Only arrays are kept, so the model can be pickled without the graphs.
+        fine = graph if fine is None else fine
+        self.users, self.items, self.R, self.B = bipartite_matrices(graph)
+        # Rows of the user x user similarity matrix, without the similarity of a user to itself.
+        similarity = Similarity(graph, graph['adjlist'])
+        rows = [sp.csr_matrix(similarity_rows(similarity, index, self.users, np.arange(start, min(start + block_size, len(self.users)))))
+                for start in xrange(0, len(self.users), block_size)]
+        self.S = sp.vstack(rows).tocsr() if rows else sp.csr_matrix((0, 0))
+        # Position of the (super) vertex of each vertex of fine in the users or items of the graph.
+        position = np.empty(graph.vcount(), dtype=np.int64)
+        position[self.users] = np.arange(len(self.users))
+        position[self.items] = np.arange(len(self.items))
+        membership = graph.super_vertices(fine.vcount())
+        size = graph['hierarchy'].sizes().astype(np.float64)
+        self.user_size = size[self.users]
+        self.item_size = size[self.items]
+        types = np.asarray(fine.vs["type"])
+        self.types = types
+        self.fine_users = np.flatnonzero(types == 0)
+        self.fine_items = np.flatnonzero(types != 0)
+        self.user_position = position[membership]
+        self.item_position = position[membership[self.fine_items]]
+        self.observed = fine.adjacency_matrix()[:, self.fine_items].tocsr()
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    # Scores of the items of fine for a list of users of fine, as a dense users x items matrix. The
+    # super edges keep its weight and the scores are normalized by the number of pairs between the
+    # members of the supervertices, like the projection of the graph.
+    def scores(self, users):
+        positions = self.user_position[np.asarray(users, dtype=np.int64)]
+        S = self.S[positions]
+        numerator = S.dot(self.R).toarray()
+        denominator = S.dot(self.B).toarray()
+        scores = np.zeros(numerator.shape, dtype=np.float64)
+        np.divide(numerator, denominator, out=scores, where=(denominator != 0))
+        rates = self.R[positions]
+        rows = np.repeat(np.arange(len(positions)), np.diff(rates.indptr))
+        scores[rows, rates.indices] = rates.data
+        scores /= np.outer(self.user_size[positions], self.item_size)
+        return scores[:, self.item_position]
+
+    # Best n items of each user in users, computed in one batch. Returns a list of (item, score) lists,
+    # from the greatest score (ties by the item id), without the items already rated by the user.
+    def compute(self, users, n):
+        scores = self.scores(users)
+        observed = self.observed[np.asarray(users, dtype=np.int64)]
+        rows = np.repeat(np.arange(len(users)), np.diff(observed.indptr))
+        scores[rows, observed.indices] = -np.inf
+        results = []
+        for row in scores:
+            candidates = np.flatnonzero(row != -np.inf)
+            if n <= 0:
+                candidates = candidates[:0]
+            elif n < len(candidates):
+                # The n-th greatest score is found by a partition and its ties are taken by the item id.
+                values = row[candidates]
+                kth = -np.partition(-values, n - 1)[n - 1]
+                above = candidates[values > kth]
+                candidates = np.concatenate((above, candidates[values == kth][:n - len(above)]))
+            candidates = candidates[np.lexsort((candidates, -row[candidates]))]
+            results.append(zip(self.fine_items[candidates].tolist(), row[candidates].tolist()))
+        return results
+
+    # Best n items of a user, as a list of (item, score).
+    def recommend(self, user, n=10):
+        return self.recommend_many([user], n)[0]
+
+    # Best n items of each user in users. The users missing in the cache are computed in one batch.
+    def recommend_many(self, users, n=10):
+        results = {}
+        missing = []
+        for user in users:
+            if self.types[user] != 0:
+                raise ValueError('The vertex %d is not a user.' % user)
+            key = (user, n)
+            if key in self.cache:
+                # Moves the entry to the end of the cache, as the most recently used.
+                results[user] = self.cache[key] = self.cache.pop(key)
+            elif user not in results:
+                results[user] = None
+                missing.append(user)
+        if missing:
+            for user, result in zip(missing, self.compute(missing, n)):
+                results[user] = result
+                self.cache[(user, n)] = result
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return [results[user] for user in users]
+
+    # Saves the model in a file, without the cached results.
+    def save(self, path):
+        cache, self.cache = self.cache, OrderedDict()
+        try:
+            with open(path, 'wb') as f:
+                cPickle.dump(self, f, cPickle.HIGHEST_PROTOCOL)
+        finally:
+            self.cache = cache
+
+    # Loads a model saved in a file.
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            return cPickle.load(f)
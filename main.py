@@ -1,82 +1,282 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import os
 import time
+import random
 import sharedmem
-import igraph
 import argparse
 
-from itertools import izip, product
-from multiprocessing import Process, Manager, Pool, Pipe
-from optparse import OptionParser
+from multiprocessing import Process, Pool
 
-from pmhgraph.pmh import PMHGraph
+from pmhgraph.store import hierarchy_key, load_hierarchy, save_level, evict
+from pmhgraph.fold import FoldView, prepare
+from pmhgraph.shared import SharedGraph, share, release
 from measures.similarity import *
 from input_graph.load import load_bipartite
 from lp.collaborative_filtering import *
 from lp.metrics import *
+from lp.evaluation import *
+from lp.multilevel import multilevel_blocks
 import numpy as np
 
-import subprocess
-from subprocess import Popen, PIPE, STDOUT
-try:
-    from subprocess import DEVNULL # py3k
-except ImportError:
-    import os
-    DEVNULL = open(os.devnull, 'wb')
 
+# Runs a matching method and stores the number of merges it achieved.
+def run_matching(method, merges, position, args, kwargs):
+    merges[position] = method(*args, **kwargs)
 
-# Methods that coarses the graph.
-def coarse_graph(graph, similarity, max_levels, method_option, reduction_factor):
+# Runs the matching method of the given name over the graph attached from its shared arrays, so the
+# worker never touches (and copies) the Python objects of the graph of the parent.
+def run_shared_matching(descriptor, similarity, name, merges, position, args, kwargs):
+    graph = SharedGraph(descriptor)
+    graph['similarity'] = getattr(Similarity(graph, graph['adjlist']), similarity)
+    run_matching(getattr(graph, name), merges, position, args, kwargs)
+
+# Methods that coarses the graph. If levels is a list, the graph of every coarsened level is appended
+# to it.
+def coarse_graph(graph, similarity, max_levels, method_option, reduction_factor, layers, max_candidates=10, seed=None, workers=None, verbose=False, in_process=False, store=None, store_limit=None, levels=None):
+    # The hierarchy is only stored when its matchings are reproducible.
+    if method_option == 1 and seed is None:
+        store = None
+    if store is not None:
+        key = hierarchy_key(graph, similarity, method_option, list(reduction_factor), list(layers), max_candidates, seed)
+        stored = load_hierarchy(store, key)
+        first_level = graph['level']
     #### Coarsening ####
     while not graph['level'] == max_levels:
+        if store is not None and graph['level'] - first_level < len(stored):
+            # The level is rebuilt from its stored matching.
+            matching, merges = stored[graph['level'] - first_level]
+            coarser = graph.coarsening(matching)
+            coarser['merges'] = merges
+            coarser['worker_times'] = []
+            if verbose:
+                print "Level %d: rebuilt from the hierarchy store" % (coarser['level'])
+            graph = coarser
+            if levels is not None:
+                levels.append(graph)
+            continue
         # The common neighbors measure is used to contract the network.
         graph['similarity'] = getattr(Similarity(graph, graph['adjlist']), similarity)
         matching = sharedmem.full(graph.vcount(), range(graph.vcount()), dtype='int')
+        merges = sharedmem.full(len(layers), 0, dtype='int')
+        # Time spent by each worker of the parallel matching.
+        worker_times = []
         processes = []
         # Sets the method that will be used for creating the matching.
         method = None
+        kwargs = {}
         if(method_option == 0):
             method = graph.greed_two_hops
+            kwargs['max_candidates'] = max_candidates
         elif(method_option == 1):
             method = graph.greed_rand_two_hops
-        for layer in options.layers:
+        elif(method_option == 2):
+            method = graph.greed_parallel_two_hops
+        if method_option != 2 and not in_process:
+            # The workers of the layers attach to the arrays of the graph.
+            descriptor = share(graph)
+        for position, layer in enumerate(layers):
             start = sum(graph['vertices'][0:layer])
             end = sum(graph['vertices'][0:layer + 1])
-            processes.append(Process(target = method, args = (range(start, end), reduction_factor[layer], matching)))
+            if(method_option == 1):
+                # Each level and layer is shuffled by its own seed.
+                kwargs = {'seed': None if seed is None else seed + graph['level'] * graph['layers'] + layer}
+            if(method_option == 2):
+                # The layers are matched one after another, each by the whole pool of workers.
+                merges[position], times = method(range(start, end), reduction_factor[layer], matching, workers=workers)
+                worker_times += [(layer,) + time for time in times]
+            elif in_process:
+                # Inside a worker of the folds the layers are matched one after another.
+                run_matching(method, merges, position, (range(start, end), reduction_factor[layer], matching), kwargs)
+            else:
+                processes.append(Process(target = run_shared_matching, args = (descriptor, similarity, method.__name__, merges, position, (range(start, end), reduction_factor[layer], matching), kwargs)))
         for p in processes:
             p.start()
         for p in processes:
             p.join()
+        if method_option != 2 and not in_process:
+            release(descriptor)
         # Coarsening the graph.
         coarser = graph.coarsening(matching)
+        # Merges achieved and requested by each layer.
+        coarser['merges'] = [(layer, int(merges[position]), int(reduction_factor[layer] * graph.vcount())) for position, layer in enumerate(layers)]
+        coarser['worker_times'] = worker_times
+        if store is not None:
+            save_level(store, key, graph['level'] - first_level + 1, matching, coarser['merges'])
+        if verbose:
+            for layer, achieved, requested in coarser['merges']:
+                print "Level %d, layer %d: %d merges achieved of %d requested" % (coarser['level'], layer, achieved, requested)
+            for layer, pid, seconds, size in worker_times:
+                print "Level %d, layer %d: worker %d proposed for %d vertices in %f seconds" % (coarser['level'], layer, pid, size, seconds)
         graph = coarser
+        if levels is not None:
+            levels.append(graph)
+    if store is not None and store_limit is not None:
+        evict(store, store_limit)
     return graph
 
+# Splits the edges of the graph in the probe sets of the k folds.
+def fold_sets(graph, k):
+    size = graph.ecount() / k
+    edgelist = graph.get_edgelist()
+    return [edgelist[x: x + size] for x in range(0, len(edgelist), size)]
+
+# Training graph of a fold: a view of the graph without the edges of the probe set, which shares the
+# indexes of the graph instead of copying it.
+def fold_graph(graph, probe_set):
+    return FoldView(graph, probe_set)
+
+# Link prediction over the coarsened graph (coarse) of a fold (fold). The predictions are projected to
+# the pairs of the fold and evaluated on its probe set. Returns the precision values, the AUC values and
+# the time spent by the prediction. The AUC is exact when exact is set, otherwise it is sampled. If refine
+# is given, the predictions are uncoarsened level by level through the coarsened graphs of levels (from
+# the first coarsened level) and the refine best candidates of each user are ranked again at each level. The
+# (level, seconds) spent by each level of the uncoarsening is appended to times. The sampled candidates
+# and the sampled AUC are reproducible when a seed is given.
+def evaluate(fold, coarse, probe_set, similarity, precisions, aucs, topk=None, globaltopk=False, exact=False, levels=None, refine=None, times=None, seed=None):
+    if topk is not None:
+        # The ranking only holds the best candidates, so the AUC compares the probes against a
+        # random sample of all the candidates.
+        types = np.asarray(fold.vs["type"])
+        vertices_type_1 = np.flatnonzero(types == 0).tolist()
+        vertices_type_2 = np.flatnonzero(types != 0).tolist()
+        # The edges of the fold and its probes are the edges of the whole graph.
+        samples = sample_candidates(vertices_type_1, vertices_type_2, fold.base.edge_set(), max(aucs), seed)
+    start_time = time.time()
+    # Local Search (Link prediction)
+    Sim = Similarity(coarse, coarse['adjlist'])
+    if coarse['level'] == 0:
+        # Without coarsening the collaborative filtering ranks the pairs of the fold by itself.
+        blocks = weighted_sum_blocks(Sim, similarity)
+    elif refine is not None:
+        # Predictions of the coarsest level, refined at each level of the uncoarsening.
+        blocks = multilevel_blocks([fold] + levels, similarity, refine, times=times)
+        if topk is not None:
+            # The scores of the probes and the samples are kept while the blocks are ranked.
+            pair_values = {}
+            blocks = collect_pair_scores(blocks, list(probe_set) + samples, pair_values)
+    else:
+        # Predictions between the supervertices, projected to the pairs of the original graph.
+        super_users, super_items, super_scores = collaborative_filtering_matrix(Sim, similarity)
+        blocks = coarse.projection(fold, super_scores)
+    rows, cols, scores = ranking_arrays(blocks, topk, not globaltopk)
+    elapsed_time = time.time() - start_time
+    mask = probe_mask(rows, cols, probe_set, fold.vcount())
+    auc_scores, auc_mask = None, None
+    if topk is not None:
+        if coarse['level'] == 0:
+            probes = collaborative_filtering_pair_scores(Sim, similarity, probe_set)
+            ranking = collaborative_filtering_pair_scores(Sim, similarity, samples)
+        elif refine is not None:
+            probes = dict((pair, pair_values[pair]) for pair in map(tuple, probe_set))
+            ranking = dict((pair, pair_values[pair]) for pair in map(tuple, samples))
+        else:
+            probes = coarse.projection_pairs(fold, super_scores, probe_set)
+            ranking = coarse.projection_pairs(fold, super_scores, samples)
+        auc_scores = np.array(probes.values() + ranking.values())
+        auc_mask = np.arange(len(auc_scores)) < len(probes)
+
+    # Calculates the precision and the AUC values for all the parameters at once.
+    precision_values, auc_values = evaluate_cutoffs(scores, mask, precisions, aucs, exact, seed, auc_scores=auc_scores, auc_mask=auc_mask)
+    return precision_values, auc_values, elapsed_time
+
+# Writes the header of an output file.
+def write_header(output_file, precisions, aucs):
+    for par in precisions:
+        output_file.write("%s," % ("pr" + str(par)))
+    for par in aucs:
+        output_file.write("%s," % ("AUC" + str(par)))
+    output_file.write("%s\n" % ("time"))
+
+# Writes the results of a fold in an output file.
+def write_row(output_file, precision_values, auc_values, elapsed_time):
+    for pr in precision_values:
+        output_file.write("%f," % (pr))
+    for auc in auc_values:
+        output_file.write("%f," % (auc))
+    # Prints the elapsed time in the file.
+    output_file.write("%f\n" % (elapsed_time))
+
+# Type of the options that must be positive integers, like the cutoffs of the precision and the AUC.
+def positive_int(value):
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError("%s is not a positive integer" % value)
+    return number
+
+# Argparse type of the options where 0 turns the option off.
+def non_negative_int(value):
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError("%s is not a non negative integer" % value)
+    return number
+
+# State of the cross validation, shared with the workers of the folds by fork.
+_folds = {}
+
+# Initializer of the workers of the folds. The base graph is attached from its shared arrays, so the
+# workers never touch (and copy) the Python objects of the graph of the parent.
+def attach_folds(descriptor):
+    random.seed()
+    _folds['graph'] = SharedGraph(descriptor)
+
+# Runs the i-th fold of the cross validation over the base graph. Returns the precision values, the AUC
+# values and the elapsed time of the fold.
+def run_fold(i):
+    options = _folds['options']
+    probe_set = _folds['sets'][i]
+    fold = fold_graph(_folds['graph'], probe_set)
+    # Starts the time counter.
+    start_time = time.time()
+    # Coarsening of the graph. The fold graph and the graph of each level are kept for the uncoarsening.
+    levels = []
+    coarse = coarse_graph(fold, _folds['contract'][options.contractmethod], options.max_levels, options.contract, options.reduction_factor, options.layers, options.max_candidates, options.seed, options.workers, options.verbose, _folds['in_process'], options.store, options.store_limit, levels)
+    coarsening_time = time.time() - start_time
+    times = []
+    precision_values, auc_values, prediction_time = evaluate(fold, coarse, probe_set, _folds['similarity'][options.similarity], _folds['precisions'], _folds['aucs'], options.topk, options.globaltopk, options.exact_auc, levels, options.refine, times, options.seed)
+    if options.verbose:
+        for level, seconds in times:
+            print "Fold %d, level %d: uncoarsened in %f seconds" % (i, level, seconds)
+    # The elapsed time of the fold does not count the evaluation of the ranking.
+    return precision_values, auc_values, coarsening_time + prediction_time
+
 if __name__ == "__main__":
     # Parse options command line
     parser = argparse.ArgumentParser()
     usage = 'usage: python %prog [options] args ...'
     parser.add_argument('-f', '--filename', action='store', dest='filename', help='[Bipartite Graph]', type=str)
+    parser.add_argument('-ca', '--cache', action='store', dest='cache', help='[Cache directory of the loaded graphs (default: None)]', type=str, default=None)
+    parser.add_argument('-cs', '--chunksize', action='store', dest='chunk_size', help='[Streams the bipartite graph in chunks of rows (default: None)]', type=int, default=None)
     parser.add_argument('-o', '--output', action='store', dest='output', help='[Output]', type=str)
     parser.add_argument('-r', '--rf', action='store', dest='reduction_factor', type=float, nargs='+', help='[Reduction factor for each layer (default: None)]')
     parser.add_argument('-m', '--ml', action="store", dest='max_levels', type=int, default=1, help='[Max levels (default: 1)]')
-    parser.add_argument('-c', '--contract', action="store", dest='contract', type=int, default=0, help='[Coarsening method (default: 0) (0 - greed, 1 - random greed)]')
+    parser.add_argument('-c', '--contract', action="store", dest='contract', type=int, default=0, help='[Coarsening method (default: 0) (0 - greed, 1 - random greed, 2 - parallel greed)]')
     parser.add_argument('-cm', '--contractmethod', action="store", dest='contractmethod', type=int, default=0, help='[Similarity method for coarsening (default: 0)]')
     parser.add_argument('-s', '--similarity', action="store", dest='similarity', type=int, default=0, help='[Similarity method (default: 0)]')
     parser.add_argument('-i', '--ms', action="store", dest='min_size', type=float, default=3, help='[Minimum size of the communities (default: 3)]')
     parser.add_argument('-t', '--threshold', action="store", dest='threshold', type=float, default=0.5, help='[Cutting the dendrogram at threshold (default: 0.5)]')
     parser.add_argument('-ls', '--layers', action="store", dest='layers', type=str, help='<Required> Set flag', default=None)
+    parser.add_argument('-mc', '--maxcandidates', action="store", dest='max_candidates', type=non_negative_int, default=10, help='[Best two-hops candidates kept for each vertex by the greed matching, 0 keeps all of them (default: 10)]')
+    parser.add_argument('-sd', '--seed', action="store", dest='seed', type=int, default=None, help='[Seed of the random greed matching, the sampled candidates and the sampled AUC (default: None)]')
+    parser.add_argument('-w', '--workers', action="store", dest='workers', type=int, default=None, help='[Workers of the parallel greed matching (default: number of cores)]')
+    parser.add_argument('-fw', '--foldworkers', action="store", dest='fold_workers', type=int, default=1, help='[Workers that run the folds of the cross validation in parallel (default: 1)]')
+    parser.add_argument('-pr', '--precisions', action="store", dest='precisions', type=positive_int, nargs=3, default=[1, 2, 1], help='[Range (from, to, step) of the sizes L of the precision (default: 1 2 1)]')
+    parser.add_argument('-au', '--aucs', action="store", dest='aucs', type=positive_int, nargs=3, default=[1, 2, 1], help='[Range (from, to, step) of the comparisons of the AUC (default: 1 2 1)]')
+    parser.add_argument('-ea', '--exactauc', action="store_true", dest='exact_auc', default=False, help='[Calculates the exact AUC by the ranks of the scores instead of sampled comparisons]')
+    parser.add_argument('-hs', '--hierarchystore', action='store', dest='store', help='[Directory where the coarsening hierarchies are stored (default: None)]', type=str, default=None)
+    parser.add_argument('-hl', '--hierarchylimit', action='store', dest='store_limit', help='[Size limit of the hierarchy store in MB (default: 1024)]', type=float, default=1024)
+    parser.add_argument('-rc', '--refine', action="store", dest='refine', type=int, default=None, help='[Uncoarsens the predictions level by level, re-ranking the best candidates of all the users by the similarity index at each level (default: None)]')
+    parser.add_argument('-v', '--verbose', action="store_true", dest='verbose', default=False, help='[Prints the merges achieved by each level]')
+    parser.add_argument('-k', '--topk', action="store", dest='topk', type=int, default=None, help='[Keeps only the k best candidates of each user (default: None)]')
+    parser.add_argument('-kg', '--globaltopk', action="store_true", dest='globaltopk', default=False, help='[The k best candidates are kept for the whole graph instead of each user]')
 
     options = parser.parse_args()
     # Open a output file.
     file = options.output
     output_file = open(file, 'w')
-    from_auc = 1
-    to_auc = 2
-    step_auc = 1
-    from_pr = 1
-    to_pr = 2
-    step_pr = 1
+    from_pr, to_pr, step_pr = options.precisions
+    from_auc, to_auc, step_auc = options.aucs
+    # The results of the paper use:
     # from_auc = 100
     # to_auc = 10000
     # step_auc = 200
@@ -85,19 +285,14 @@ if __name__ == "__main__":
     # step_pr = 200
 
     # Open the output file and writes the headers.
-    for par in range(from_pr, to_pr, step_pr):
-        output_file.write("%s," % ("pr" + str(par)))
-    for par in range(from_auc, to_auc, step_auc):
-        output_file.write("%s," % ("AUC" + str(par)))
-
-    output_file.write("%s\n" % ("time"))
+    write_header(output_file, range(from_pr, to_pr, step_pr), range(from_auc, to_auc, step_auc))
 
     # Read and pre-process
     if options.filename is None:
         parser.error("required -f [filename] arg.")
     else:
         # Loads the bipartite graph
-        graph = load_bipartite(options.filename)
+        graph = load_bipartite(options.filename, options.cache, options.chunk_size)
 
     if options.reduction_factor is None:
         # Sets the reduction factor parameter.
@@ -124,6 +319,18 @@ if __name__ == "__main__":
             layers.append(int(layer))
         options.layers = layers
 
+    if len(range(from_pr, to_pr, step_pr)) == 0 or len(range(from_auc, to_auc, step_auc)) == 0:
+        parser.error("The ranges of -pr and -au must not be empty.")
+
+    if options.topk is not None and options.globaltopk and options.topk < max(range(from_pr, to_pr, step_pr)):
+        parser.error("The global top -k must be at least the greatest precision size.")
+
+    # The size limit of the hierarchy store is given in MB.
+    options.store_limit = int(options.store_limit * 1024 * 1024)
+
+    if options.fold_workers > 1 and options.contract == 2:
+        parser.error("The parallel greed matching can not run inside the workers of the folds.")
+
     # The similarity functions that will be used for coarserning the graph.
     contract = ['common_neighbors']
     # The similarity functions that will be used for link prediction.
@@ -132,102 +339,26 @@ if __name__ == "__main__":
     # k-fold cross validation parameter.
     k = 10
 
-    n_edges = graph.ecount()
-    size = graph.ecount() / k
-    sets = [graph.get_edgelist()[x: x + size] for x in range(0, len(graph.get_edgelist()), size)]
-
-    for i in range(k):
-        # Creates a safe copy of the graph.
-        graph_copy = graph.copy()
-        # Selects the current probe set.
-        probe_set = sets[i]
-        # Delete the edges of graph.
-        graph_copy.delete_edges(probe_set)
-        graph_copy['adjlist'] = map(set, graph_copy.get_adjlist())
-
-        # Starts the time counter.
-        start_time = time.time()
-
-        # Put the weights in a dictionary structure for fast access.
-        edges = {}
-        for edge in graph_copy.es:
-            edges[(edge.source, edge.target)] = edge["weight"]
-
-        vertices_type_1 = []
-        vertices_type_2 = []
-        # Separates the vertices by the types.
-        for i in graph_copy.vs:
-            if(i["type"] == 0):
-                vertices_type_1.append(i.index)
-            else:
-                vertices_type_2.append(i.index)
-
-        # Coarsening of the graph.
-        graph_copy = coarse_graph(graph_copy, contract[options.contractmethod], options.max_levels, options.contract, options.reduction_factor)
-
-        # Put the weights in a dictionary structure for fast access.
-        super_edges = {}
-        for edge in graph_copy.es:
-            super_edges[(edge.source, edge.target)] = edge["weight"]
-
-        # Local Search (Link prediction)
-        Sim = Similarity(graph_copy, graph_copy['adjlist'])
-        super_ranking = collaborative_filtering_weighted_sum(Sim, similarity[options.similarity])
-        # Creates the real ranking os predictions.
-        i = 0
-        while(graph_copy.vs["type"][i] != 1):
-            i += 1
-        change = i
-        i = 0
-        ranking = {}
-        while(i < change):
-                j = change
-                while(j < graph_copy.vcount()):
-                    weight = -1
-                    # Tests if the edge between the supervertices is a super edge.
-                    if (i,j) in super_edges:
-                        weight = super_edges[(i, j)]
-                    # Tests if the edge between the supervertices is in the predicted ranking.
-                    else:
-                        weight = super_ranking[(i,j)]
-                    # Adjust the edges weights.
-                    n_edges = len(graph_copy['predecessors'][i]) * len(graph_copy['predecessors'][j])
-                    # For each vertex in the supervertices, a edge is created.
-                    for vertex_1 in graph_copy['predecessors'][i]:
-                        for vertex_2 in graph_copy['predecessors'][j]:
-                            # Tests if the edge already exists.
-                            if not (vertex_1, vertex_2) in edges:
-                                # The total weight is normalized by the number of edges.
-                                ranking[(vertex_1, vertex_2)] = (weight / n_edges)
-                    j += 1
-                i += 1
-        # Finishes the counter and print the result.
-        elapsed_time = time.time() - start_time
-        # Sorts the ranking for extracting the precision values.
-        ranking_keys = sorted(ranking.items(), key = operator.itemgetter(1))
-        # Calculates and prints the precisions in the file.
-        for par in range(from_pr, to_pr, step_pr):
-            # Calculates the precision value for the parameters.
-            pr = precision(probe_set, ranking_keys, par)
-            output_file.write("%f," % (pr))
-
-        # Put the probe values in a dict for fast access.
-        probes = {}
-        for probe in probe_set:
-            probes[probe] = ranking[probe]
-            # Removes the probes from the ranking.
-            del ranking[probe]
-
-        # Calculates and prints the precisions in the file.
-        for par in range(from_auc, to_auc, step_auc):
-            # Calculates the AUC value for the parameters.
-            auc = AUC(probes, ranking, par)
-            output_file.write("%f," % (auc))
-
-        # #Re-adds the deleted probe values to the ranking.
-        # for probe in probe_set:
-        #     ranking[probe] = probes[probe]
-        # Prints the elapsed time in the file.
-        output_file.write("%f\n" % (elapsed_time))
+    sets = fold_sets(graph, k)
+
+    # The folds are shared with the workers by fork.
+    _folds.update({'sets': sets, 'options': options, 'contract': contract, 'similarity': similarity,
+                   'precisions': range(from_pr, to_pr, step_pr), 'aucs': range(from_auc, to_auc, step_auc),
+                   'in_process': options.fold_workers > 1})
+    if options.fold_workers > 1:
+        # The workers attach to the arrays of the base graph and every worker draws its own random samples.
+        descriptor = share(graph)
+        pool = Pool(options.fold_workers, initializer=attach_folds, initargs=(descriptor,))
+        results = pool.imap(run_fold, range(k))
+    else:
+        _folds['graph'] = prepare(graph)
+        results = (run_fold(i) for i in range(k))
+    # The results are written in the order of the folds.
+    for precision_values, auc_values, elapsed_time in results:
+        write_row(output_file, precision_values, auc_values, elapsed_time)
+    if options.fold_workers > 1:
+        pool.close()
+        pool.join()
+        release(descriptor)
 
     output_file.close()
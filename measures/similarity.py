@@ -14,24 +14,237 @@ that every vertex is linked to itself.
 """
 
 import math
+from itertools import chain
+
+import numpy as np
+import scipy.sparse as sp
 
 __author__ = 'Alan Valejo'
 __license__ = 'MIT'
 __docformat__ = 'restructuredtext en'
 __version__ = '0.1'
 
+# Pairs of a dense block of scores. The blocks of vertices are sized by the
+# number of vertices of the graph, so a block never grows with the graph.
+BLOCK_PAIRS = 1 << 22
+
 class Similarity(object):
 
 	graph, adjlist = (None,) * 2
 
+	# Indices computed by score_pairs and matrix.
+	INDICES = ('preferential_attachment', 'common_neighbors', 'weighted_common_neighbors', 'jaccard_index',
+		'salton_index', 'adamic_adar', 'resource_allocation', 'sorensen_index', 'hub_promoted', 'hub_depressed',
+		'leicht_holme_newman', 'within_common_neighbors', 'within_jaccard', 'within_salton', 'within_adamic_adar',
+		'within_resource_allocation', 'within_sorensen', 'within_hub_promoted', 'within_hub_depressed',
+		'within_leicht_holme_newman', 'wic')
+
 	def __init__(self, graph, adjlist):
 		self.graph = graph
 		self.adjlist = adjlist
+		self._adjacency, self._weights, self._degrees = (None,) * 3
+		self._layers = {}
+
+	def adjacency(self):
+		""" CSR adjacency matrix, cached by the graph when it provides one """
+		if hasattr(self.graph, 'adjacency_matrix'):
+			return self.graph.adjacency_matrix()
+		if self._adjacency is None:
+			n = len(self.adjlist)
+			indptr = np.concatenate(([0], np.cumsum([len(neighbors) for neighbors in self.adjlist]))).astype(np.int64)
+			indices = np.fromiter(chain.from_iterable(sorted(neighbors) for neighbors in self.adjlist), dtype=np.int64, count=indptr[-1])
+			self._adjacency = sp.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(n, n))
+		return self._adjacency
+
+	def layer_adjacency(self, layer):
+		"""
+		Vertices of a layer and the transposed adjacency of its rows (all the
+		vertices x the vertices of the layer), cached by layer
+		"""
+		if layer not in self._layers:
+			vertices = np.flatnonzero(np.asarray(self.graph.vs['type']) == layer)
+			self._layers[layer] = (vertices, self.adjacency()[vertices].T.tocsr())
+		return self._layers[layer]
+
+	def weights(self):
+		""" CSR matrix of the edges weights, cached by the graph when it provides one """
+		if hasattr(self.graph, 'weight_matrix'):
+			return self.graph.weight_matrix()
+		if self._weights is None:
+			n = self.graph.vcount()
+			edges = np.asarray(self.graph.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+			weights = np.asarray(self.graph.es['weight'] if self.graph.ecount() > 0 else [], dtype=np.float64)
+			rows = np.concatenate((edges[:, 0], edges[:, 1]))
+			cols = np.concatenate((edges[:, 1], edges[:, 0]))
+			self._weights = sp.csr_matrix((np.concatenate((weights, weights)), (rows, cols)), shape=(n, n))
+		return self._weights
+
+	def degrees(self):
+		""" Degree of each vertex, cached by the graph when it provides one """
+		if hasattr(self.graph, 'degrees'):
+			return self.graph.degrees()
+		if self._degrees is None:
+			self._degrees = np.asarray(self.graph.degree(), dtype=np.float64)
+		return self._degrees
+
+	def degree(self, i):
+		""" Degree of the vertex i """
+		return self.degrees()[i]
+
+	def weight(self, i, j):
+		""" Weight of the edge between i and j """
+		if hasattr(self.graph, 'weight_lookup'):
+			return self.graph.weight_lookup()[i].get(j, 0)
+		return self.graph[i, j]
+
+	def _factors(self, index):
+		""" Contribution of each vertex to the index when it is a common neighbor """
+		degree = self.degrees()
+		factors = np.zeros(len(degree))
+		if index.endswith('adamic_adar'):
+			valid = degree > 1
+			factors[valid] = 1.0 / np.log(degree[valid])
+		elif index.endswith('resource_allocation'):
+			valid = degree > 0
+			factors[valid] = 1.0 / degree[valid]
+		else:
+			factors[:] = 1.0
+		return factors
+
+	def _within(self, adjacency, vertices):
+		""" Keeps in the rows of vertices only the neighbors in the same cluster of the vertex """
+		membership = np.asarray(self.graph.vs['membership'])
+		adjacency = adjacency.tocsr(copy=True)
+		rows = np.repeat(vertices, np.diff(adjacency.indptr))
+		adjacency.data[membership[adjacency.indices] != membership[rows]] = 0.0
+		adjacency.eliminate_zeros()
+		return adjacency
+
+	def _normalize(self, index, value, total, rows, cols):
+		""" Applies the normalization of the index to the common neighbors value of the pairs """
+		degree = self.degrees()
+		length = np.diff(self.adjacency().indptr).astype(np.float64)
+		name = index[len('within_'):] if index.startswith('within_') else index
+		name = name[:-len('_index')] if name.endswith('_index') else name
+		scores = np.zeros(len(value))
+		if name in ('common_neighbors', 'weighted_common_neighbors', 'adamic_adar', 'resource_allocation'):
+			return value
+		elif name == 'wic':
+			inter = total - value
+			np.divide(value, inter, out=scores, where=(inter != 0))
+			return np.where(inter == 0, value, scores)
+		elif name == 'jaccard':
+			denominator = length[rows] + length[cols] - value
+		elif name == 'salton':
+			denominator = np.sqrt(degree[rows] * degree[cols])
+		elif name == 'sorensen':
+			value = 2 * value
+			denominator = degree[rows] * degree[cols]
+		elif name == 'hub_promoted':
+			denominator = np.minimum(degree[rows], degree[cols])
+		elif name == 'hub_depressed':
+			denominator = np.maximum(degree[rows], degree[cols])
+		elif name == 'leicht_holme_newman':
+			denominator = degree[rows] * degree[cols]
+		np.divide(value, denominator, out=scores, where=(denominator != 0))
+		return scores
+
+	def score_pairs(self, index, rows, cols, block_size=65536):
+		""" Calculates the index for many pairs of vertices at once. Returns an array of scores. """
+
+		if index not in self.INDICES:
+			raise ValueError('Unknown similarity index: %s' % index)
+		rows = np.asarray(rows, dtype=np.int64)
+		cols = np.asarray(cols, dtype=np.int64)
+		if index == 'preferential_attachment':
+			return self.degrees()[rows] * self.degrees()[cols]
+		adjacency = self.adjacency()
+		factors = self._factors(index)
+		scores = np.empty(len(rows))
+		for start in xrange(0, len(rows), block_size):
+			i, j = rows[start:start + block_size], cols[start:start + block_size]
+			if index == 'weighted_common_neighbors':
+				weights = self.weights()
+				value = np.asarray((weights[i].multiply(adjacency[j]) + adjacency[i].multiply(weights[j])).sum(axis=1)).ravel() / 2
+			else:
+				left = self._within(adjacency[i], i) if index.startswith('within') or index == 'wic' else adjacency[i]
+				value = left.multiply(adjacency[j]).dot(factors)
+			total = adjacency[i].multiply(adjacency[j]).dot(factors) if index == 'wic' else None
+			scores[start:start + block_size] = self._normalize(index, value, total, i, j)
+		return scores
+
+	def score_cross_pairs(self, index, rows, cols, block_size=None):
+		"""
+		Calculates the index for many pairs of vertices of different layers at
+		once. Two vertices of different layers of a bipartite graph have no common
+		neighbors, so every index but the preferential attachment is the sum of the
+		index between the row and the neighbors of the col (the row excluded),
+		computed from the rows of the index of block_size vertices at a time (by
+		default, as many as fit in BLOCK_PAIRS scores of the graph).
+		Returns an array of scores.
+		"""
+
+		if index not in self.INDICES:
+			raise ValueError('Unknown similarity index: %s' % index)
+		if index == 'preferential_attachment':
+			return self.score_pairs(index, rows, cols)
+		rows = np.asarray(rows, dtype=np.int64)
+		cols = np.asarray(cols, dtype=np.int64)
+		types = np.asarray(self.graph.vs['type'])
+		if block_size is None:
+			block_size = max(1, BLOCK_PAIRS // max(len(types), 1))
+		scores = np.zeros(len(rows))
+		for layer in np.unique(types[rows]):
+			# The neighbors of each vertex of the layer, transposed.
+			vertices, right = self.layer_adjacency(layer)
+			position = np.empty(len(types), dtype=np.int64)
+			position[vertices] = np.arange(len(vertices))
+			selected = np.flatnonzero(types[rows] == layer)
+			unique, inverse = np.unique(rows[selected], return_inverse=True)
+			for start in xrange(0, len(unique), block_size):
+				block = unique[start:start + block_size]
+				S = self.matrix(index, layer, block)
+				S = S.toarray() if sp.issparse(S) else np.array(S, dtype=np.float64)
+				# A vertex is not its own neighbor.
+				S[np.arange(len(block)), position[block]] = 0.0
+				within = (inverse >= start) & (inverse < start + len(block))
+				pairs = selected[within]
+				scores[pairs] = right.dot(S.T).T[inverse[within] - start, cols[pairs]]
+		return scores
+
+	def matrix(self, index, layer, block=None):
+		"""
+		Calculates the index between the vertices of block (by default all the
+		vertices of the layer) and all the vertices of the layer. Returns a CSR
+		matrix, except for the preferential attachment, which is dense.
+		"""
+
+		if index not in self.INDICES:
+			raise ValueError('Unknown similarity index: %s' % index)
+		vertices, right = self.layer_adjacency(layer)
+		block = vertices if block is None else np.asarray(block, dtype=np.int64)
+		if index == 'preferential_attachment':
+			return np.outer(self.degrees()[block], self.degrees()[vertices])
+		adjacency = self.adjacency()
+		if index == 'weighted_common_neighbors':
+			weights = self.weights()
+			common = ((weights[block].dot(right) + adjacency[block].dot(weights[vertices].T)) / 2).tocoo()
+			return common.tocsr()
+		factors = sp.diags(self._factors(index))
+		total = adjacency[block].dot(factors).dot(right).tocoo()
+		if index.startswith('within') or index == 'wic':
+			common = self._within(adjacency[block], block).dot(factors).dot(right)
+			# The within value of each pair with a common neighbor, in the pattern of total.
+			value = np.asarray(common[total.row, total.col]).ravel()
+		else:
+			value = total.data
+		scores = self._normalize(index, value, total.data, block[total.row], vertices[total.col])
+		return sp.csr_matrix((scores, (total.row, total.col)), shape=(len(block), len(vertices)))
 
 	# Implementation of preferential attachment similarity index for link prediction.
 	def preferential_attachment(self, i, j):
 		""" Calculates pairwise preferential attachment similarities on a given unweighted graph. """
-		return float(self.graph.degree(i)) * float(self.graph.degree(j))
+		return float(self.degree(i)) * float(self.degree(j))
 
 	# Implementation of common neighbors similarity index for link prediction.
 	def common_neighbors(self, i, j):
@@ -48,7 +261,7 @@ class Similarity(object):
 		_sum = 0.0
 		cn = self.adjlist[i].intersection(self.adjlist[j])
 		for z in cn:
-			_sum += (self.graph[i, z] + self.graph[j, z]) / 2
+			_sum += (self.weight(i, z) + self.weight(j, z)) / 2
 		return _sum
 
 	# Implementation of jaccard similarity index for link prediction.
@@ -63,7 +276,7 @@ class Similarity(object):
 	def salton_index(self, i, j):
 		""" Calculates pairwise salton similarity on a given unweighted graph. """
 
-		product = float(self.graph.degree(i)) * float(self.graph.degree(j))
+		product = float(self.degree(i)) * float(self.degree(j))
 		if product == 0.0:
 			return 0.0
 
@@ -76,7 +289,7 @@ class Similarity(object):
 
 		score = 0.0
 		for isect in self.adjlist[i].intersection(self.adjlist[j]):
-			degree = self.graph.degree(isect)
+			degree = self.degree(isect)
 			if degree != 0 and degree != 1:
 				score += 1 / math.log(degree)
 		return score
@@ -87,16 +300,16 @@ class Similarity(object):
 
 		score = 0.0
 		for isect in self.adjlist[i].intersection(self.adjlist[j]):
-			degree = self.graph.degree(isect)
+			degree = self.degree(isect)
 			if degree != 0:
-				score += 1 / degree
+				score += 1.0 / degree
 		return score
 
 	# Implementation of sorensen similarity index for link prediction.
 	def sorensen_index(self, i, j):
 		""" Calculates pairwise sorensen similarity on a given unweighted graph. """
 
-		_sum = float(self.graph.degree(i)) * float(self.graph.degree(j))
+		_sum = float(self.degree(i)) * float(self.degree(j))
 		if _sum == 0.0:
 			return 0.0
 
@@ -107,7 +320,7 @@ class Similarity(object):
 	def hub_promoted(self, i, j):
 		""" Calculates pairwise hub promoted similarity on a given unweighted graph. """
 
-		minimum = min(float(self.graph.degree(i)), float(self.graph.degree(j)))
+		minimum = min(float(self.degree(i)), float(self.degree(j)))
 		if minimum == 0.0:
 			return 0.0
 
@@ -118,7 +331,7 @@ class Similarity(object):
 	def hub_depressed(self, i, j):
 		""" Calculates pairwise hub depressed similarity on a given unweighted graph. """
 
-		maximum = max(float(self.graph.degree(i)), float(self.graph.degree(j)))
+		maximum = max(float(self.degree(i)), float(self.degree(j)))
 		if maximum == 0.0:
 			return 0.0
 
@@ -128,7 +341,7 @@ class Similarity(object):
 	def leicht_holme_newman(self, i, j):
 		""" Calculates pairwise leicht holmeNewman similarity on a given unweighted graph. """
 
-		product = float(self.graph.degree(i)) * float(self.graph.degree(j))
+		product = float(self.degree(i)) * float(self.degree(j))
 		if product == 0.0:
 			return 0.0
 
@@ -145,7 +358,7 @@ class Similarity(object):
 		isect = self.adjlist[i].intersection(self.adjlist[j])
 		within_isect = 0.0
 		for vertex in isect:
-			if self.vs[vertex]['membership'] == self.vs[i]['membership']:
+			if self.graph.vs[vertex]['membership'] == self.graph.vs[i]['membership']:
 				within_isect += 1.0
 		return within_isect
 
@@ -159,7 +372,7 @@ class Similarity(object):
 		isect = self.adjlist[i].intersection(self.adjlist[j])
 		within_isect = 0.0
 		for vertex in isect:
-			if self.vs[vertex]['membership'] == self.vs[i]['membership']:
+			if self.graph.vs[vertex]['membership'] == self.graph.vs[i]['membership']:
 				within_isect += 1.0
 		union = (len(self.adjlist[i]) + len(self.adjlist[j]) - within_isect)
 		return 0 if union == 0 else within_isect / float(union)
@@ -171,7 +384,7 @@ class Similarity(object):
 		common neighbors instead of the set of all common neighbors
 		"""
 
-		product = float(self.graph.degree(i)) * float(self.graph.degree(j))
+		product = float(self.degree(i)) * float(self.degree(j))
 
 		if product == 0.0:
 			return 0.0
@@ -179,7 +392,7 @@ class Similarity(object):
 		isect = self.adjlist[i].intersection(self.adjlist[j])
 		within_isect = 0.0
 		for vertex in isect:
-			if self.vs[vertex]['membership'] == self.vs[i]['membership']:
+			if self.graph.vs[vertex]['membership'] == self.graph.vs[i]['membership']:
 				within_isect += 1.0
 		return within_isect / math.sqrt(product)
 
@@ -192,9 +405,9 @@ class Similarity(object):
 
 		score = 0.0
 		for isect in self.adjlist[i].intersection(self.adjlist[j]):
-			if vs[isect]['membership'] == self.vs[i]['membership']:
-				degree = self.graph.degree(isect)
-				if degree != 0:
+			if self.graph.vs[isect]['membership'] == self.graph.vs[i]['membership']:
+				degree = self.degree(isect)
+				if degree != 0 and degree != 1:
 					score += 1 / math.log(degree)
 		return score
 
@@ -207,10 +420,10 @@ class Similarity(object):
 
 		score = 0.0
 		for isect in self.adjlist[i].intersection(self.adjlist[j]):
-			if vs[isect]['membership'] == self.vs[i]['membership']:
-				degree = self.graph.degree(isect)
+			if self.graph.vs[isect]['membership'] == self.graph.vs[i]['membership']:
+				degree = self.degree(isect)
 				if degree != 0:
-					score += 1 / degree
+					score += 1.0 / degree
 		return score
 
 	def within_sorensen(self, i, j):
@@ -220,14 +433,14 @@ class Similarity(object):
 		common neighbors instead of the set of all common neighbors
 		"""
 
-		_sum = float(self.graph.degree(i)) * float(self.graph.degree(j))
+		_sum = float(self.degree(i)) * float(self.degree(j))
 		if _sum == 0.0:
 			return 0.0
 
 		isect = self.adjlist[i].intersection(self.adjlist[j])
 		within_isect = 0.0
 		for vertex in isect:
-			if self.vs[vertex]['membership'] == self.vs[i]['membership']:
+			if self.graph.vs[vertex]['membership'] == self.graph.vs[i]['membership']:
 				within_isect += 2.0
 		return within_isect / _sum
 
@@ -238,14 +451,14 @@ class Similarity(object):
 		common neighbors instead of the set of all common neighbors
 		"""
 
-		minimum = min(float(self.graph.degree(i)), float(self.graph.degree(j)))
+		minimum = min(float(self.degree(i)), float(self.degree(j)))
 		if minimum == 0.0:
 			return 0.0
 
 		isect = self.adjlist[i].intersection(self.adjlist[j])
 		within_isect = 0.0
 		for vertex in isect:
-			if self.vs[vertex]['membership'] == self.vs[i]['membership']:
+			if self.graph.vs[vertex]['membership'] == self.graph.vs[i]['membership']:
 				within_isect += 1.0
 		return within_isect / minimum
 
@@ -256,14 +469,14 @@ class Similarity(object):
 		common neighbors instead of the set of all common neighbors
 		"""
 
-		maximum = max(float(self.graph.degree(i)), float(self.graph.degree(j)))
+		maximum = max(float(self.degree(i)), float(self.degree(j)))
 		if maximum == 0.0:
 			return 0.0
 
 		isect = self.adjlist[i].intersection(self.adjlist[j])
 		within_isect = 0.0
 		for vertex in isect:
-			if self.vs[vertex]['membership'] == self.vs[i]['membership']:
+			if self.graph.vs[vertex]['membership'] == self.graph.vs[i]['membership']:
 				within_isect += 1.0
 		return within_isect / maximum
 
@@ -274,14 +487,14 @@ class Similarity(object):
 		common neighbors instead of the set of all common neighbors
 		"""
 
-		product = float(self.graph.degree(i)) * float(self.graph.degree(j))
+		product = float(self.degree(i)) * float(self.degree(j))
 		if product == 0.0:
 			return 0.0
 
 		isect = self.adjlist[i].intersection(self.adjlist[j])
 		within_isect = 0.0
 		for vertex in isect:
-			if self.vs[vertex]['membership'] == self.vs[i]['membership']:
+			if self.graph.vs[vertex]['membership'] == self.graph.vs[i]['membership']:
 				within_isect += 1.0
 		return within_isect / product
 
@@ -296,7 +509,7 @@ class Similarity(object):
 		nWcn = 0.0 # Intra cluster or intra community
 		nIcn = 0.0 # Inter clusters or inter comunities
 		for vertex in isect:
-			if self.vs[vertex]['membership'] == self.vs[i]['membership']:
+			if self.graph.vs[vertex]['membership'] == self.graph.vs[i]['membership']:
 				nWcn += 1.0
 			else:
 				nIcn += 1.0
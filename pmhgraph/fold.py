@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Training graphs of the folds
+==========================
+
+A fold view is the base graph without the edges of a probe set. It shares
+the indexes of the base graph (degrees, CSR matrices, adjacency list and
+weights lookup) and only masks the probe edges, so creating a view costs
+O(|probe| + n) instead of a copy of the whole graph. The CSR matrices of
+the view are built lazily by dropping the probe entries, and the view is
+matched and coarsened from them, without an igraph object of its own.
+
+The indexes of the base graph are built by prepare before the workers of
+the folds are forked, so every view of every worker shares them.
+"""
+
+from collections import defaultdict
+from itertools import izip
+
+import numpy as np
+import scipy.sparse as sp
+
+from pmhgraph.pmh import Coarsening
+
+def prepare(base):
+	""" Builds the indexes of the base graph shared by the views of its folds """
+	base.edge_positions([], [])
+	base.edge_set()
+	return base
+
+class MaskedList(object):
+	"""
+	Read-only list of the neighbors sets (or neighbors weights dicts) of the
+	base graph without the masked neighbors of each vertex
+	"""
+
+	def __init__(self, items, masked):
+		self.items = items
+		self.masked = masked
+
+	def __len__(self):
+		return len(self.items)
+
+	def __getitem__(self, vertex):
+		item = self.items[vertex]
+		if vertex not in self.masked:
+			return item
+		if isinstance(item, dict):
+			return dict((neighbor, weight) for neighbor, weight in item.iteritems() if neighbor not in self.masked[vertex])
+		return item - self.masked[vertex]
+
+	def __iter__(self):
+		for vertex in xrange(len(self)):
+			yield self[vertex]
+
+class FoldView(Coarsening):
+
+	def __init__(self, base, probe_set):
+		self.base = base
+		self.vs = base.vs
+		self.probes = np.asarray(probe_set, dtype=np.int64).reshape(-1, 2)
+		rows = np.concatenate((self.probes[:, 0], self.probes[:, 1]))
+		cols = np.concatenate((self.probes[:, 1], self.probes[:, 0]))
+		positions = base.edge_positions(rows, cols)
+		if (positions < 0).any():
+			raise ValueError('The probe set has pairs that are not edges of the graph.')
+		self._positions = positions
+		self._removed = np.bincount(rows, minlength=base.vcount())
+		self._masked = defaultdict(set)
+		for row, col in izip(rows.tolist(), cols.tolist()):
+			self._masked[row].add(col)
+		self.adjlist = MaskedList(base['adjlist'], self._masked)
+		self._indexes = {}
+		self._attributes = {}
+
+	def __getitem__(self, name):
+		""" Attributes of the graph, the adjacency list is the masked one """
+		if name == 'adjlist':
+			return self.adjlist
+		if name in self._attributes:
+			return self._attributes[name]
+		return self.base[name]
+
+	def __setitem__(self, name, value):
+		""" Attributes of the view, like its similarity index, hide the ones of the base graph """
+		self._attributes[name] = value
+
+	def vcount(self):
+		return self.base.vcount()
+
+	def ecount(self):
+		return self.base.ecount() - len(self.probes)
+
+	def degrees(self):
+		""" Degree of each vertex """
+		if 'degree' not in self._indexes:
+			self._indexes['degree'] = self.base.degrees() - self._removed
+		return self._indexes['degree']
+
+	def weight_matrix(self):
+		""" CSR matrix of the edges weights without the probe entries """
+		if 'weight' not in self._indexes:
+			weight = self.base.weight_matrix()
+			keep = np.ones(weight.nnz, dtype=bool)
+			keep[self._positions] = False
+			indptr = weight.indptr - np.concatenate(([0], np.cumsum(self._removed)))
+			self._indexes['weight'] = sp.csr_matrix((weight.data[keep], weight.indices[keep], indptr), shape=weight.shape)
+		return self._indexes['weight']
+
+	def adjacency_matrix(self):
+		""" Binary CSR adjacency matrix without the probe entries """
+		if 'adjacency' not in self._indexes:
+			weight = self.weight_matrix()
+			self._indexes['adjacency'] = sp.csr_matrix((np.ones(weight.nnz), weight.indices, weight.indptr), shape=weight.shape)
+		return self._indexes['adjacency']
+
+	def weight_lookup(self):
+		""" Dict of the neighbors weights of each vertex, for O(1) lookups of single edges """
+		return MaskedList(self.base.weight_lookup(), self._masked)
+
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Hierarchy of the coarsened graphs
+==========================
+
+The hierarchy of a graph coarsened k levels is kept as int32 arrays: the
+map from the vertices of each level to the supervertices of the next one,
+and the composed map (membership) from the vertices of the original graph
+to the supervertices of the current level. The members of the
+supervertices are indexed like the rows of a CSR matrix, built by one
+argsort of the membership, so the members of a supervertex are a slice.
+
+A hierarchy is never changed, coarsening a level returns a new one that
+shares the maps of the previous levels.
+"""
+
+import numpy as np
+
+class Hierarchy(object):
+
+	def __init__(self, n, maps=(), membership=None):
+		self.n = n
+		self.maps = list(maps)
+		if membership is None:
+			membership = np.arange(n, dtype=np.int32)
+			for successor in self.maps:
+				membership = successor[membership]
+		self.membership = membership
+		# Number of supervertices of the current level.
+		self.count = n
+		if self.maps:
+			self.count = int(self.maps[-1].max()) + 1 if len(self.maps[-1]) > 0 else 0
+		self._members = None
+
+	def levels(self):
+		""" Number of coarsened levels """
+		return len(self.maps)
+
+	def coarsen(self, successor):
+		""" Hierarchy of the next level, given the supervertex of each vertex of the current level """
+		successor = np.asarray(successor, dtype=np.int32)
+		return Hierarchy(self.n, self.maps + [successor], successor[self.membership])
+
+	def members_index(self):
+		""" Original vertices sorted by supervertex and the pointers of the members of each supervertex """
+		if self._members is None:
+			order = np.argsort(self.membership, kind='mergesort').astype(np.int32)
+			indptr = np.concatenate(([0], np.cumsum(np.bincount(self.membership, minlength=self.count))))
+			self._members = (order, indptr)
+		return self._members
+
+	def members(self, vertex):
+		""" Original vertices of a supervertex, in increasing order """
+		order, indptr = self.members_index()
+		return order[indptr[vertex]:indptr[vertex + 1]]
+
+	def sizes(self):
+		""" Number of original vertices of each supervertex """
+		return np.diff(self.members_index()[1])
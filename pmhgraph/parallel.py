@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Parallel matching of the vertices of a layer
+==========================
+
+The vertices of a layer are split in chunks that are processed by a pool of
+workers. The matching is built in rounds by a handshake (locally dominant)
+scheme: in each round every unmatched vertex proposes to its best unmatched
+two-hops neighbor, and only the mutual proposals become matches. The workers
+only write the proposals of their own chunks and the matches are committed
+between the rounds, so there are no conflicting writes on the matching.
+
+The sorted candidates are written once in memory mapped segments that the
+workers attach to by its descriptor, and the state written in the rounds is
+kept in shared memory.
+"""
+
+import os
+import time
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+import sharedmem
+
+from pmhgraph.segments import share_arrays, attach, release
+
+# State of the current matching, shared with the workers by fork.
+_state = {}
+
+def _attach(descriptor):
+	""" Initializer of the workers, attaches the candidates from its segments """
+	_state.update(attach(descriptor))
+
+def _propose(chunk):
+	""" Writes the best unmatched candidate of each unmatched vertex of the chunk """
+	start_time = time.time()
+	start, end = chunk
+	indices = _state['indices']
+	matched = _state['matched']
+	cursor = _state['cursor']
+	last = _state['last']
+	vertices = start + np.flatnonzero(~matched[start:end])
+	# The candidates of each vertex are sorted from the best to the worst, so
+	# its cursor only moves forward past the candidates that got matched.
+	moving = vertices
+	while len(moving) > 0:
+		position = cursor[moving]
+		valid = position < last[moving]
+		moving, position = moving[valid], position[valid]
+		moving = moving[matched[indices[position]]]
+		cursor[moving] += 1
+	position = cursor[vertices]
+	valid = position < last[vertices]
+	_state['proposal'][vertices] = np.where(valid, indices[np.where(valid, position, 0)], -1)
+	_state['score'][vertices] = np.where(valid, _state['data'][np.where(valid, position, 0)], 0.0)
+	return os.getpid(), time.time() - start_time, len(vertices)
+
+def handshake_matching(candidates, vertices, merge_count, matching, workers=None, chunk_size=None):
+	"""
+	Matches the vertices given the symmetric CSR matrix of candidates scores
+	(indexed by the positions of vertices). Returns the number of merges and
+	the time spent by each worker as a list of (pid, seconds, vertices)
+	"""
+	vertices = np.asarray(vertices, dtype=np.int64)
+	n = len(vertices)
+	workers = workers or cpu_count()
+	if chunk_size is None:
+		chunk_size = max(1, -(-n // (4 * workers)))
+	chunks = [(start, min(start + chunk_size, n)) for start in xrange(0, n, chunk_size)]
+	# The candidates of each vertex are sorted by its scores and, in a tie,
+	# by its positions (kept by the stable sort). Candidates without score
+	# are discarded.
+	candidates.sort_indices()
+	rows = np.repeat(np.arange(n), np.diff(candidates.indptr))
+	keep = candidates.data > 0.0
+	rows, indices, data = rows[keep], candidates.indices[keep], candidates.data[keep]
+	if len(rows) == 0:
+		return 0, []
+	order = np.lexsort((-data, rows))
+	descriptor = share_arrays({'indices': indices[order], 'data': data[order], 'last': np.searchsorted(rows[order], np.arange(n), side='right')})
+	_state['cursor'] = sharedmem.copy(np.searchsorted(rows[order], np.arange(n)))
+	_state['matched'] = sharedmem.full(n, False, dtype=bool)
+	_state['proposal'] = sharedmem.full(n, -1, dtype=np.int64)
+	_state['score'] = sharedmem.full(n, 0.0, dtype=np.float64)
+	times = {}
+	merges = 0
+	pool = Pool(workers, initializer=_attach, initargs=(descriptor,))
+	try:
+		while merge_count > 0:
+			for pid, elapsed, size in pool.map(_propose, chunks):
+				spent = times.get(pid, (0.0, 0))
+				times[pid] = (spent[0] + elapsed, spent[1] + size)
+			proposal = _state['proposal']
+			# Only the mutual proposals become matches.
+			positions = np.flatnonzero((proposal >= 0) & ~_state['matched'])
+			positions = positions[(proposal[proposal[positions]] == positions) & (positions < proposal[positions])]
+			if len(positions) == 0: break
+			if len(positions) > merge_count:
+				best = np.lexsort((positions, -_state['score'][positions]))[:merge_count]
+				positions = np.sort(positions[best])
+			pairs = proposal[positions]
+			_state['matched'][positions] = True
+			_state['matched'][pairs] = True
+			for vertex, pair in zip(vertices[positions].tolist(), vertices[pairs].tolist()):
+				matching[vertex] = pair
+				matching[pair] = vertex
+			merges += len(positions)
+			merge_count -= len(positions)
+	finally:
+		pool.close()
+		pool.join()
+		_state.clear()
+		release(descriptor)
+	return merges, [(pid, spent[0], spent[1]) for pid, spent in sorted(times.items())]
@@ -1,193 +1,574 @@
 from itertools import combinations, izip, product
 from random import choice, randint, sample, shuffle
 import numpy as np
+import scipy.sparse as sp
 from igraph import Graph
 import operator
 
-class PMHGraph(Graph):
+from pmhgraph.parallel import handshake_matching
 
-	def __init__(self, *args, **kwargs):
-		super(Graph, self).__init__(*args, **kwargs)
+def greedy_matching(u, v, merge_count, chunk_size=8192):
+	"""
+	Greedy matching of the pairs (u, v), sorted from the best to the worst: a
+	pair is matched when both of its vertices are still unmatched, until
+	merge_count merges. The pairs are read by chunks. The pairs of a chunk with a
+	vertex matched by the previous chunks are dropped at once and the others are
+	matched by rounds of locally dominant pairs (the first remaining pair of both
+	of its vertices), which gives the matching of the pass over the sorted pairs.
+	Returns the positions of the matched pairs, in order
+	"""
+	u = np.asarray(u, dtype=np.int64)
+	v = np.asarray(v, dtype=np.int64)
+	matched = [np.empty(0, dtype=np.int64)]
+	if len(u) == 0:
+		return matched[0]
+	free = np.zeros(int(max(u.max(), v.max())) + 1, dtype=bool)
+	free[u] = True
+	free[v] = True
+	# Vertices of the pairs that are still unmatched.
+	unmatched = free.sum()
+	count = 0
+	for start in xrange(0, len(u), chunk_size):
+		if count >= merge_count or unmatched < 2:
+			break
+		positions = start + np.flatnonzero(free[u[start:start + chunk_size]] & free[v[start:start + chunk_size]])
+		if len(positions) == 0:
+			continue
+		# The vertices of the chunk get local ids, so a round only touches the chunk.
+		vertices, local = np.unique(np.concatenate((u[positions], v[positions])), return_inverse=True)
+		local_u, local_v = local[:len(positions)], local[len(positions):]
+		local_free = np.ones(len(vertices), dtype=bool)
+		remaining = np.arange(len(positions))
+		dominants = []
+		while len(remaining) > 0:
+			pair_u, pair_v = local_u[remaining], local_v[remaining]
+			ranks = np.arange(len(remaining))
+			# First remaining pair of each vertex: the assignment of the ranks in reverse
+			# order leaves the first one.
+			first = np.full(len(vertices), len(remaining), dtype=np.int64)
+			first[pair_u[::-1]] = ranks[::-1]
+			second = np.full(len(vertices), len(remaining), dtype=np.int64)
+			second[pair_v[::-1]] = ranks[::-1]
+			np.minimum(first, second, out=first)
+			dominant = (first[pair_u] == ranks) & (first[pair_v] == ranks)
+			local_free[pair_u[dominant]] = False
+			local_free[pair_v[dominant]] = False
+			dominants.append(remaining[dominant])
+			remaining = remaining[local_free[pair_u] & local_free[pair_v]]
+		# The merges of the chunk are taken in the order of the pairs.
+		chunk = positions[np.sort(np.concatenate(dominants))][:merge_count - count]
+		free[u[chunk]] = False
+		free[v[chunk]] = False
+		matched.append(chunk)
+		count += len(chunk)
+		unmatched -= 2 * len(chunk)
+	return np.concatenate(matched)
 
-	def projection(self, fine):
-		"""
-		The partitions of the reduced graph (self) is projected
-		to the original/next graph (fine)
-		"""
+def best_candidates(indptr, cols, scores, limits, reverse=True):
+	"""
+	Mask of the best candidates of each row of a CSR matrix, ranked by its
+	score (the greatest first when reverse) and then by its col, with limits
+	the number of candidates kept for each row. The last score kept of a row is
+	found by argpartition and its ties are kept from the smallest col
+	"""
+	keep = np.ones(len(cols), dtype=bool)
+	values = -scores if reverse else scores
+	# Only the rows with more candidates than its limit are pruned.
+	long_rows = np.flatnonzero(np.diff(indptr) > limits)
+	for start, end, k in izip(indptr[long_rows].tolist(), indptr[long_rows + 1].tolist(), limits[long_rows].tolist()):
+		row = values[start:end]
+		kth = row[np.argpartition(row, k - 1)[k - 1]]
+		better = row < kth
+		keep[start:end] = better
+		ties = start + np.flatnonzero(row == kth)
+		needed = k - np.count_nonzero(better)
+		if len(ties) > needed:
+			ties = ties[np.argsort(cols[ties], kind='mergesort')[:needed]]
+		keep[ties] = True
+	return keep
+
+def dominant_matching(rows, cols, size):
+	"""
+	Matching of the pairs whose vertices are the best unmatched candidate of each
+	other, given the candidates of each row from the best to the worst. The pairs
+	with a matched vertex are dropped and the best candidates searched again until
+	no such pair is left. A row without candidates left is not matched and the
+	rows whose best candidate it is wait for it. Returns the positions of the
+	matched pairs (row, col) with the row before the col
+	"""
+	free = np.ones(size, dtype=bool)
+	pointer = np.full(size, -1, dtype=np.int64)
+	positions = np.arange(len(rows))
+	matched = [np.empty(0, dtype=np.int64)]
+	while len(positions) > 0:
+		# The first candidate left of each row is its best unmatched candidate.
+		first = np.ones(len(positions), dtype=bool)
+		first[1:] = rows[positions[1:]] != rows[positions[:-1]]
+		best = positions[first]
+		pointer[rows[best]] = cols[best]
+		mutual = best[(pointer[cols[best]] == rows[best]) & (rows[best] < cols[best])]
+		pointer[rows[best]] = -1
+		if len(mutual) == 0:
+			break
+		free[rows[mutual]] = False
+		free[cols[mutual]] = False
+		matched.append(mutual)
+		positions = positions[free[rows[positions]] & free[cols[positions]]]
+	return np.sort(np.concatenate(matched))
+
+class Coarsening(object):
+	"""
+	Matching and coarsening of a graph that provides vcount, ecount, the
+	degrees and CSR matrices, the types and weights of its vertices and the
+	level, layers and hierarchy attributes, so they run on a PMHGraph and on
+	the views and shared arrays of a graph without building its igraph object
+	"""
 
 	def coarsening(self, matching):
 		""" Create coarse graph """
-		# Contract vertices: Referencing the original graph of the coarse graph
-		uniqid = 0
-		# Used to check if a vertex is already visited.
-		visited = [0] * self.vcount()
-		# Used to correct the types.
-		types = []
-		# Used to correct the weights.
-		weights = []
+		matching = np.asarray(matching, dtype=np.int64)
+		vertices = np.arange(self.vcount())
+		# Contract vertices: The first vertex of each pair (or a single vertex) is the representative
+		# of the supervertex and the supervertices are numbered in the order of its representatives.
+		representative = np.minimum(vertices, matching)
+		is_representative = representative == vertices
+		uniqid = np.cumsum(is_representative) - 1
+		successor = uniqid[representative]
 		# Create coarsening self
 		coarser = PMHGraph()
-		coarser['predecessors'] = {}
-		for vertex, pair in enumerate(matching):
-			# Checks if the vertex is already visited.
-			if visited[vertex] == 0:
-				self.vs[vertex]['successor'] = uniqid
-				types.append(self.vs[vertex]['type'])
-				weight = self.vs[vertex]['weight']
-				# If this condition is true, then a supervertex must be formed.
-				if vertex != pair:
-					vertex_neighbors = self['adjlist'][vertex]
-					pair_neighbors = self['adjlist'][pair]
-					self.vs[pair]['successor'] = uniqid
-					weight += self.vs[pair]['weight']
-					successors = []
-					vertex_in_predecessors = vertex in self['predecessors']
-					pair_in_predecessors = pair in self['predecessors']
-					# Checks if the both vertices are already supervertices.
-					if(vertex_in_predecessors and pair_in_predecessors):
-						successors = successors + self['predecessors'][vertex] + self['predecessors'][pair]
-					# Checks if the vertex is a supervertex and pair is not.
-					elif(vertex_in_predecessors and not pair_in_predecessors):
-						successors = successors + self['predecessors'][vertex]
-						successors.append(self['predecessors'][pair])
-					# Checks if the pair is a supervertex and vertex is not.
-					elif(pair_in_predecessors and not vertex_in_predecessors):
-						successors = successors + self['predecessors'][pair]
-						successors.append(self['predecessors'][vertex])
-					# If neither is a supervertex.
-					else:
-						successors = self['predecessors'][vertex] + self['predecessors'][pair]
-					coarser['predecessors'][uniqid] = successors
-				weights.append(weight)
-				uniqid += 1
-				visited[vertex] = 1
-				visited[pair] = 1
-		# Used to get the new ids after the coarsening.
-		new_ids = [-1] * len(matching)
-		count = 0
-
-		for i in range(len(matching)):
-			j = matching[i]
-			if(i == j):
-				new_ids[i] = count
-				coarser['predecessors'][count] = self['predecessors'][i]
-				count += 1
-			elif(i != j and new_ids[j] == -1):
-				new_ids[i] = count
-				new_ids[j] = count
-				count += 1
-
-		coarser.add_vertices(uniqid)
-		coarser.vs['type'] = types
-		coarser.vs['weight'] = weights
-		coarser.vs['successor'] = self.vs['successor']
+		coarser.add_vertices(int(is_representative.sum()))
+		types = np.asarray(self.vs['type'])
+		coarser.vs['type'] = types[is_representative].tolist()
+		weights = np.asarray(self.vs['weight'])
+		coarser.vs['weight'] = np.bincount(successor, weights=weights, minlength=coarser.vcount()).astype(weights.dtype).tolist()
 		coarser['level'] = self['level'] + 1
 		coarser['layers'] = self['layers']
-		coarser['vertices'] = []
-		for layer in xrange(self['layers']):
-			coarser['vertices'].append(len(coarser.vs.select(type=layer)))
-
-		# Contract edges
-		dict_edges = dict()
-		for edge in self.es():
-			v_successor = self.vs[edge.tuple[0]]['successor']
-			u_successor = self.vs[edge.tuple[1]]['successor']
-
-			# Loop is not necessary
-			if v_successor == u_successor: continue
-
-			# Add edge in coarse graph
-			if v_successor < u_successor:
-				dict_edges[(v_successor, u_successor)] = dict_edges.get((v_successor, u_successor), 0) + edge['weight']
-			else:
-				dict_edges[(u_successor, v_successor)] = dict_edges.get((u_successor, v_successor), 0) + edge['weight']
+		coarser['vertices'] = np.bincount(coarser.vs['type'], minlength=self['layers']).tolist()
+		# The map of the vertices to its supervertices is added to the hierarchy.
+		coarser['hierarchy'] = self['hierarchy'].coarsen(successor)
 
-		if len(dict_edges) > 0:
-			edges, weights = izip(*dict_edges.items())
-			coarser.add_edges(edges)
-			coarser.es['weight'] = weights
+		# Contract edges: Parallel super edges are merged by sorting their keys and summing its weights.
+		coarser['adjlist'] = [set() for vertex in xrange(coarser.vcount())]
+		if self.ecount() == 0:
+			return coarser
+		# Each edge is read once from the upper triangle of the weights matrix.
+		weight = sp.triu(self.weight_matrix(), 1).tocoo()
+		edges = successor[np.column_stack((weight.row, weight.col))]
+		weights = weight.data.astype(np.float64)
+		# Loop is not necessary
+		loops = edges[:, 0] == edges[:, 1]
+		edges, weights = edges[~loops], weights[~loops]
+		if len(edges) > 0:
+			keys = np.minimum(edges[:, 0], edges[:, 1]) * coarser.vcount() + np.maximum(edges[:, 0], edges[:, 1])
+			order = np.argsort(keys, kind='mergesort')
+			keys, weights = keys[order], weights[order]
+			first = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+			keys = keys[first]
+			coarser.add_edges(zip((keys // coarser.vcount()).tolist(), (keys % coarser.vcount()).tolist()))
+			coarser.es['weight'] = np.add.reduceat(weights, first).tolist()
+			coarser.invalidate()
 			coarser['adjlist'] = map(set, coarser.get_adjlist())
 		return coarser
 
-	def greed_two_hops(self, vertices, reduction_factor, matching):
+	def greed_two_hops(self, vertices, reduction_factor, matching, max_candidates=None):
 		"""
 		Matches are restricted between vertices that are not adjacent
 		but are only allowed to match with neighbors of its neighbors,
 		i.e. two-hopes neighborhood
 		"""
 		merge_count = int(reduction_factor * self.vcount())
-		return self.get_greed_two_hops(vertices, merge_count, matching)
+		return self.get_greed_two_hops(vertices, merge_count, matching, max_candidates=max_candidates)
 
+	def similarity_scores(self, rows, cols):
+		"""
+		Scores of the pairs of vertices by the similarity index of the graph,
+		computed in one batch when it is an index of a Similarity object
+		"""
+		index = self['similarity']
+		similarity = getattr(index, '__self__', None)
+		if hasattr(similarity, 'score_pairs'):
+			return similarity.score_pairs(index.__name__, rows, cols)
+		return np.array([index(u, v) for u, v in izip(np.asarray(rows).tolist(), np.asarray(cols).tolist())], dtype=np.float64)
 
-	def get_greed_two_hops(self, vertices, merge_count, matching, reverse=True):
-			"""
-			The best match is selected for each vertex using its two-hops neighborhood
-			"""
-			# Search two-hopes neighborhood for each vertex in selected layer
-			dict_edges = {}
-			# Index that will be used to calculate the similarities.
-			index = self['similarity']
-			visited = [0] * self.vcount()
+	def two_hops_pairs(self, vertices, block_size=1024):
+		"""
+		Pairs of vertices in the two-hopes neighborhood of each other with its
+		similarity scores, sorted by the pair. The pairs and its number of common
+		neighbors are the nonzeros of A.A^T, computed for blocks of vertices
+		"""
+		vertices = np.asarray(vertices, dtype=np.int64)
+		index = self['similarity']
+		adjacency = self.adjacency_matrix()
+		layer = adjacency[vertices]
+		layer_t = layer.T.tocsr()
+		adjacent = layer[:, vertices]
+		pairs_u, pairs_v, pairs_scores = [], [], []
+		for start in xrange(0, len(vertices), block_size):
+			block = np.arange(start, min(start + block_size, len(vertices)))
+			common = layer[block].dot(layer_t)
+			common.sort_indices()
+			common = common.tocoo()
+			rows, cols, scores = block[common.row], common.col, common.data
+			# Each pair is only needed once, and the neighbors are not two-hops neighbors.
+			keep = rows < cols
+			if adjacent.nnz > 0:
+				keep &= np.asarray(adjacent[rows, cols]).ravel() == 0
+			rows, cols, scores = rows[keep], cols[keep], scores[keep]
+			if getattr(index, '__name__', None) != 'common_neighbors':
+				scores = self.similarity_scores(vertices[rows], vertices[cols])
+			pairs_u.append(rows)
+			pairs_v.append(cols)
+			pairs_scores.append(scores)
+		if len(pairs_u) == 0:
+			return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+		rows, cols, scores = np.concatenate(pairs_u), np.concatenate(pairs_v), np.concatenate(pairs_scores).astype(np.float64)
+		return vertices[rows], vertices[cols], scores
 
-			numberof = 0
-			for vertex in vertices:
-				neighborhood = self.neighborhood(vertices=vertex, order=2)
-				twohops = neighborhood[(len(self['adjlist'][vertex]) + 1):]
-				for twohop in twohops:
-					if visited[twohop] == 0:
-						dict_edges[(vertex, twohop)] = index(vertex, twohop)
-				visited[vertex] = 1
+	def two_hops_candidates(self, rows, vertices, max_candidates, reverse=True, block_size=1024):
+		"""
+		Best candidates of each vertex of rows among the vertices in its two-hopes
+		neighborhood, ranked by (score, pair), with max_candidates the number of
+		candidates kept for all the rows or for each one. Returns the rows, the
+		candidates and the scores, with the candidates of each row from the best to
+		the worst, and the rows with more candidates than the ones kept
+		"""
+		rows = np.asarray(rows, dtype=np.int64)
+		vertices = np.asarray(vertices, dtype=np.int64)
+		limits = np.broadcast_to(max_candidates, rows.shape)
+		index = self['similarity']
+		adjacency = self.adjacency_matrix()
+		layer = adjacency[rows]
+		layer_t = adjacency[vertices].T.tocsr()
+		adjacent = layer[:, vertices]
+		# Position of each row among the vertices, to drop the vertex itself.
+		position = np.full(self.vcount(), -1, dtype=np.int64)
+		position[vertices] = np.arange(len(vertices))
+		pairs_u, pairs_v, pairs_scores, pruned = [], [], [], []
+		for start in xrange(0, len(rows), block_size):
+			block = np.arange(start, min(start + block_size, len(rows)))
+			common = layer[block].dot(layer_t)
+			# The vertex itself and its neighbors are not two-hops neighbors.
+			keep = common.indices != np.repeat(position[rows[block]], np.diff(common.indptr))
+			if adjacent.nnz > 0:
+				entries = np.repeat(block, np.diff(common.indptr))
+				keep &= np.asarray(adjacent[entries, common.indices]).ravel() == 0
+			dropped = np.searchsorted(common.indptr, np.flatnonzero(~keep), side='right') - 1
+			indptr = common.indptr - np.concatenate(([0], np.cumsum(np.bincount(dropped, minlength=len(block)))))
+			cols, scores = common.indices[keep], common.data[keep]
+			if getattr(index, '__name__', None) != 'common_neighbors':
+				scores = self.similarity_scores(np.repeat(rows[block], np.diff(indptr)), vertices[cols])
+			pruned.append(rows[block[np.diff(indptr) > limits[block]]])
+			keep = best_candidates(indptr, cols, scores, limits[block], reverse)
+			keep = np.flatnonzero(keep)
+			pairs_u.append(rows[block[np.searchsorted(indptr, keep, side='right') - 1]])
+			pairs_v.append(vertices[cols[keep]])
+			pairs_scores.append(scores[keep])
+		if len(pairs_u) == 0:
+			return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0), np.empty(0, dtype=np.int64)
+		u, v, scores = np.concatenate(pairs_u), np.concatenate(pairs_v), np.concatenate(pairs_scores).astype(np.float64)
+		# The pair (u, v) is ranked by its vertices in increasing order, as v for a given u.
+		order = np.lexsort((v, -scores if reverse else scores, u))
+		return u[order], v[order], scores[order], np.concatenate(pruned)
 
-			# Select promising matches or pair of vertices
-			edges = sorted(dict_edges.items(), key=operator.itemgetter(1), reverse=reverse)
+	def two_hops_matrix(self, vertices):
+		"""
+		Symmetric CSR matrix of the similarity scores between the vertices
+		(indexed by its positions) that are two-hopes neighbors of each other
+		"""
+		vertices = np.asarray(vertices, dtype=np.int64)
+		index = self['similarity']
+		layer = self.adjacency_matrix()[vertices]
+		candidates = layer.dot(layer.T).tocsr()
+		# The vertex itself and its neighbors are not two-hops neighbors.
+		candidates = candidates - sp.diags(candidates.diagonal())
+		adjacent = layer[:, vertices]
+		if adjacent.nnz > 0:
+			candidates = candidates - candidates.multiply(adjacent)
+		candidates = candidates.tocsr()
+		candidates.eliminate_zeros()
+		if getattr(index, '__name__', None) != 'common_neighbors':
+			rows = np.repeat(vertices, np.diff(candidates.indptr))
+			candidates.data = self.similarity_scores(rows, vertices[candidates.indices])
+		return candidates
+
+	def get_greed_two_hops(self, vertices, merge_count, matching, reverse=True, max_candidates=None):
+		"""
+		The best match is selected for each vertex using its two-hops neighborhood.
+		The pairs are matched greedily from the best to the worst, by one pass over
+		all the pairs or, when only the best candidates of each vertex are kept, by
+		rounds of the pairs that are the best unmatched candidate of both of its
+		vertices, which give the same merges. Returns the number of merges achieved
+		"""
+		# Vertices already matched are not matched again.
+		vertices = np.asarray(vertices, dtype=np.int64)
+		vertices = vertices[matching[vertices] == vertices]
+		if merge_count <= 0 or len(vertices) < 2:
+			return 0
+		if not max_candidates:
+			# Search two-hopes neighborhood for each vertex in selected layer
+			u, v, scores = self.two_hops_pairs(vertices)
+
+			# Select promising matches or pair of vertices. The pairs are sorted by (u, v),
+			# so the stable sort breaks the ties of the scores by (u, v).
+			order = np.argsort(-scores if reverse else scores, kind='mergesort')
+			u, v = u[order], v[order]
+			matched = greedy_matching(u, v, merge_count)
+		else:
+			u, v, scores = self.dominant_two_hops(vertices, max_candidates, reverse)
+			# The greedy pass would have stopped at the merge_count best merges.
+			matched = np.lexsort((v, u, -scores if reverse else scores))[:merge_count]
+		matching[u[matched]] = v[matched]
+		matching[v[matched]] = u[matched]
+		return len(matched)
 
-			for edge, value in edges:
-				if (matching[edge[0]] == edge[0]) and (matching[edge[1]] == edge[1]):
-					matching[edge[0]] = edge[1]
-					matching[edge[1]] = edge[0]
-					merge_count -= 1
-				if merge_count == 0: break
+	def dominant_two_hops(self, vertices, max_candidates, reverse=True):
+		"""
+		Pairs matched among the best max_candidates candidates of each vertex in its
+		two-hopes neighborhood. A vertex whose candidates are all matched has its
+		best unmatched candidate unknown, so its candidates are searched again among
+		the unmatched vertices, twice as many each time. It is searched only when
+		its candidates left may score as the best pair left. Returns the matched
+		pairs and its scores
+		"""
+		limits = np.full(self.vcount(), max_candidates, dtype=np.int64)
+		# Unmatched vertices, the ones whose candidates were pruned and its worst candidate.
+		free = np.zeros(self.vcount(), dtype=bool)
+		free[vertices] = True
+		partial = np.zeros(self.vcount(), dtype=bool)
+		worst = np.zeros(self.vcount())
+		rows, cols, scores = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+		search = np.asarray(vertices, dtype=np.int64)
+		pool = search
+		pairs_u, pairs_v, pairs_scores = [], [], []
+		while len(search) > 0:
+			search_rows, search_cols, search_scores, pruned = self.two_hops_candidates(search, pool, limits[search], reverse)
+			partial[search] = False
+			partial[pruned] = True
+			last = np.flatnonzero(np.append(search_rows[1:] != search_rows[:-1], len(search_rows) > 0))
+			worst[search_rows[last]] = search_scores[last]
+			rows, cols, scores = np.concatenate((rows, search_rows)), np.concatenate((cols, search_cols)), np.concatenate((scores, search_scores))
 
+			matched = dominant_matching(rows, cols, self.vcount())
+			pairs_u.append(rows[matched])
+			pairs_v.append(cols[matched])
+			pairs_scores.append(scores[matched])
+			free[rows[matched]] = False
+			free[cols[matched]] = False
+			keep = free[rows] & free[cols]
+			rows, cols, scores = rows[keep], cols[keep], scores[keep]
+			# A vertex with all of its candidates matched and none pruned is left unmatched.
+			searched = np.zeros(self.vcount(), dtype=bool)
+			searched[rows] = True
+			search = np.flatnonzero(free & partial & ~searched)
+			pool = np.flatnonzero(free & (searched | partial))
+			if len(rows) > 0:
+				# The candidates left of a vertex score at most its worst candidate.
+				best = scores.max() if reverse else scores.min()
+				search = search[worst[search] >= best if reverse else worst[search] <= best]
+			limits[search] *= 2
+		if len(pairs_u) == 0:
+			return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+		return np.concatenate(pairs_u), np.concatenate(pairs_v), np.concatenate(pairs_scores)
 
-	def greed_rand_two_hops(self, vertices, reduction_factor, matching):
+	def greed_rand_two_hops(self, vertices, reduction_factor, matching, seed=None):
 		"""
-		TODO: description
+		Matches are restricted to the two-hopes neighborhood and the vertices
+		are visited in a random order given by seed. Returns the number of
+		merges achieved
 		"""
 
 		merge_count = int(reduction_factor * self.vcount())
-		return self.get_greed_rand_two_hops(vertices, merge_count, matching)
+		return self.get_greed_rand_two_hops(vertices, merge_count, matching, seed=seed)
 
-	def get_greed_rand_two_hops(self, vertices, merge_count, matching):
+	def get_greed_rand_two_hops(self, vertices, merge_count, matching, seed=None):
 		"""
-		TODO: description
+		Each randomly selected vertex is matched with its best unmatched two-hops
+		neighbor. Every visited vertex consumes the merge_count, even if it has no
+		candidate and stays alone, so the number of merges achieved is returned
 		"""
 
-		visited = [0] * self.vcount()
-		index = 0
-		sample_vertices = sample(vertices, len(vertices))
-		adjlist = map(set, self.get_adjlist())
-		while merge_count > 0 and index < len(vertices):
-			# Randomly select a vertex v of V
-			vertex = sample_vertices[index]
-			if visited[vertex] == 1:
-				index += 1
-				continue
+		vertices = np.asarray(vertices, dtype=np.int64)
+		n = len(vertices)
+		candidates = self.two_hops_matrix(vertices)
+		indptr, indices, data = candidates.indptr, candidates.indices, candidates.data
+		visited = np.zeros(n, dtype=bool)
+		merges = 0
+		# Randomly select a vertex v of V
+		for vertex in np.random.RandomState(seed).permutation(n).tolist():
+			if merge_count <= 0: break
+			if visited[vertex]: continue
 			# Select the edge (v, u) of E wich maximum score
-			# Tow hopes restriction: It ensures that the match only occurs between vertices of the same type
-			neighborhood = self.neighborhood(vertices=vertex, order=2)
-			twohops = neighborhood[(len(self['adjlist'][vertex]) + 1):]
-			_max = 0.0
 			neighbor = vertex
-			for twohop in twohops:
-				if visited[twohop] == 1: continue
-				# Calling a function of a module from a string
-				score = self['similarity'](vertex, twohop)
-				if score > _max:
-					_max = score
-					neighbor = twohop
-			matching[neighbor] = vertex
-			matching[vertex] = neighbor
-			visited[neighbor] = 1
+			cols = indices[indptr[vertex]:indptr[vertex + 1]]
+			values = data[indptr[vertex]:indptr[vertex + 1]]
+			free = ~visited[cols]
+			if free.any():
+				cols, values = cols[free], values[free]
+				best = np.argmax(values)
+				if values[best] > 0.0:
+					neighbor = cols[best]
+					merges += 1
+			matching[vertices[neighbor]] = vertices[vertex]
+			matching[vertices[vertex]] = vertices[neighbor]
+			visited[neighbor] = True
+			visited[vertex] = True
 			merge_count -= 1
-			visited[vertex] = 1
-			index += 1
+		return merges
+
+	def greed_parallel_two_hops(self, vertices, reduction_factor, matching, workers=None, chunk_size=None):
+		"""
+		Matches are restricted to the two-hopes neighborhood and built in
+		parallel by a pool of workers over chunks of vertices. Returns the
+		number of merges achieved and the time spent by each worker
+		"""
+
+		merge_count = int(reduction_factor * self.vcount())
+		candidates = self.two_hops_matrix(vertices)
+		return handshake_matching(candidates, vertices, merge_count, matching, workers=workers, chunk_size=chunk_size)
+
+class PMHGraph(Graph, Coarsening):
+
+	def __init__(self, *args, **kwargs):
+		super(Graph, self).__init__(*args, **kwargs)
+
+	def projection(self, fine, scores, block_size=1024):
+		"""
+		The partitions of the reduced graph (self) is projected
+		to the original/next graph (fine). Given the dense matrix of scores
+		between the super users and the super items, yields the scores of the
+		pairs of each block of users of fine as (users, items, block, scores,
+		observed), so the whole matrix of fine is never built
+		"""
+		membership, normalized = self.projection_index(fine, scores)
+		types = np.asarray(fine.vs['type'])
+		users = np.flatnonzero(types == 0)
+		items = np.flatnonzero(types != 0)
+		observed = fine.adjacency_matrix()[users][:, items].tocsr()
+		super_users = membership[users]
+		super_items = membership[items]
+		for start in xrange(0, len(users), block_size):
+			block = np.arange(start, min(start + block_size, len(users)))
+			yield users, items, block, normalized[np.ix_(super_users[block], super_items)], observed[block].toarray() != 0
+
+	def projection_pairs(self, fine, scores, pairs):
+		""" Projected scores of a list of (user, item) pairs of fine """
+		membership, normalized = self.projection_index(fine, scores)
+		pairs = map(tuple, pairs)
+		if len(pairs) == 0:
+			return {}
+		pairs_array = np.asarray(pairs, dtype=np.int64)
+		# Orients every pair from the user to the item.
+		swap = np.asarray(fine.vs['type'])[pairs_array[:, 0]] != 0
+		users = membership[np.where(swap, pairs_array[:, 1], pairs_array[:, 0])]
+		items = membership[np.where(swap, pairs_array[:, 0], pairs_array[:, 1])]
+		return dict(izip(pairs, normalized[users, items].tolist()))
+
+	def projection_index(self, fine, scores):
+		"""
+		Position of the supervertex of each vertex of fine in the matrix of
+		scores, and the scores normalized by the number of pairs between the
+		members of the supervertices. The super edges keep its own weight
+		"""
+		types = np.asarray(self.vs['type'])
+		super_users = np.flatnonzero(types == 0)
+		super_items = np.flatnonzero(types != 0)
+		position = np.empty(self.vcount(), dtype=np.int64)
+		position[super_users] = np.arange(len(super_users))
+		position[super_items] = np.arange(len(super_items))
+		membership = self.super_vertices(fine.vcount())
+		size = self['hierarchy'].sizes().astype(np.float64)
+		weight = self.weight_matrix()[super_users][:, super_items].tocoo()
+		normalized = np.array(scores, dtype=np.float64)
+		normalized[weight.row, weight.col] = weight.data
+		normalized /= np.outer(size[super_users], size[super_items])
+		return position[membership], normalized
+
+	def super_vertices(self, n):
+		""" Supervertex of each of the n vertices of the original graph """
+		membership = self['hierarchy'].membership
+		if len(membership) != n:
+			raise ValueError('The graph is not coarsened from a graph of %d vertices.' % n)
+		return membership
+
+	def invalidate(self):
+		""" Drops the cached indexes, which must be rebuilt after the edges or its weights change """
+		self.__dict__.pop('_indexes', None)
+
+	def add_edges(self, *args, **kwargs):
+		self.invalidate()
+		return super(PMHGraph, self).add_edges(*args, **kwargs)
+
+	def delete_edges(self, *args, **kwargs):
+		self.invalidate()
+		return super(PMHGraph, self).delete_edges(*args, **kwargs)
+
+	def add_vertices(self, *args, **kwargs):
+		self.invalidate()
+		return super(PMHGraph, self).add_vertices(*args, **kwargs)
+
+	def delete_vertices(self, *args, **kwargs):
+		self.invalidate()
+		return super(PMHGraph, self).delete_vertices(*args, **kwargs)
+
+	def indexes(self):
+		"""
+		Degree array and CSR adjacency and weights matrices of the graph,
+		built once per level and kept until the edges change
+		"""
+		if self.__dict__.get('_indexes') is None:
+			n = self.vcount()
+			edges = np.asarray(self.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+			if self.ecount() > 0 and 'weight' in self.es.attributes():
+				weights = np.asarray(self.es['weight'], dtype=np.float64)
+			else:
+				weights = np.ones(self.ecount())
+			rows = np.concatenate((edges[:, 0], edges[:, 1]))
+			cols = np.concatenate((edges[:, 1], edges[:, 0]))
+			weight = sp.csr_matrix((np.concatenate((weights, weights)), (rows, cols)), shape=(n, n))
+			weight.sum_duplicates()
+			adjacency = weight.copy()
+			adjacency.data[:] = 1.0
+			self._indexes = {'degree': np.asarray(self.degree(), dtype=np.float64), 'adjacency': adjacency, 'weight': weight}
+		return self._indexes
+
+	def degrees(self):
+		""" Degree of each vertex """
+		return self.indexes()['degree']
+
+	def adjacency_matrix(self):
+		""" Binary CSR adjacency matrix of the graph """
+		return self.indexes()['adjacency']
+
+	def weight_matrix(self):
+		""" CSR matrix of the edges weights of the graph """
+		return self.indexes()['weight']
+
+	def weight_lookup(self):
+		""" Dict of the neighbors weights of each vertex, for O(1) lookups of single edges """
+		indexes = self.indexes()
+		if 'lookup' not in indexes:
+			weight = indexes['weight']
+			indices, data = weight.indices.tolist(), weight.data.tolist()
+			indptr = weight.indptr.tolist()
+			indexes['lookup'] = [dict(izip(indices[indptr[vertex]:indptr[vertex + 1]], data[indptr[vertex]:indptr[vertex + 1]])) for vertex in xrange(self.vcount())]
+		return indexes['lookup']
+
+	def edge_positions(self, rows, cols):
+		""" Positions of the (rows, cols) entries in the CSR matrices, -1 for the missing ones """
+		indexes = self.indexes()
+		weight = indexes['weight']
+		if 'keys' not in indexes:
+			# The entries of a canonical CSR matrix are sorted by row and column.
+			indexes['keys'] = np.repeat(np.arange(self.vcount(), dtype=np.int64), np.diff(weight.indptr)) * self.vcount() + weight.indices
+		keys = np.asarray(rows, dtype=np.int64) * self.vcount() + np.asarray(cols, dtype=np.int64)
+		positions = np.searchsorted(indexes['keys'], keys)
+		found = positions < len(indexes['keys'])
+		found[found] = indexes['keys'][positions[found]] == keys[found]
+		return np.where(found, positions, -1)
+
+	def edge_set(self):
+		""" Set of the (source, target) edges of the graph """
+		indexes = self.indexes()
+		if 'edges' not in indexes:
+			indexes['edges'] = set(self.get_edgelist())
+		return indexes['edges']
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Memory mapped segments of arrays
+==========================
+
+Arrays written once in files of a shared memory file system, described by a
+small picklable descriptor. A process attaches to the segments by the
+descriptor and reads the arrays without copying them, so their pages are
+shared by every process that attaches.
+"""
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+def share_arrays(arrays, attributes=None, directory=None):
+	""" Stores the arrays in memory mapped segments. Returns its descriptor """
+	if directory is None:
+		# The segments are kept in memory when the system has a shared memory file system.
+		directory = tempfile.mkdtemp(prefix='pmhgraph-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+	descriptor = {'directory': directory, 'arrays': {}, 'attributes': dict(attributes or {})}
+	for name, array in arrays.items():
+		array = np.asarray(array)
+		path = os.path.join(directory, name + '.dat')
+		if array.size > 0:
+			segment = np.memmap(path, dtype=array.dtype, mode='w+', shape=array.shape)
+			segment[...] = array
+			segment.flush()
+			del segment
+		descriptor['arrays'][name] = (path, array.dtype.str, array.shape)
+	return descriptor
+
+def attach(descriptor):
+	""" Read only arrays of the segments of a descriptor """
+	arrays = {}
+	for name, (path, dtype, shape) in descriptor['arrays'].items():
+		if int(np.prod(shape)) == 0:
+			arrays[name] = np.empty(shape, dtype=dtype)
+		else:
+			arrays[name] = np.memmap(path, dtype=dtype, mode='r', shape=shape)
+	return arrays
+
+def release(descriptor):
+	""" Removes the segments of a descriptor """
+	shutil.rmtree(descriptor['directory'], ignore_errors=True)
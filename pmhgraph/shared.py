@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Graph arrays shared between processes
+==========================
+
+The arrays of a graph (types and weights of the vertices, degrees, CSR
+matrices and its sorted keys, hierarchy maps) are written once in memory
+mapped segments, described by a small picklable descriptor. A worker attaches
+to the segments by the descriptor and reads the arrays without copying them,
+so the pages are shared by every process instead of being duplicated by the
+reference counting writes on the Python objects (like the adjacency list of
+sets) that fork would share.
+
+A shared graph answers the same queries of a graph used by the fold views
+and is matched and coarsened from its arrays, so the workers of the folds
+and of the matching never touch the graph of the parent.
+"""
+
+import numpy as np
+import scipy.sparse as sp
+
+from pmhgraph.hierarchy import Hierarchy
+from pmhgraph.pmh import Coarsening
+from pmhgraph.segments import share_arrays, attach, release
+
+def share(graph, directory=None):
+	""" Stores the arrays of a graph, or of a view of a graph, in memory mapped segments. Returns its descriptor """
+	weight = graph.weight_matrix()
+	if not weight.has_sorted_indices:
+		weight = weight.sorted_indices()
+	n = graph.vcount()
+	hierarchy = graph['hierarchy']
+	arrays = {
+		'types': np.asarray(graph.vs['type'], dtype=np.int64),
+		'vertex_weights': np.asarray(graph.vs['weight'], dtype=np.float64),
+		'degree': graph.degrees(),
+		'indptr': weight.indptr,
+		'indices': weight.indices,
+		'data': weight.data,
+		'ones': np.ones(weight.nnz),
+		# The entries of a canonical CSR matrix are sorted by row and column.
+		'keys': np.repeat(np.arange(n, dtype=np.int64), np.diff(weight.indptr)) * n + weight.indices,
+		'membership': hierarchy.membership,
+	}
+	for level, successor in enumerate(hierarchy.maps):
+		arrays['map%d' % level] = successor
+	# Only the original graph has the ids of its vertices.
+	try:
+		ids = graph['ids']
+	except KeyError:
+		ids = []
+	for layer, layer_ids in enumerate(ids):
+		arrays['ids%d' % layer] = np.asarray(layer_ids)
+	attributes = {'layers': graph['layers'], 'vertices': list(graph['vertices']), 'level': graph['level'], 'ecount': graph.ecount(), 'maps': hierarchy.levels()}
+	return share_arrays(arrays, attributes, directory)
+
+class CSRList(object):
+	""" Read-only list of the neighbors sets or neighbors weights dicts of the rows of a CSR matrix """
+
+	def __init__(self, matrix, weights=False):
+		self.matrix = matrix
+		self.weights = weights
+
+	def __len__(self):
+		return self.matrix.shape[0]
+
+	def __getitem__(self, vertex):
+		start, end = self.matrix.indptr[vertex], self.matrix.indptr[vertex + 1]
+		if self.weights:
+			return dict(zip(self.matrix.indices[start:end].tolist(), self.matrix.data[start:end].tolist()))
+		return set(self.matrix.indices[start:end].tolist())
+
+	def __iter__(self):
+		for vertex in xrange(len(self)):
+			yield self[vertex]
+
+class EdgeKeys(object):
+	""" Set-like membership of the edges of a graph, by a binary search of its sorted keys """
+
+	def __init__(self, graph):
+		self.graph = graph
+
+	def __len__(self):
+		return self.graph.ecount()
+
+	def __contains__(self, pair):
+		return self.graph.edge_positions([pair[0]], [pair[1]])[0] >= 0
+
+class SharedGraph(Coarsening):
+
+	def __init__(self, descriptor):
+		self.descriptor = descriptor
+		self.arrays = attach(descriptor)
+		self.attributes = dict(descriptor['attributes'])
+		self.vs = {'type': self.arrays['types'], 'weight': self.arrays['vertex_weights']}
+		n = self.vcount()
+		self._weight = sp.csr_matrix((self.arrays['data'], self.arrays['indices'], self.arrays['indptr']), shape=(n, n), copy=False)
+		self._adjacency = sp.csr_matrix((self.arrays['ones'], self.arrays['indices'], self.arrays['indptr']), shape=(n, n), copy=False)
+
+	def __getitem__(self, name):
+		""" Attributes of the graph """
+		if name == 'adjlist':
+			return CSRList(self._adjacency)
+		if name == 'hierarchy':
+			maps = [self.arrays['map%d' % level] for level in range(self.attributes['maps'])]
+			return Hierarchy(len(self.arrays['membership']), maps, self.arrays['membership'])
+		if name == 'ids' and 'ids0' in self.arrays:
+			return [self.arrays['ids%d' % layer] for layer in range(self.attributes['layers'])]
+		return self.attributes[name]
+
+	def __setitem__(self, name, value):
+		""" Attributes of the graph in this process, like its similarity index """
+		self.attributes[name] = value
+
+	def vcount(self):
+		return len(self.arrays['types'])
+
+	def ecount(self):
+		return self.attributes['ecount']
+
+	def degrees(self):
+		""" Degree of each vertex """
+		return self.arrays['degree']
+
+	def weight_matrix(self):
+		""" CSR matrix of the edges weights of the graph """
+		return self._weight
+
+	def adjacency_matrix(self):
+		""" Binary CSR adjacency matrix of the graph """
+		return self._adjacency
+
+	def weight_lookup(self):
+		""" Dict of the neighbors weights of each vertex, built when a vertex is queried """
+		return CSRList(self._weight, weights=True)
+
+	def edge_positions(self, rows, cols):
+		""" Positions of the (rows, cols) entries in the CSR matrices, -1 for the missing ones """
+		keys = np.asarray(rows, dtype=np.int64) * self.vcount() + np.asarray(cols, dtype=np.int64)
+		positions = np.searchsorted(self.arrays['keys'], keys)
+		found = positions < len(self.arrays['keys'])
+		found[found] = self.arrays['keys'][positions[found]] == keys[found]
+		return np.where(found, positions, -1)
+
+	def edge_set(self):
+		""" Set-like membership of the (source, target) edges of the graph """
+		return EdgeKeys(self)
+
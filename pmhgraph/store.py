@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Store of coarsening hierarchies
+==========================
+
+The matching of each level of a hierarchy is kept on disk, keyed by the
+graph it starts from and by the parameters of the coarsening (layers,
+method, similarity, reduction factors and seed). The coarse graphs are
+rebuilt from the matchings by the coarsening, which is deterministic, so
+only the matchings are stored. The least recently used hierarchies are
+evicted when the store grows over its size limit.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+def hierarchy_key(graph, *parameters):
+	""" Key of the hierarchy of the graph coarsened with the parameters """
+	sha1 = hashlib.sha1()
+	# The edges are read from the weights matrix, which every kind of graph provides.
+	weight = graph.weight_matrix()
+	sha1.update(np.asarray(weight.indptr, dtype=np.int64).tobytes())
+	sha1.update(np.asarray(weight.indices, dtype=np.int64).tobytes())
+	sha1.update(np.asarray(weight.data, dtype=np.float64).tobytes())
+	sha1.update(np.asarray(graph.vs['type'], dtype=np.int64).tobytes())
+	sha1.update(np.asarray(graph.vs['weight'], dtype=np.float64).tobytes())
+	sha1.update(repr((graph['level'],) + parameters))
+	return sha1.hexdigest()
+
+def load_hierarchy(store, key):
+	"""
+	Matchings and merges of the stored levels of a hierarchy, from the first
+	level up to the first missing one. Loading marks the hierarchy as used
+	"""
+	path = os.path.join(store, key)
+	levels = []
+	if not os.path.isdir(path):
+		return levels
+	os.utime(path, None)
+	while os.path.exists(os.path.join(path, 'merges%d.npy' % (len(levels) + 1))):
+		level = len(levels) + 1
+		matching = np.load(os.path.join(path, 'matching%d.npy' % level), mmap_mode='r')
+		merges = [tuple(merge) for merge in np.load(os.path.join(path, 'merges%d.npy' % level)).tolist()]
+		levels.append((matching, merges))
+	return levels
+
+def save_level(store, key, level, matching, merges):
+	""" Stores the matching and the merges of a level of a hierarchy """
+	path = os.path.join(store, key)
+	if not os.path.isdir(path):
+		try:
+			os.makedirs(path)
+		except OSError:
+			# Another process created the same hierarchy first.
+			pass
+	# The merges are written last, so a level is only seen once its matching is complete.
+	for name, array in (('matching', np.asarray(matching, dtype=np.int64)), ('merges', np.asarray(merges, dtype=np.int64).reshape(-1, 3))):
+		descriptor, temporary = tempfile.mkstemp(dir=path, suffix='.npy')
+		with os.fdopen(descriptor, 'wb') as f:
+			np.save(f, array)
+		os.rename(temporary, os.path.join(path, '%s%d.npy' % (name, level)))
+
+def evict(store, limit):
+	""" Removes the least recently used hierarchies until the store fits in limit bytes """
+	if not os.path.isdir(store):
+		return
+	entries = []
+	for entry in os.listdir(store):
+		path = os.path.join(store, entry)
+		if os.path.isdir(path):
+			size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+			entries.append((os.path.getmtime(path), size, path))
+	total = sum(size for _, size, _ in entries)
+	for _, size, path in sorted(entries):
+		if total <= limit:
+			break
+		shutil.rmtree(path, ignore_errors=True)
+		total -= size
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import Queue
+import argparse
+import threading
+import urlparse
+import BaseHTTPServer
+import SocketServer
+
+from collections import defaultdict
+
+from input_graph.load import load_bipartite
+from lp.recommender import Recommender
+from main import coarse_graph
+
+
+# Micro-batching of the queries of a recommender model. The queries that arrive within window seconds
+# of the first one (up to max_batch) are answered by one batch of the model, in a single thread, so the
+# model and its cache are never shared between threads. Keeps the counters of the queries.
+class Batcher(object):
+
+    def __init__(self, model, window=0.005, max_batch=256):
+        self.model = model
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = Queue.Queue()
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.counters = {'requests': 0, 'batches': 0, 'errors': 0, 'latency': 0.0, 'max_latency': 0.0}
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    # Best n items of a user, waiting for the batch of the query.
+    def submit(self, user, n):
+        if not 0 <= user < len(self.model.types) or self.model.types[user] != 0:
+            raise ValueError('The vertex %d is not a user.' % user)
+        query = {'user': user, 'n': n, 'start': time.time(), 'done': threading.Event()}
+        self.queue.put(query)
+        query['done'].wait()
+        if 'error' in query:
+            raise query['error']
+        return query['result']
+
+    # Collects the queries of each batch and answers them by the model.
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except Queue.Empty:
+                    break
+            try:
+                self.answer(batch)
+            except Exception as error:
+                # A failure out of the model leaves the queries without answer with its error.
+                for query in batch:
+                    if 'result' not in query:
+                        query.setdefault('error', error)
+            finally:
+                # The queries are always released, so a failure never blocks their threads.
+                for query in batch:
+                    query['done'].set()
+
+    # Answers the queries of a batch by the model and counts them.
+    def answer(self, batch):
+        # Queries of different sizes n are answered by different batches of the model.
+        groups = defaultdict(list)
+        for query in batch:
+            groups[query['n']].append(query)
+        for n, queries in groups.items():
+            try:
+                results = self.model.recommend_many([query['user'] for query in queries], n)
+                for query, result in zip(queries, results):
+                    query['result'] = result
+            except Exception as error:
+                for query in queries:
+                    query['error'] = error
+        end = time.time()
+        with self.lock:
+            self.counters['batches'] += 1
+            for query in batch:
+                latency = end - query['start']
+                self.counters['requests'] += 1
+                self.counters['errors'] += 'error' in query
+                self.counters['latency'] += latency
+                self.counters['max_latency'] = max(self.counters['max_latency'], latency)
+
+    # Latency and throughput counters of the answered queries.
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+        elapsed = time.time() - self.start_time
+        requests = counters['requests']
+        return {'requests': requests, 'batches': counters['batches'], 'errors': counters['errors'],
+                'mean_batch': float(requests) / counters['batches'] if counters['batches'] else 0.0,
+                'mean_latency_ms': 1000.0 * counters['latency'] / requests if requests else 0.0,
+                'max_latency_ms': 1000.0 * counters['max_latency'],
+                'throughput': requests / elapsed if elapsed > 0 else 0.0,
+                'uptime': elapsed}
+
+
+# Handler of the queries: GET /recommend?user=<vertex>&n=<items> and GET /stats.
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        query = urlparse.parse_qs(url.query)
+        try:
+            if url.path == '/recommend':
+                user = int(query['user'][0])
+                n = int(query.get('n', ['10'])[0])
+                items = self.server.batcher.submit(user, n)
+                self.reply(200, {'user': user, 'items': [[item, score] for item, score in items]})
+            elif url.path == '/stats':
+                self.reply(200, self.server.batcher.stats())
+            else:
+                self.reply(404, {'error': 'Unknown path %s.' % url.path})
+        except (KeyError, ValueError) as error:
+            self.reply(400, {'error': str(error)})
+        except Exception as error:
+            self.reply(500, {'error': str(error)})
+
+    def reply(self, status, body):
+        body = json.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # The queries are not logged.
+    def log_message(self, format, *args):
+        pass
+
+
+# Server of a recommender model, with a thread for each connection.
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address, batcher):
+        BaseHTTPServer.HTTPServer.__init__(self, address, Handler)
+        self.batcher = batcher
+
+
+if __name__ == "__main__":
+    # Parse options command line
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-mo', '--model', action='store', dest='model', help='[File of the recommender model, built from -f when it does not exist]', type=str)
+    parser.add_argument('-f', '--filename', action='store', dest='filename', help='[Bipartite Graph]', type=str, default=None)
+    parser.add_argument('-ca', '--cache', action='store', dest='cache', help='[Cache directory of the loaded graphs (default: None)]', type=str, default=None)
+    parser.add_argument('-m', '--ml', action="store", dest='max_levels', type=int, default=0, help='[Levels of coarsening of the model (default: 0)]')
+    parser.add_argument('-r', '--rf', action='store', dest='reduction_factor', type=float, nargs='+', help='[Reduction factor for each layer (default: None)]')
+    parser.add_argument('-H', '--host', action='store', dest='host', help='[Host of the server (default: 127.0.0.1)]', type=str, default='127.0.0.1')
+    parser.add_argument('-p', '--port', action='store', dest='port', help='[Port of the server (default: 8000)]', type=int, default=8000)
+    parser.add_argument('-bw', '--batchwindow', action='store', dest='window', help='[Time in ms that a batch waits for queries (default: 5)]', type=float, default=5)
+    parser.add_argument('-bs', '--batchsize', action='store', dest='max_batch', help='[Maximum number of queries of a batch (default: 256)]', type=int, default=256)
+    options = parser.parse_args()
+
+    if options.model is None:
+        parser.error("required -mo [model] arg.")
+    if os.path.exists(options.model):
+        # The model is warm loaded from its file.
+        model = Recommender.load(options.model)
+    elif options.filename is None:
+        parser.error("required -f [filename] arg to build the model.")
+    else:
+        graph = load_bipartite(options.filename, options.cache)
+        if options.reduction_factor is None:
+            options.reduction_factor = [0.5] * len(graph["vertices"])
+        coarse = coarse_graph(graph, 'common_neighbors', options.max_levels, 0, options.reduction_factor, range(graph['layers']))
+        model = Recommender(coarse, fine=graph)
+        model.save(options.model)
+
+    server = Server((options.host, options.port), Batcher(model, options.window / 1000.0, options.max_batch))
+    print "Serving on http://%s:%d" % (options.host, options.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
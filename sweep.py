@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import time
+import random
+import argparse
+
+from itertools import izip, product
+from multiprocessing import Pool
+
+from input_graph.load import load_bipartite
+from pmhgraph.fold import prepare
+from pmhgraph.shared import SharedGraph, share, release
+from main import coarse_graph, fold_sets, fold_graph, evaluate, write_header, write_row, positive_int
+
+# Layers that are coarsened and the directory of its output files.
+LAYERS = [([0, 1], '2layers'), ([0], 'userlayer'), ([1], 'itemlayer')]
+# Coarsening methods (0 - greed, 1 - random greed) and its codes.
+CONTRACTS = [(0, 'greedy'), (1, 'randgreedy')]
+# The similarity functions that will be used for coarserning the graph.
+SIMILARITIES_CONTRACT = [('common_neighbors', 'cn')]
+# The similarity functions that will be used for link prediction.
+SIMILARITIES = [('common_neighbors', 'cn')]
+
+# State of the sweep, shared with the workers by fork.
+_sweep = {}
+
+# Initializer of the workers of the sweep. The base graph is attached from its shared arrays, so the
+# workers never touch (and copy) the Python objects of the graph of the parent.
+def attach_sweep(descriptor):
+    random.seed()
+    _sweep['graph'] = SharedGraph(descriptor)
+
+# Evaluates the folds without coarsening (level 0). The level only depends on the similarity of the
+# prediction, so it is evaluated once for all the configurations. Returns the rows of the level.
+def run_original(similarity):
+    options = _sweep['options']
+    rows = []
+    for probe_set in _sweep['sets']:
+        fold = fold_graph(_sweep['graph'], probe_set)
+        rows.append(evaluate(fold, fold, probe_set, similarity, _sweep['precisions'], _sweep['aucs'], options.topk, options.globaltopk, options.exact_auc, seed=options.seed))
+    return rows
+
+# Runs a configuration over every fold. The levels are coarsened one over the other and each one is
+# evaluated as soon as it is built, so a single pass gives the results of the levels 1 to max levels.
+# The time of a level counts the coarsening up to it and its prediction. Returns the rows of each level.
+def run_configuration(configuration):
+    (layers, _), (contract, _), (contract_similarity, _), (similarity, _) = configuration
+    options = _sweep['options']
+    rows = [[] for level in range(options.max_levels)]
+    for probe_set in _sweep['sets']:
+        fold = fold_graph(_sweep['graph'], probe_set)
+        coarse = fold
+        levels = []
+        coarsening_time = 0.0
+        for level in range(1, options.max_levels + 1):
+            start_time = time.time()
+            coarse = coarse_graph(coarse, contract_similarity, level, contract, options.reduction_factor, layers, seed=options.seed, in_process=True, store=options.store, store_limit=options.store_limit, levels=levels)
+            coarsening_time += time.time() - start_time
+            precision_values, auc_values, prediction_time = evaluate(fold, coarse, probe_set, similarity, _sweep['precisions'], _sweep['aucs'], options.topk, options.globaltopk, options.exact_auc, levels, options.refine, seed=options.seed)
+            rows[level - 1].append((precision_values, auc_values, coarsening_time + prediction_time))
+    return rows
+
+if __name__ == "__main__":
+    # Parse options command line
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--filename', action='store', dest='filename', help='[Bipartite Graph]', type=str)
+    parser.add_argument('-ca', '--cache', action='store', dest='cache', help='[Cache directory of the loaded graphs (default: None)]', type=str, default=None)
+    parser.add_argument('-cs', '--chunksize', action='store', dest='chunk_size', help='[Streams the bipartite graph in chunks of rows (default: None)]', type=int, default=None)
+    parser.add_argument('-o', '--output', action='store', dest='output', help='[Output directory (default: output)]', type=str, default='output')
+    parser.add_argument('-r', '--rf', action='store', dest='reduction_factor', type=float, nargs='+', help='[Reduction factor for each layer (default: None)]')
+    parser.add_argument('-m', '--ml', action="store", dest='max_levels', type=int, default=5, help='[Max levels (default: 5)]')
+    parser.add_argument('-sd', '--seed', action="store", dest='seed', type=int, default=None, help='[Seed of the random greed matching, the sampled candidates and the sampled AUC (default: None)]')
+    parser.add_argument('-k', '--topk', action="store", dest='topk', type=int, default=None, help='[Keeps only the k best candidates of each user (default: None)]')
+    parser.add_argument('-kg', '--globaltopk', action="store_true", dest='globaltopk', default=False, help='[The k best candidates are kept for the whole graph instead of each user]')
+    parser.add_argument('-pr', '--precisions', action="store", dest='precisions', type=positive_int, nargs=3, default=[1, 2, 1], help='[Range (from, to, step) of the sizes L of the precision (default: 1 2 1)]')
+    parser.add_argument('-au', '--aucs', action="store", dest='aucs', type=positive_int, nargs=3, default=[1, 2, 1], help='[Range (from, to, step) of the comparisons of the AUC (default: 1 2 1)]')
+    parser.add_argument('-ea', '--exactauc', action="store_true", dest='exact_auc', default=False, help='[Calculates the exact AUC by the ranks of the scores instead of sampled comparisons]')
+    parser.add_argument('-hs', '--hierarchystore', action='store', dest='store', help='[Directory where the coarsening hierarchies are stored (default: None)]', type=str, default=None)
+    parser.add_argument('-hl', '--hierarchylimit', action='store', dest='store_limit', help='[Size limit of the hierarchy store in MB (default: 1024)]', type=float, default=1024)
+    parser.add_argument('-rc', '--refine', action="store", dest='refine', type=int, default=None, help='[Uncoarsens the predictions level by level, re-ranking the best candidates of all the users by the similarity index at each level (default: None)]')
+    parser.add_argument('-w', '--workers', action="store", dest='workers', type=int, default=1, help='[Workers that run the configurations in parallel (default: 1)]')
+    options = parser.parse_args()
+
+    if options.filename is None:
+        parser.error("required -f [filename] arg.")
+    # Loads the bipartite graph once for every configuration.
+    graph = load_bipartite(options.filename, options.cache, options.chunk_size)
+
+    if options.reduction_factor is None:
+        # Sets the reduction factor parameter.
+        options.reduction_factor = [0.5] * len(graph["vertices"])
+    if len(graph["vertices"]) != len(options.reduction_factor):
+        parser.error("Sizes of input arguments -n and -r do not match.")
+    # The size limit of the hierarchy store is given in MB.
+    options.store_limit = int(options.store_limit * 1024 * 1024)
+    # Sizes of the precision and the AUC.
+    precisions = range(*options.precisions)
+    aucs = range(*options.aucs)
+    if len(precisions) == 0 or len(aucs) == 0:
+        parser.error("The ranges of -pr and -au must not be empty.")
+    if options.topk is not None and options.globaltopk and options.topk < max(precisions):
+        parser.error("The global top -k must be at least the greatest precision size.")
+
+    # k-fold cross validation parameter.
+    k = 10
+
+    # The folds are shared with the workers by fork.
+    _sweep.update({'sets': fold_sets(graph, k), 'options': options, 'precisions': precisions, 'aucs': aucs})
+    configurations = list(product(LAYERS, CONTRACTS, SIMILARITIES_CONTRACT, SIMILARITIES))
+    if options.workers > 1:
+        # The workers attach to the arrays of the base graph and every worker draws its own random samples.
+        descriptor = share(graph)
+        pool = Pool(options.workers, initializer=attach_sweep, initargs=(descriptor,))
+        originals = pool.map(run_original, [similarity for similarity, _ in SIMILARITIES])
+        results = pool.imap(run_configuration, configurations)
+    else:
+        _sweep['graph'] = prepare(graph)
+        originals = map(run_original, [similarity for similarity, _ in SIMILARITIES])
+        results = (run_configuration(configuration) for configuration in configurations)
+    # The rows of the level 0 of each similarity of the prediction.
+    originals = dict(izip([similarity for similarity, _ in SIMILARITIES], originals))
+    # Writes the output file of each level of a configuration, in the order of the configurations.
+    for executed, (configuration, rows) in enumerate(izip(configurations, results)):
+        (_, layers_code), (_, contract_code), (_, contract_similarity_code), (similarity, similarity_code) = configuration
+        directory = os.path.join(options.output, layers_code)
+        if not os.path.exists(directory): os.makedirs(directory)
+        for level, level_rows in enumerate([originals[similarity]] + rows):
+            output_file = open(os.path.join(directory, "%s_%s_%s_%d.csv" % (contract_code, contract_similarity_code, similarity_code, level)), 'w')
+            write_header(output_file, precisions, aucs)
+            for precision_values, auc_values, elapsed_time in level_rows:
+                write_row(output_file, precision_values, auc_values, elapsed_time)
+            output_file.close()
+        print "(%d/%d)" % (executed + 1, len(configurations))
+    if options.workers > 1:
+        pool.close()
+        pool.join()
+        release(descriptor)
@@ -0,0 +1,10 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from input_graph.generate import generate_bipartite
+from input_graph.load import build_bipartite
+
+
+# Small power law bipartite graph of the tests, built like a loaded rates file. The users and items
+# without rates are dropped, so the graph may have less vertices than requested.
+def random_graph(users=20, items=30, rates=120, seed=0):
+    return build_bipartite(*generate_bipartite(users, items, float(rates) / (users * items), seed=seed))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+
+import numpy as np
+
+from measures.similarity import Similarity
+from lp.collaborative_filtering import *
+from tests.graphs import random_graph
+
+
+# Weighted sum of the Adomavicius paper computed pair by pair with the scalar index, the reference of
+# the batched kernels. The kappa of a candidate is 1.0 / sum of the similarities, or 0 without them.
+def reference_weighted_sum(graph, index):
+    similarity = Similarity(graph, graph['adjlist'])
+    index = getattr(similarity, index)
+    types = graph.vs['type']
+    users = [vertex for vertex in range(graph.vcount()) if types[vertex] == 0]
+    items = [vertex for vertex in range(graph.vcount()) if types[vertex] != 0]
+    weights = {}
+    for edge in graph.es:
+        weights[edge.tuple] = weights[edge.tuple[::-1]] = edge['weight']
+    ranking = {}
+    for i in users:
+        for j in items:
+            if (i, j) in weights:
+                continue
+            total, similarities_sum = 0.0, 0.0
+            for k in graph['adjlist'][j]:
+                total += index(i, k) * weights[(k, j)]
+                similarities_sum += index(i, k)
+            ranking[(i, j)] = total / similarities_sum if similarities_sum != 0 else 0.0
+    return ranking
+
+
+class WeightedSumTest(unittest.TestCase):
+
+    def assertRankingEqual(self, ranking, reference):
+        self.assertEqual(sorted(ranking), sorted(reference))
+        keys = sorted(reference)
+        np.testing.assert_allclose([ranking[key] for key in keys], [reference[key] for key in keys], rtol=1e-9, atol=1e-12)
+
+    def test_matches_the_scalar_reference(self):
+        for seed in range(3):
+            graph = random_graph(seed=seed)
+            for index in ('common_neighbors', 'jaccard_index', 'adamic_adar', 'weighted_common_neighbors', 'preferential_attachment'):
+                ranking = collaborative_filtering_weighted_sum(Similarity(graph, graph['adjlist']), index)
+                self.assertRankingEqual(ranking, reference_weighted_sum(graph, index))
+
+    def test_blocks_do_not_change_the_scores(self):
+        graph = random_graph(seed=4)
+        reference = reference_weighted_sum(graph, 'common_neighbors')
+        for block_size in (1, 3, 1024):
+            ranking = collaborative_filtering_weighted_sum(Similarity(graph, graph['adjlist']), 'common_neighbors', block_size)
+            self.assertRankingEqual(ranking, reference)
+
+    def test_matrix_and_pair_scores_match_the_ranking(self):
+        graph = random_graph(seed=5)
+        similarity = Similarity(graph, graph['adjlist'])
+        reference = reference_weighted_sum(graph, 'common_neighbors')
+        users, items, matrix = collaborative_filtering_matrix(similarity, 'common_neighbors', block_size=4)
+        position = dict((vertex, row) for row, vertex in enumerate(users.tolist()))
+        position.update((vertex, col) for col, vertex in enumerate(items.tolist()))
+        for (i, j), value in reference.items():
+            self.assertAlmostEqual(matrix[position[i], position[j]], value)
+        pairs = sorted(reference)[::7]
+        scores = collaborative_filtering_pair_scores(similarity, 'common_neighbors', pairs)
+        for pair in pairs:
+            self.assertAlmostEqual(scores[pair], reference[pair])
+
+
+class TopKTest(unittest.TestCase):
+
+    def test_per_user_top_k_keeps_the_best_candidates_of_each_user(self):
+        graph = random_graph(seed=6)
+        reference = reference_weighted_sum(graph, 'common_neighbors')
+        for k in (1, 3, 100):
+            rows, cols, values = ranking_arrays(weighted_sum_blocks(Similarity(graph, graph['adjlist']), 'common_neighbors', 4), k)
+            for user in set(i for i, j in reference):
+                expected = sorted((value for (i, j), value in reference.items() if i == user), reverse=True)[:k]
+                selected = rows == user
+                np.testing.assert_allclose(sorted(values[selected].tolist(), reverse=True), expected)
+                for item, value in zip(cols[selected].tolist(), values[selected].tolist()):
+                    self.assertAlmostEqual(reference[(user, item)], value)
+
+    def test_global_top_k_keeps_the_best_candidates(self):
+        graph = random_graph(seed=7)
+        reference = reference_weighted_sum(graph, 'common_neighbors')
+        for k in (1, 10, len(reference) + 5):
+            ranking = collaborative_filtering_weighted_sum(Similarity(graph, graph['adjlist']), 'common_neighbors', 4, k, per_user=False)
+            np.testing.assert_allclose(sorted(ranking.values(), reverse=True), sorted(reference.values(), reverse=True)[:k])
+            for pair, value in ranking.items():
+                self.assertAlmostEqual(reference[pair], value)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+
+import numpy as np
+
+from lp.evaluation import *
+
+
+# AUC by the comparison of every probe score with every non probe score, ties count a half.
+def reference_auc(scores, mask):
+    probes, others = scores[mask], scores[~mask]
+    wins = sum((probe > other) + 0.5 * (probe == other) for probe in probes for other in others)
+    return wins / float(len(probes) * len(others))
+
+
+# Scores with many ties and the mask of a random probe set.
+def random_ranking(seed, size=300):
+    generator = np.random.RandomState(seed)
+    return np.round(generator.rand(size), 1), generator.rand(size) < 0.2
+
+
+class PrecisionTest(unittest.TestCase):
+
+    def test_precision_counts_the_greatest_scores(self):
+        # The probes are the best scored candidates, so every cutoff up to their number is a full hit.
+        scores = np.array([0.1, 0.9, 0.3, 0.8, 0.2, 0.7])
+        mask = np.array([False, True, False, True, False, True])
+        np.testing.assert_allclose(precision_at(scores, mask, [1, 2, 3, 6]), [1.0, 1.0, 1.0, 0.5])
+        np.testing.assert_allclose(precision_at(-scores, mask, [1, 3, 4]), [0.0, 0.0, 0.25])
+
+    def test_matches_the_sorted_ranking(self):
+        for seed in range(3):
+            generator = np.random.RandomState(seed)
+            scores, mask = generator.rand(500), generator.rand(500) < 0.1
+            hits = mask[np.argsort(-scores)]
+            cutoffs = range(1, 600, 37)
+            expected = [hits[:cutoff].sum() / float(cutoff) for cutoff in cutoffs]
+            np.testing.assert_allclose(precision_at(scores, mask, cutoffs), expected)
+
+    def test_cutoffs_must_be_positive(self):
+        self.assertRaises(ValueError, precision_at, [0.5, 0.2], [True, False], [0, 1])
+
+
+
+class AUCTest(unittest.TestCase):
+
+    def test_exact_auc_matches_the_pairwise_comparisons(self):
+        for seed in range(3):
+            scores, mask = random_ranking(seed)
+            self.assertAlmostEqual(exact_auc(scores, mask), reference_auc(scores, mask))
+        self.assertEqual(exact_auc([0.1, 0.2], [False, False]), 0.0)
+
+    def test_sampled_auc_at_shares_one_pool_of_comparisons(self):
+        scores, mask = random_ranking(3)
+        cutoffs = [1, 10, 100, 1000]
+        values = sampled_auc_at(scores, mask, cutoffs, seed=7)
+        # The greatest cutoff draws the same comparisons of sampled_auc with the same seed.
+        self.assertAlmostEqual(values[-1], sampled_auc(scores, mask, 1000, seed=7))
+        generator = np.random.RandomState(7)
+        probes = scores[mask][generator.randint(mask.sum(), size=1000)]
+        others = scores[~mask][generator.randint((~mask).sum(), size=1000)]
+        wins = (probes > others) + 0.5 * (probes == others)
+        np.testing.assert_allclose(values, [wins[:cutoff].mean() for cutoff in cutoffs])
+
+    def test_sampled_auc_converges_to_the_exact_auc(self):
+        scores, mask = random_ranking(4)
+        self.assertAlmostEqual(sampled_auc(scores, mask, 200000, seed=0), exact_auc(scores, mask), delta=0.01)
+
+    def test_evaluate_cutoffs_returns_every_cutoff(self):
+        scores, mask = random_ranking(5)
+        precision_values, auc_values = evaluate_cutoffs(scores, mask, [1, 5, 50], [10, 20], exact=True)
+        np.testing.assert_allclose(precision_values, precision_at(scores, mask, [1, 5, 50]))
+        np.testing.assert_allclose(auc_values, [reference_auc(scores, mask)] * 2)
+        precision_values, auc_values = evaluate_cutoffs(scores, mask, [1], [10, 20], seed=3)
+        np.testing.assert_allclose(auc_values, sampled_auc_at(scores, mask, [10, 20], seed=3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+
+import numpy as np
+
+from measures.similarity import Similarity
+from pmhgraph.fold import FoldView, prepare
+from tests.graphs import random_graph
+
+
+# View of the graph without every fifth edge and the graph with those edges deleted, its reference.
+def fold(seed):
+    graph = prepare(random_graph(users=30, items=40, rates=300, seed=seed))
+    probes = graph.get_edgelist()[seed::5]
+    reference = graph.copy()
+    reference.delete_edges(probes)
+    reference['adjlist'] = map(set, reference.get_adjlist())
+    return graph, FoldView(graph, probes), reference
+
+
+class FoldViewTest(unittest.TestCase):
+
+    def test_indexes_drop_the_probe_edges(self):
+        graph, view, reference = fold(0)
+        self.assertEqual(view.ecount(), reference.ecount())
+        np.testing.assert_array_equal(view.degrees(), reference.degrees())
+        np.testing.assert_array_equal(view.weight_matrix().toarray(), reference.weight_matrix().toarray())
+        np.testing.assert_array_equal(view.adjacency_matrix().toarray(), reference.adjacency_matrix().toarray())
+        self.assertEqual(list(view['adjlist']), reference['adjlist'])
+
+    def test_coarsening_matches_the_graph_without_the_probes(self):
+        for seed in range(3):
+            graph, view, reference = fold(seed)
+            matching = np.arange(graph.vcount())
+            generator = np.random.RandomState(seed)
+            for layer in range(graph['layers']):
+                vertices = generator.permutation(np.flatnonzero(np.asarray(graph.vs['type']) == layer))
+                pairs = vertices[:len(vertices) // 2 * 2].reshape(-1, 2)
+                matching[pairs[:, 0]], matching[pairs[:, 1]] = pairs[:, 1], pairs[:, 0]
+            coarse, expected = view.coarsening(matching), reference.coarsening(matching)
+            self.assertEqual(coarse.vs['type'], expected.vs['type'])
+            self.assertEqual(coarse.vs['weight'], expected.vs['weight'])
+            self.assertEqual(coarse['vertices'], expected['vertices'])
+            self.assertEqual(coarse.get_edgelist(), expected.get_edgelist())
+            np.testing.assert_allclose(coarse.es['weight'], expected.es['weight'])
+            np.testing.assert_array_equal(coarse['hierarchy'].membership, expected['hierarchy'].membership)
+
+    def test_greed_matching_matches_the_graph_without_the_probes(self):
+        graph, view, reference = fold(4)
+        for target in (view, reference):
+            target['similarity'] = getattr(Similarity(target, target['adjlist']), 'common_neighbors')
+        # The similarity of the view does not replace the attributes of the base graph.
+        self.assertNotIn('similarity', graph.attributes())
+        for layer in range(graph['layers']):
+            vertices = np.flatnonzero(np.asarray(graph.vs['type']) == layer)
+            for max_candidates in (None, 3):
+                matching, expected = np.arange(graph.vcount()), np.arange(graph.vcount())
+                self.assertEqual(view.greed_two_hops(vertices, 0.5, matching, max_candidates), reference.greed_two_hops(vertices, 0.5, expected, max_candidates))
+                np.testing.assert_array_equal(matching, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+
+import numpy as np
+
+from input_graph.generate import RATES, dense_ids, generate_bipartite, generate_ratings
+from input_graph.load import DenseIds
+
+
+# Dense IDs of the original loop: each new ID gets the next dense ID in the order of appearance.
+def reference_dense_ids(ids):
+    dense = {}
+    for value in ids:
+        dense.setdefault(value, len(dense))
+    return [dense[value] for value in ids], sorted(dense, key=dense.get)
+
+
+class DenseIdsTest(unittest.TestCase):
+
+    def test_matches_the_order_of_appearance(self):
+        generator = np.random.RandomState(0)
+        # Sorted IDs, small unsorted IDs and sparse (or negative) unsorted IDs.
+        cases = [np.sort(generator.randint(50, size=100)), generator.randint(50, size=100),
+                 generator.randint(-10 ** 9, 10 ** 9, size=100), np.repeat([10 ** 12, 3, 7], 4), np.empty(0, dtype=np.int64)]
+        for ids in cases:
+            expected, originals = reference_dense_ids(ids.tolist())
+            dense, unique = dense_ids(ids)
+            self.assertEqual(dense.tolist(), expected)
+            self.assertEqual(unique.tolist(), originals)
+            if len(ids):
+                # The same IDs of a streamed file.
+                streamed = DenseIds()
+                self.assertEqual(streamed(ids).tolist(), expected)
+                self.assertEqual(streamed.originals().tolist(), originals)
+
+
+class GenerateTest(unittest.TestCase):
+
+    def test_rates_follow_the_requested_sizes(self):
+        users, items, density = 500, 800, 0.01
+        user_ids, item_ids, rates = generate_ratings(users, items, density, seed=3)
+        size = int(round(density * users * items))
+        self.assertEqual(len(user_ids), size)
+        self.assertTrue((0 <= user_ids).all() and (user_ids < users).all())
+        self.assertTrue((0 <= item_ids).all() and (item_ids < items).all())
+        # Distinct pairs, sorted by user and item.
+        keys = user_ids.astype(np.int64) * items + item_ids
+        self.assertTrue((np.diff(keys) > 0).all())
+        self.assertTrue(set(rates) <= set(RATES))
+        for expected, generated in zip(generate_ratings(users, items, density, seed=3), (user_ids, item_ids, rates)):
+            np.testing.assert_array_equal(generated, expected)
+        self.assertRaises(ValueError, generate_ratings, users, items, 0.0)
+
+    def test_degrees_follow_a_power_law(self):
+        users, items = 2000, 3000
+        user_ids, item_ids, _ = generate_ratings(users, items, 0.005, seed=4)
+        for ids, n in ((user_ids, users), (item_ids, items)):
+            degrees = np.sort(np.bincount(ids, minlength=n))[::-1]
+            # The most popular vertices hold a large share of the rates, far over their share of vertices.
+            self.assertGreater(degrees[:n // 10].sum(), 0.3 * len(ids))
+            self.assertGreater(degrees[0], 10 * np.median(degrees[degrees > 0]))
+        # The items follow the heavier tail.
+        self.assertGreater(np.bincount(item_ids).max(), np.bincount(user_ids).max())
+
+    def test_graph_arrays_use_dense_ids(self):
+        vertices, edges, weights, ids = generate_bipartite(100, 150, 0.05, seed=5)
+        self.assertEqual(vertices, [len(ids[0]), len(ids[1])])
+        self.assertEqual(len(edges), len(weights))
+        self.assertTrue((edges[:, 0] < vertices[0]).all())
+        self.assertTrue((edges[:, 1] >= vertices[0]).all() and (edges[:, 1] < sum(vertices)).all())
+        # Every dense ID has at least one edge.
+        self.assertEqual(len(np.unique(edges)), sum(vertices))
+
+
+if __name__ == '__main__':
+    unittest.main()
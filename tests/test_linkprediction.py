@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+
+import numpy as np
+
+from measures.similarity import Similarity
+from lp.linkprediction import *
+from tests.graphs import random_graph
+
+
+# Score of a candidate pair (i, j) of different types computed by the scalar index: the index between i
+# and the neighbors of j, except the preferential attachment, which is calculated on the pair itself.
+def reference_score(similarity, index, i, j):
+    score = getattr(similarity, index)
+    if index == 'preferential_attachment':
+        return score(i, j)
+    return sum(score(i, k) for k in similarity.adjlist[j] if k != i)
+
+
+class LinkPredictionTest(unittest.TestCase):
+
+    def test_ranking_for_node_matches_the_scalar_reference(self):
+        graph = random_graph(seed=0)
+        similarity = Similarity(graph, graph['adjlist'])
+        types = graph.vs['type']
+        for index in ('common_neighbors', 'jaccard_index', 'adamic_adar', 'preferential_attachment'):
+            for node in (0, 3, graph.vcount() - 1):
+                ranking = predict_ranking_for_node(similarity, index, node)
+                candidates = [j for j in range(graph.vcount()) if types[j] != types[node] and j not in graph['adjlist'][node]]
+                self.assertEqual(sorted(j for _, j in ranking), candidates)
+                # The scores may differ by the rounding of the sums, so the ties are not compared.
+                np.testing.assert_allclose([value for value, _ in ranking], [reference_score(similarity, index, node, j) for _, j in ranking], rtol=1e-9)
+                self.assertTrue(all(a >= b for (a, _), (b, _) in zip(ranking, ranking[1:])))
+
+    def test_most_likely_vertex_of_a_bipartite_graph(self):
+        graph = random_graph(seed=1)
+        similarity = Similarity(graph, graph['adjlist'])
+        users = [vertex for vertex in range(graph.vcount()) if graph.vs[vertex]['type'] == 0]
+        predictions = [predict_most_likely(similarity, 'common_neighbors', user) for user in users]
+        # Every user with a candidate item gets a prediction, the best scored by the scalar reference.
+        self.assertNotIn(-1, predictions)
+        for user, item in zip(users, predictions):
+            self.assertEqual(item, predict_ranking_for_node(similarity, 'common_neighbors', user)[0][1])
+            self.assertNotIn(item, graph['adjlist'][user])
+
+    def test_ranking_keeps_the_best_candidate_edges(self):
+        graph = random_graph(seed=2)
+        similarity = Similarity(graph, graph['adjlist'])
+        types = graph.vs['type']
+        pairs = [(i, j) for i in range(graph.vcount()) for j in range(i + 1, graph.vcount()) if types[i] != types[j] and j not in graph['adjlist'][i]]
+        # The pairs are scored from the user to the item.
+        expected = sorted((-reference_score(similarity, 'common_neighbors', *sorted((i, j), key=lambda vertex: types[vertex])), i, j) for i, j in pairs)
+        for k, block_size in ((None, 7), (5, 7), (5, None)):
+            ranking = predict_ranking(similarity, 'common_neighbors', k, block_size)
+            self.assertEqual([pair for _, pair in ranking], [(i, j) for _, i, j in expected[:k]])
+            np.testing.assert_allclose([value for value, _ in ranking], [-value for value, _, _ in expected[:k]])
+
+
+if __name__ == '__main__':
+    unittest.main()
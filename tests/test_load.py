@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from input_graph.load import load_bipartite, read_bipartite, stream_bipartite
+
+
+# Rates file with repeated (user, item) rows and sparse IDs, in the layout of the MovieLens files.
+ROWS = [(900000, 17, 4.0), (5, 10 ** 9, 3.0), (900000, 17, 1.0), (42, 17, 5.0), (5, 3, 2.0),
+        (42, 10 ** 9, 1.0), (5, 10 ** 9, 5.0), (900000, 3, 2.0), (900000, 17, 3.0)]
+
+
+class StreamBipartiteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file = os.path.join(self.directory, 'ratings.csv')
+        with open(self.file, 'w') as f:
+            f.write('userId,movieId,rating,timestamp\n')
+            for user, item, rate in ROWS:
+                f.write('%d,%d,%.1f,0\n' % (user, item, rate))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    # Dict of the rate of each (user, item) pair of the original IDs.
+    def original_rates(self, vertices, edges, weights, ids):
+        edges = np.asarray(edges)
+        return dict(((ids[0][u], ids[1][v - vertices[0]]), weight) for (u, v), weight in zip(edges.tolist(), np.asarray(weights).tolist()))
+
+    def test_repeated_rows_keep_the_first_position_and_the_last_rate(self):
+        for chunk_size in (1, 2, 4, 100):
+            vertices, edges, weights, ids = stream_bipartite(self.file, chunk_size)
+            # Dense IDs in the order of the first appearance.
+            self.assertEqual(vertices, [3, 3])
+            self.assertEqual(np.asarray(ids[0]).tolist(), [900000, 5, 42])
+            self.assertEqual(np.asarray(ids[1]).tolist(), [17, 10 ** 9, 3])
+            self.assertEqual(np.asarray(edges).tolist(), [[0, 3], [1, 4], [2, 3], [1, 5], [2, 4], [0, 5]])
+            self.assertEqual(np.asarray(weights).tolist(), [3.0, 5.0, 5.0, 2.0, 1.0, 2.0])
+
+    def test_matches_the_read_rates(self):
+        expected = read_bipartite(self.file)
+        streamed = stream_bipartite(self.file, 2)
+        self.assertEqual(streamed[0], expected[0])
+        self.assertEqual(self.original_rates(*streamed), self.original_rates(*expected))
+        # The cached arrays build the same graph.
+        cache = os.path.join(self.directory, 'cache')
+        for _ in range(2):
+            graph = load_bipartite(self.file, cache, chunk_size=2)
+            self.assertEqual(graph.get_edgelist(), [tuple(edge) for edge in streamed[1].tolist()])
+            self.assertEqual(graph.es['weight'], streamed[2].tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
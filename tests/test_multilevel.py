@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+
+import numpy as np
+
+from measures.similarity import Similarity
+from lp.collaborative_filtering import collaborative_filtering_matrix, top_k_per_row
+from lp.multilevel import normalized_scores, uncoarsening_blocks
+from tests.graphs import random_graph
+from tests.test_pmh import random_matching
+
+
+class UncoarseningTest(unittest.TestCase):
+
+    # Blocks of the scores of the original graph uncoarsened from its coarsened graph.
+    def uncoarsened(self, graph, coarse, refine):
+        users, items, scores = collaborative_filtering_matrix(Similarity(coarse, coarse['adjlist']), 'common_neighbors')
+        scores = normalized_scores(coarse, users, items, scores)
+        return list(uncoarsening_blocks(graph, coarse, scores, 'common_neighbors', refine, block_size=7))
+
+    def test_refine_ranks_the_best_candidates_by_the_index(self):
+        refine = 3
+        for seed in range(3):
+            graph = random_graph(seed=seed)
+            coarse = graph.coarsening(random_matching(graph, seed))
+            similarity = Similarity(graph, graph['adjlist'])
+            before, after, exact = [], [], []
+            for (users, items, block, projected, observed), refined in zip(self.uncoarsened(graph, coarse, 0), self.uncoarsened(graph, coarse, refine)):
+                refined = refined[3]
+                rows, cols, values = top_k_per_row(projected, observed, refine)
+                # Only the best candidates change.
+                unchanged = np.ones(projected.shape, dtype=bool)
+                unchanged[rows, cols] = False
+                np.testing.assert_array_equal(refined[unchanged], projected[unchanged])
+                before.append(values)
+                after.append(refined[rows, cols])
+                exact.append(similarity.score_cross_pairs('common_neighbors', users[block[rows]], items[cols]))
+            before, after, exact = np.concatenate(before), np.concatenate(after), np.concatenate(exact)
+            # The best candidates of all the users keep the projected scores, and the greater the index of
+            # a candidate, the greater its score.
+            np.testing.assert_array_equal(np.sort(after), np.sort(before))
+            self.assertTrue((np.diff(after[np.argsort(-exact, kind='mergesort')]) <= 0).all())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+from itertools import product
+
+import numpy as np
+
+from measures.similarity import Similarity
+from pmhgraph.pmh import best_candidates, greedy_matching
+from tests.graphs import random_graph
+
+
+# Random matching of the vertices of each layer of the graph, every vertex paired with another
+# vertex of its layer or with itself.
+def random_matching(graph, seed):
+    generator = np.random.RandomState(seed)
+    matching = np.arange(graph.vcount())
+    types = np.asarray(graph.vs['type'])
+    for layer in np.unique(types):
+        vertices = generator.permutation(np.flatnonzero(types == layer))
+        pairs = vertices[:len(vertices) // 3 * 2].reshape(-1, 2)
+        matching[pairs[:, 0]] = pairs[:, 1]
+        matching[pairs[:, 1]] = pairs[:, 0]
+    return matching
+
+
+# Coarsening of the original loop: the supervertices are numbered in the order of its first vertex
+# and the parallel super edges are merged by summing its weights. Returns the supervertex of each
+# vertex, the types and weights of the supervertices and the dict of the super edges weights.
+def reference_coarsening(graph, matching):
+    successor = {}
+    types, weights = [], []
+    for vertex in range(graph.vcount()):
+        if vertex in successor:
+            continue
+        pair = matching[vertex]
+        successor[vertex] = successor[pair] = len(types)
+        types.append(graph.vs[vertex]['type'])
+        weights.append(graph.vs[vertex]['weight'] + (graph.vs[pair]['weight'] if pair != vertex else 0))
+    edges = {}
+    for edge in graph.es:
+        u, v = successor[edge.tuple[0]], successor[edge.tuple[1]]
+        if u != v:
+            edges[(min(u, v), max(u, v))] = edges.get((min(u, v), max(u, v)), 0) + edge['weight']
+    return successor, types, weights, edges
+
+
+# Greedy pass of the original loop over the pairs sorted from the best to the worst. Returns the
+# positions of the matched pairs.
+def reference_greedy(u, v, merge_count):
+    matched, positions = set(), []
+    for position, (vertex, pair) in enumerate(zip(u, v)):
+        if len(positions) >= merge_count:
+            break
+        if vertex not in matched and pair not in matched:
+            matched.update((vertex, pair))
+            positions.append(position)
+    return positions
+
+
+class GreedyMatchingTest(unittest.TestCase):
+
+    # The matching pairs vertices of the layer that share a neighbor, the other vertices keep themselves.
+    def assertValidMatching(self, graph, vertices, matching, merges):
+        pairs = np.flatnonzero(matching != np.arange(graph.vcount()))
+        np.testing.assert_array_equal(matching[matching], np.arange(graph.vcount()))
+        self.assertTrue(set(pairs) <= set(vertices))
+        self.assertTrue(all(graph['adjlist'][u] & graph['adjlist'][matching[u]] for u in pairs))
+        self.assertEqual(merges, len(pairs) // 2)
+
+    def test_matches_the_greedy_pass(self):
+        generator = np.random.RandomState(0)
+        for trial in range(500):
+            n = generator.randint(2, 30)
+            u, v = generator.randint(n, size=(2, generator.randint(80)))
+            u, v = u[u != v], v[u != v]
+            merge_count = generator.randint(20) if trial % 2 else n
+            chunk_size = generator.randint(1, 20)
+            self.assertEqual(greedy_matching(u, v, merge_count, chunk_size).tolist(), reference_greedy(u.tolist(), v.tolist(), merge_count))
+
+    def test_greed_two_hops_matches_the_sorted_two_hops_pairs(self):
+        for seed in range(3):
+            graph = random_graph(users=40, items=60, rates=400, seed=seed)
+            graph['similarity'] = getattr(Similarity(graph, graph['adjlist']), 'common_neighbors')
+            adjlist = graph['adjlist']
+            for layer in range(graph['layers']):
+                vertices = [vertex for vertex in range(graph.vcount()) if graph.vs[vertex]['type'] == layer]
+                pairs = [(len(adjlist[u] & adjlist[v]), u, v) for u in vertices for v in vertices if u < v and adjlist[u] & adjlist[v]]
+                pairs.sort(key=lambda pair: (-pair[0], pair[1], pair[2]))
+                expected = np.arange(graph.vcount())
+                for position in reference_greedy([u for _, u, _ in pairs], [v for _, _, v in pairs], graph.vcount()):
+                    expected[pairs[position][1]] = pairs[position][2]
+                    expected[pairs[position][2]] = pairs[position][1]
+                matching = np.arange(graph.vcount())
+                merges = graph.greed_two_hops(vertices, 0.5, matching)
+                np.testing.assert_array_equal(matching, expected)
+                self.assertEqual(merges, (matching != np.arange(graph.vcount())).sum() // 2)
+
+    def test_seeded_random_matching_is_reproducible(self):
+        graph = random_graph(users=40, items=60, rates=400, seed=0)
+        graph['similarity'] = getattr(Similarity(graph, graph['adjlist']), 'common_neighbors')
+        for layer in range(graph['layers']):
+            vertices = np.flatnonzero(np.asarray(graph.vs['type']) == layer)
+            matchings = []
+            for seed in (7, 7, 8):
+                matching = np.arange(graph.vcount())
+                merges = graph.greed_rand_two_hops(vertices, 0.5, matching, seed=seed)
+                self.assertValidMatching(graph, vertices, matching, merges)
+                self.assertLessEqual(merges, int(0.5 * graph.vcount()))
+                matchings.append(matching)
+            np.testing.assert_array_equal(matchings[0], matchings[1])
+            self.assertFalse((matchings[0] == matchings[2]).all())
+
+    def test_handshake_matching_is_valid(self):
+        graph = random_graph(users=40, items=60, rates=400, seed=1)
+        graph['similarity'] = getattr(Similarity(graph, graph['adjlist']), 'common_neighbors')
+        for layer in range(graph['layers']):
+            vertices = np.flatnonzero(np.asarray(graph.vs['type']) == layer)
+            expected = None
+            for workers, chunk_size, reduction_factor in ((1, None, 0.5), (2, 3, 0.5), (3, 1, 0.5), (2, 4, 0.05)):
+                matching = np.arange(graph.vcount())
+                merges, times = graph.greed_parallel_two_hops(vertices, reduction_factor, matching, workers=workers, chunk_size=chunk_size)
+                self.assertValidMatching(graph, vertices, matching, merges)
+                self.assertLessEqual(merges, int(reduction_factor * graph.vcount()))
+                # The rounds do not depend on the workers or the chunks.
+                if reduction_factor == 0.5:
+                    if expected is None:
+                        expected = matching
+                    np.testing.assert_array_equal(matching, expected)
+
+    def test_best_candidates_match_the_sorted_rows(self):
+        generator = np.random.RandomState(1)
+        for trial in range(200):
+            counts = generator.randint(0, 12, size=generator.randint(1, 6))
+            indptr = np.concatenate(([0], np.cumsum(counts)))
+            cols = np.concatenate([generator.permutation(20)[:count] for count in counts])
+            scores = generator.randint(4, size=len(cols)).astype(float)
+            limits = generator.randint(1, 8, size=len(counts))
+            reverse = bool(trial % 2)
+            keep = best_candidates(indptr, cols, scores, limits, reverse)
+            for row in range(len(counts)):
+                entries = range(indptr[row], indptr[row + 1])
+                ranked = sorted(entries, key=lambda entry: (-scores[entry] if reverse else scores[entry], cols[entry]))
+                self.assertEqual(sorted(np.flatnonzero(keep[indptr[row]:indptr[row + 1]]) + indptr[row]), sorted(ranked[:limits[row]]))
+
+    def test_pruned_candidates_give_the_same_matching(self):
+        for seed in range(3):
+            graph = random_graph(users=40, items=60, rates=400, seed=seed)
+            graph['similarity'] = getattr(Similarity(graph, graph['adjlist']), 'jaccard_index' if seed else 'common_neighbors')
+            for layer in range(graph['layers']):
+                vertices = [vertex for vertex in range(graph.vcount()) if graph.vs[vertex]['type'] == layer]
+                for merge_count, reverse in ((graph.vcount(), True), (5, True), (graph.vcount(), False)):
+                    expected = np.arange(graph.vcount())
+                    merges = graph.get_greed_two_hops(vertices, merge_count, expected, reverse=reverse)
+                    for max_candidates in (1, 2, 5):
+                        matching = np.arange(graph.vcount())
+                        self.assertEqual(graph.get_greed_two_hops(vertices, merge_count, matching, reverse=reverse, max_candidates=max_candidates), merges)
+                        np.testing.assert_array_equal(matching, expected)
+
+
+class CoarseningTest(unittest.TestCase):
+
+    def assertCoarseningEqual(self, graph, coarse, matching):
+        successor, types, weights, edges = reference_coarsening(graph, matching)
+        self.assertEqual(coarse.vcount(), len(types))
+        self.assertEqual(coarse.vs['type'], types)
+        self.assertEqual(coarse.vs['weight'], weights)
+        self.assertEqual(coarse['vertices'], [types.count(layer) for layer in range(graph['layers'])])
+        self.assertEqual(coarse['level'], graph['level'] + 1)
+        coarse_edges = dict(zip(coarse.get_edgelist(), coarse.es['weight']))
+        self.assertEqual(sorted(coarse_edges), sorted(edges))
+        for edge, weight in edges.items():
+            self.assertAlmostEqual(coarse_edges[edge], weight)
+            self.assertAlmostEqual(coarse.weight_matrix()[edge], weight)
+        self.assertEqual(coarse['adjlist'], map(set, coarse.get_adjlist()))
+
+    def test_matches_the_reference_coarsening(self):
+        for seed in range(3):
+            graph = random_graph(seed=seed)
+            matching = random_matching(graph, seed)
+            self.assertCoarseningEqual(graph, graph.coarsening(matching), matching)
+
+    def test_hierarchy_maps_the_original_vertices(self):
+        graph = random_graph(seed=3)
+        coarse = graph
+        membership = np.arange(graph.vcount())
+        for level in range(3):
+            matching = random_matching(coarse, level)
+            successor = reference_coarsening(coarse, matching)[0]
+            finer, coarse = coarse, coarse.coarsening(matching)
+            self.assertCoarseningEqual(finer, coarse, matching)
+            membership = np.array([successor[vertex] for vertex in membership])
+            np.testing.assert_array_equal(coarse['hierarchy'].membership, membership)
+            np.testing.assert_array_equal(coarse.super_vertices(graph.vcount()), membership)
+            sizes = coarse['hierarchy'].sizes()
+            np.testing.assert_array_equal(sizes, np.bincount(membership, minlength=coarse.vcount()))
+            for vertex in range(coarse.vcount()):
+                np.testing.assert_array_equal(coarse['hierarchy'].members(vertex), np.flatnonzero(membership == vertex))
+            self.assertEqual(coarse.vs['weight'], sizes.tolist())
+
+    def test_indexes_follow_the_weights(self):
+        graph = random_graph(seed=2)
+        coarse = graph.coarsening(random_matching(graph, 2))
+        for target in (graph, coarse):
+            target.weight_matrix()
+            target.es['weight'] = (2 * np.asarray(target.es['weight'])).tolist()
+            target.invalidate()
+            weight = target.weight_matrix()
+            np.testing.assert_allclose([weight[u, v] for u, v in target.get_edgelist()], target.es['weight'])
+
+    def test_identity_matching_keeps_the_graph(self):
+        graph = random_graph(seed=4)
+        coarse = graph.coarsening(np.arange(graph.vcount()))
+        self.assertEqual(sorted(zip(coarse.get_edgelist(), coarse.es['weight'])), sorted(zip(graph.get_edgelist(), graph.es['weight'])))
+
+
+class ProjectionTest(unittest.TestCase):
+
+    # Projected score of a pair of the original graph: the super edge weight or the score between its
+    # supervertices, divided by the number of pairs between the members of the supervertices.
+    def reference_scores(self, graph, coarse, scores):
+        membership = coarse['hierarchy'].membership.tolist()
+        sizes = coarse['hierarchy'].sizes().tolist()
+        types = coarse.vs['type']
+        super_users = [vertex for vertex in range(coarse.vcount()) if types[vertex] == 0]
+        super_items = [vertex for vertex in range(coarse.vcount()) if types[vertex] != 0]
+        super_edges = dict(zip(coarse.get_edgelist(), coarse.es['weight']))
+        reference = {}
+        for user, item in product(range(graph.vcount()), repeat=2):
+            if graph.vs[user]['type'] != 0 or graph.vs[item]['type'] == 0:
+                continue
+            super_user, super_item = membership[user], membership[item]
+            weight = super_edges.get((min(super_user, super_item), max(super_user, super_item)))
+            if weight is None:
+                weight = scores[super_users.index(super_user), super_items.index(super_item)]
+            reference[(user, item)] = weight / float(sizes[super_user] * sizes[super_item])
+        return reference
+
+    def test_matches_the_reference_projection(self):
+        graph = random_graph(seed=5)
+        coarse = graph
+        for level in range(2):
+            coarse = coarse.coarsening(random_matching(coarse, level))
+            vertices = coarse['vertices']
+            scores = np.random.RandomState(level).rand(vertices[0], vertices[1])
+            reference = self.reference_scores(graph, coarse, scores)
+            projected = {}
+            for users, items, block, block_scores, observed in coarse.projection(graph, scores, block_size=4):
+                for row, col in product(range(len(block)), range(len(items))):
+                    pair = (users[block[row]], items[col])
+                    projected[pair] = block_scores[row, col]
+                    self.assertEqual(observed[row, col], graph.are_connected(*pair))
+            self.assertEqual(sorted(projected), sorted(reference))
+            for pair, value in reference.items():
+                self.assertAlmostEqual(projected[pair], value)
+            pairs = sorted(reference)[::5]
+            # The pairs may be given from the item to the user.
+            pairs = [pair if position % 2 else pair[::-1] for position, pair in enumerate(pairs)]
+            for pair, value in coarse.projection_pairs(graph, scores, pairs).items():
+                self.assertAlmostEqual(value, reference[tuple(sorted(pair, key=lambda vertex: graph.vs[vertex]['type']))])
+
+
+if __name__ == '__main__':
+    unittest.main()
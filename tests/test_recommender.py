@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from measures.similarity import Similarity
+from lp.collaborative_filtering import collaborative_filtering_matrix
+from lp.recommender import Recommender
+from tests.graphs import random_graph
+from tests.test_pmh import random_matching
+
+
+class RecommenderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = random_graph(users=20, items=30, rates=150, seed=0)
+        self.users = np.flatnonzero(np.asarray(self.graph.vs['type']) == 0)
+
+    def test_top_n_skips_the_rated_items(self):
+        model = Recommender(self.graph)
+        users, items, scores = collaborative_filtering_matrix(Similarity(self.graph, self.graph['adjlist']), 'common_neighbors')
+        for row, user in enumerate(users):
+            rated = self.graph['adjlist'][user]
+            ranking = model.recommend(user, n=len(items))
+            self.assertEqual(sorted(item for item, _ in ranking), sorted(set(items) - rated))
+            expected = dict(zip(items, scores[row]))
+            np.testing.assert_allclose([score for _, score in ranking], [expected[item] for item, _ in ranking])
+            # From the greatest score, ties by the item id.
+            self.assertEqual(ranking, sorted(ranking, key=lambda pair: (-pair[1], pair[0])))
+            self.assertEqual(model.recommend(user, n=3), ranking[:3])
+
+    def test_coarsened_model_answers_the_users_of_the_original_graph(self):
+        coarse = self.graph.coarsening(random_matching(self.graph, 0))
+        model = Recommender(coarse, fine=self.graph)
+        for user in self.users:
+            ranking = model.recommend(user, n=5)
+            self.assertEqual(len(ranking), 5)
+            self.assertFalse(set(item for item, _ in ranking) & self.graph['adjlist'][user])
+        self.assertRaises(ValueError, model.recommend, self.graph.vcount() - 1)
+
+    def test_cache_keeps_the_most_recently_used_queries(self):
+        model = Recommender(self.graph, cache_size=2)
+        computed = []
+        compute = model.compute
+        model.compute = lambda users, n: computed.extend(users) or compute(users, n)
+        first, second, third = self.users[:3]
+        model.recommend(first)
+        model.recommend(second)
+        model.recommend(first)
+        model.recommend(third)
+        self.assertEqual(computed, [first, second, third])
+        self.assertEqual(model.cache.keys(), [(first, 10), (third, 10)])
+        model.recommend(second)
+        self.assertEqual(computed, [first, second, third, second])
+        self.assertEqual(model.cache.keys(), [(third, 10), (second, 10)])
+
+    def test_saved_model_gives_the_same_results(self):
+        model = Recommender(self.graph)
+        expected = model.recommend_many(self.users, 5)
+        descriptor, path = tempfile.mkstemp()
+        os.close(descriptor)
+        try:
+            model.save(path)
+            loaded = Recommender.load(path)
+        finally:
+            os.remove(path)
+        self.assertEqual(len(loaded.cache), 0)
+        self.assertEqual(loaded.recommend_many(self.users, 5), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
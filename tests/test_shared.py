@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+
+import numpy as np
+
+from measures.similarity import Similarity
+from pmhgraph.fold import FoldView, prepare
+from pmhgraph.shared import SharedGraph, share, release
+from tests.graphs import random_graph
+
+
+class SharedGraphTest(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = prepare(random_graph(users=30, items=40, rates=300, seed=0))
+        self.view = FoldView(self.graph, self.graph.get_edgelist()[::5])
+        self.descriptors = []
+
+    def tearDown(self):
+        for descriptor in self.descriptors:
+            release(descriptor)
+
+    # Shared graph attached to the arrays of a graph or of a view.
+    def shared(self, graph):
+        self.descriptors.append(share(graph))
+        return SharedGraph(self.descriptors[-1])
+
+    def test_arrays_match_the_graph(self):
+        for graph in (self.graph, self.view):
+            shared = self.shared(graph)
+            self.assertEqual(shared.ecount(), graph.ecount())
+            np.testing.assert_array_equal(shared.degrees(), graph.degrees())
+            np.testing.assert_array_equal(shared.weight_matrix().toarray(), graph.weight_matrix().toarray())
+            self.assertEqual(list(shared['adjlist']), list(graph['adjlist']))
+            pairs = np.array([(0, 1), (0, 35), (35, 0), (5, 50)])
+            np.testing.assert_array_equal(shared.edge_positions(pairs[:, 0], pairs[:, 1]) >= 0, [graph.weight_matrix()[u, v] != 0 for u, v in pairs])
+
+    def test_matching_and_coarsening_match_the_graph(self):
+        for graph in (self.graph, self.view):
+            shared = self.shared(graph)
+            for target in (graph, shared):
+                target['similarity'] = getattr(Similarity(target, target['adjlist']), 'common_neighbors')
+            for layer in range(graph['layers']):
+                vertices = np.flatnonzero(np.asarray(graph.vs['type']) == layer)
+                matching, expected = np.arange(graph.vcount()), np.arange(graph.vcount())
+                self.assertEqual(shared.greed_two_hops(vertices, 0.5, matching, 3), graph.greed_two_hops(vertices, 0.5, expected, 3))
+                np.testing.assert_array_equal(matching, expected)
+            coarse, expected = shared.coarsening(matching), graph.coarsening(matching)
+            self.assertEqual(coarse.get_edgelist(), expected.get_edgelist())
+            np.testing.assert_allclose(coarse.es['weight'], expected.es['weight'])
+            self.assertEqual(coarse.vs['weight'], expected.vs['weight'])
+            np.testing.assert_array_equal(coarse['hierarchy'].membership, expected['hierarchy'].membership)
+
+    def test_attributes_do_not_change_the_descriptor(self):
+        shared = self.shared(self.graph)
+        shared['similarity'] = None
+        self.assertNotIn('similarity', self.descriptors[-1]['attributes'])
+        self.assertNotIn('similarity', SharedGraph(self.descriptors[-1]).attributes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+from itertools import product
+
+import math
+
+import numpy as np
+
+from measures.similarity import Similarity
+from pmhgraph.pmh import PMHGraph
+from tests.graphs import random_graph
+
+
+# Graph of the tests with a random community of each vertex, used by the within indices.
+def community_graph(seed):
+    graph = random_graph(seed=seed)
+    graph.vs['membership'] = np.random.RandomState(seed).randint(3, size=graph.vcount()).tolist()
+    return graph
+
+
+class SimilarityTest(unittest.TestCase):
+
+    def test_score_pairs_matches_the_scalar_indices(self):
+        for seed in range(2):
+            graph = community_graph(seed)
+            similarity = Similarity(graph, graph['adjlist'])
+            pairs = list(product(range(graph.vcount()), repeat=2))
+            rows, cols = np.array(pairs).T
+            for index in Similarity.INDICES:
+                expected = [getattr(similarity, index)(i, j) for i, j in pairs]
+                np.testing.assert_allclose(similarity.score_pairs(index, rows, cols, block_size=97), expected, rtol=1e-9, atol=1e-12, err_msg=index)
+
+    def test_matrix_matches_the_scalar_indices(self):
+        graph = community_graph(2)
+        similarity = Similarity(graph, graph['adjlist'])
+        types = np.asarray(graph.vs['type'])
+        for layer in range(graph['layers']):
+            vertices = np.flatnonzero(types == layer)
+            block = vertices[::2]
+            for index in Similarity.INDICES:
+                matrix = similarity.matrix(index, layer, block)
+                matrix = matrix.toarray() if hasattr(matrix, 'toarray') else matrix
+                expected = [[getattr(similarity, index)(i, j) for j in vertices] for i in block]
+                np.testing.assert_allclose(matrix, expected, rtol=1e-9, atol=1e-12, err_msg=index)
+
+    def test_score_cross_pairs_sums_the_index_over_the_neighbors(self):
+        graph = community_graph(3)
+        similarity = Similarity(graph, graph['adjlist'])
+        types = np.asarray(graph.vs['type'])
+        pairs = [(user, item) for user in np.flatnonzero(types == 0) for item in np.flatnonzero(types != 0)]
+        # The pairs may be given from the item to the user.
+        pairs += [pair[::-1] for pair in pairs[::3]]
+        rows, cols = np.array(pairs).T
+        for index in Similarity.INDICES:
+            score = getattr(similarity, index)
+            if index == 'preferential_attachment':
+                expected = [score(i, j) for i, j in pairs]
+            else:
+                expected = [sum(score(i, k) for k in graph['adjlist'][j] if k != i) for i, j in pairs]
+            for block_size in (13, None):
+                np.testing.assert_allclose(similarity.score_cross_pairs(index, rows, cols, block_size), expected, rtol=1e-9, atol=1e-12, err_msg=index)
+        # The transposed adjacency of each layer is built once.
+        self.assertIs(similarity.layer_adjacency(0)[1], similarity.layer_adjacency(0)[1])
+
+    def test_scalar_indices_match_the_definitions(self):
+        # The vertices 0 and 1 have the common neighbors 2 (degree 2) and 3 (degree 3), and only 3 is in
+        # the cluster of 0.
+        graph = PMHGraph(6, [(0, 2), (1, 2), (0, 3), (1, 3), (5, 3)])
+        graph.vs['membership'] = [0, 0, 1, 0, 1, 1]
+        similarity = Similarity(graph, map(set, graph.get_adjlist()))
+        self.assertAlmostEqual(similarity.resource_allocation(0, 1), 1.0 / 2 + 1.0 / 3)
+        self.assertAlmostEqual(similarity.adamic_adar(0, 1), 1 / math.log(2) + 1 / math.log(3))
+        self.assertAlmostEqual(similarity.within_common_neighbors(0, 1), 1.0)
+        self.assertAlmostEqual(similarity.within_resource_allocation(0, 1), 1.0 / 3)
+        self.assertAlmostEqual(similarity.within_adamic_adar(0, 1), 1 / math.log(3))
+
+    def test_unknown_index_is_rejected(self):
+        graph = random_graph(seed=3)
+        similarity = Similarity(graph, graph['adjlist'])
+        self.assertRaises(ValueError, similarity.score_pairs, 'katz', [0], [1])
+        self.assertRaises(ValueError, similarity.matrix, 'katz', 0)
+        self.assertRaises(ValueError, similarity.score_cross_pairs, 'katz', [0], [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
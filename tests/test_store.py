@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from main import coarse_graph
+from pmhgraph.fold import prepare
+from pmhgraph.store import hierarchy_key, load_hierarchy, save_level, evict
+from tests.graphs import random_graph
+
+
+class HierarchyStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.store, ignore_errors=True)
+
+    def test_levels_are_loaded_up_to_the_first_missing_one(self):
+        levels = [(np.arange(10)[::-1], [(0, 3, 1.0), (1, 2, 0.5)]), (np.arange(5), [])]
+        for level, (matching, merges) in enumerate(levels):
+            save_level(self.store, 'key', level + 1, matching, merges)
+        save_level(self.store, 'key', 4, np.arange(3), [])
+        loaded = load_hierarchy(self.store, 'key')
+        self.assertEqual(len(loaded), 2)
+        for (matching, merges), (expected_matching, expected_merges) in zip(loaded, levels):
+            np.testing.assert_array_equal(matching, expected_matching)
+            self.assertEqual(merges, [tuple(merge) for merge in np.asarray(expected_merges, dtype=np.int64).reshape(-1, 3).tolist()])
+        self.assertEqual(load_hierarchy(self.store, 'missing'), [])
+
+    def test_evicts_the_least_recently_used_hierarchies(self):
+        for age, key in enumerate(['new', 'old', 'used']):
+            save_level(self.store, key, 1, np.arange(1000), [])
+            os.utime(os.path.join(self.store, key), (1000 - 100 * age, 1000 - 100 * age))
+        # Loading a hierarchy makes it the most recently used.
+        load_hierarchy(self.store, 'used')
+        size = sum(os.path.getsize(os.path.join(self.store, 'new', name)) for name in os.listdir(os.path.join(self.store, 'new')))
+        evict(self.store, 2 * size)
+        self.assertEqual(sorted(os.listdir(self.store)), ['new', 'used'])
+        evict(self.store, 0)
+        self.assertEqual(os.listdir(self.store), [])
+
+    def test_stored_hierarchy_rebuilds_the_same_levels(self):
+        graph = prepare(random_graph(users=30, items=40, rates=300, seed=0))
+        built, rebuilt = [], []
+        coarse_graph(graph, 'common_neighbors', 2, 0, [0.5, 0.5], [0, 1], in_process=True, store=self.store, levels=built)
+        key = hierarchy_key(graph, 'common_neighbors', 0, [0.5, 0.5], [0, 1], 10, None)
+        self.assertEqual(len(load_hierarchy(self.store, key)), 2)
+        coarse_graph(graph, 'common_neighbors', 2, 0, [0.5, 0.5], [0, 1], in_process=True, store=self.store, levels=rebuilt)
+        for expected, coarse in zip(built, rebuilt):
+            self.assertEqual(coarse.get_edgelist(), expected.get_edgelist())
+            self.assertEqual(coarse.es['weight'], expected.es['weight'])
+            np.testing.assert_array_equal(coarse['hierarchy'].membership, expected['hierarchy'].membership)
+            self.assertEqual(coarse['merges'], expected['merges'])
+
+
+if __name__ == '__main__':
+    unittest.main()